@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from batching import MicroBatchScheduler, SchedulerBusy
+from factors import factor_catalogue, materialize_prediction, materialize_predictions
+from predict import get_model_bundle, get_population, predict_health_risks_batch, annotate_percentiles
+from result_cache import cache_from_env, canonical_key
+from schema import QUESTIONNAIRE
+from serialization import dumps, negotiate, JSON_MIMETYPE
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, observe_request, record_error, render
+
+# ASGI entry point for the model API, with the same routes as the Flask app in model_api.py
+# Run it with an ASGI server, e.g. `uvicorn asgi:app --workers 1` from this directory
+# Inference runs in a bounded thread pool so one worker keeps a single copy of
+# the models, and concurrent /api/predict requests are coalesced into one
+# batch by the scheduler in batching.py
+
+# Threads running batch requests; sklearn's tree traversal releases the GIL
+ASGI_EXECUTOR_WORKERS = int(os.environ.get('ASGI_EXECUTOR_WORKERS', os.cpu_count() or 1))
+
+# Requests waiting for inference before new ones are turned away with a 503
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', 1024))
+
+# Batch requests queued or running on the executor before new ones get a 503
+ASGI_MAX_PENDING_BATCHES = int(os.environ.get('ASGI_MAX_PENDING_BATCHES', 4 * ASGI_EXECUTOR_WORKERS))
+
+# Results of repeated submissions are served from the cache until the bundle changes
+result_cache = cache_from_env()
+
+executor = ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_WORKERS, thread_name_prefix='inference')
+
+# Shares the scheduler configuration (BATCH_WINDOW_MS, BATCH_MAX_SIZE) of the Flask app
+scheduler = MicroBatchScheduler(
+    lambda users: predict_health_risks_batch(users, factor_ids=True), max_pending=ASGI_MAX_PENDING
+)
+
+# Batch requests on the executor, only changed from the event loop
+_pending_batches = 0
+
+# HTTP plumbing
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def _respond(send, obj, status=200, mimetype=JSON_MIMETYPE):
+    # Handlers return bytes for bodies that are not JSON or msgpack, like /metrics
+    if isinstance(obj, bytes):
+        body, mimetype = obj, METRICS_CONTENT_TYPE
+    else:
+        body = dumps(obj, mimetype)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', mimetype.encode('latin-1')), (b'content-length', str(len(body)).encode('latin-1'))]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+def _wants_factor_ids(scope):
+    # Clients that cache the factor catalogue ask for IDs with ?factors=ids
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('factors', [None])[0] == 'ids'
+
+# Routes
+async def api_predict(scope, body, headers):
+    user_data, errors = QUESTIONNAIRE.decode(body, headers.get('content-type'))
+    if errors:
+        return {'error': 'Invalid input', 'errors': errors}, 400
+
+    # Reuse the result of an identical submission
+    version = get_model_bundle()['version']
+    key = canonical_key(user_data) if result_cache.maxsize > 0 else None
+    predictions = result_cache.get(key, version) if key else None
+
+    if predictions is None:
+        try:
+            predictions = await asyncio.wrap_future(scheduler.submit(user_data))
+        except SchedulerBusy:
+            return {'error': 'Server busy, retry later'}, 503
+        except Exception as e:
+            # Invalid input is reported above, so anything raised here is a server error
+            record_error('/api/predict', e)
+            return {'error': str(e)}, 500
+        if key:
+            result_cache.put(key, version, predictions)
+
+    # Rank each score among the stored submissions
+    predictions = annotate_percentiles([predictions], [user_data])[0]
+
+    # Attach the factor text unless the client resolves IDs from /api/factors
+    if not _wants_factor_ids(scope):
+        predictions = materialize_prediction(predictions)
+    return predictions, 200
+
+async def api_predict_batch(scope, body, headers):
+    # Accept either a list of users or {"users": [...]}
+    users, errors = QUESTIONNAIRE.decode_many(body, headers.get('content-type'))
+    if errors:
+        return {'error': 'Invalid input', 'errors': errors}, 400
+
+    # A batch request is already one matrix, so it skips the scheduler, but
+    # the executor's queue is unbounded so the batches waiting on it are capped
+    global _pending_batches
+    if _pending_batches >= ASGI_MAX_PENDING_BATCHES:
+        return {'error': 'Server busy, retry later'}, 503
+    _pending_batches += 1
+    try:
+        predictions = await asyncio.get_running_loop().run_in_executor(
+            executor, lambda: predict_health_risks_batch(users, factor_ids=True)
+        )
+    except Exception as e:
+        record_error('/api/predict/batch', e)
+        return {'error': str(e)}, 500
+    finally:
+        _pending_batches -= 1
+
+    predictions = annotate_percentiles(predictions, users)
+    if not _wants_factor_ids(scope):
+        predictions = materialize_predictions(predictions)
+    return {'predictions': predictions}, 200
+
+async def index(scope, body, headers):
+    return {
+        'service': 'Vital Scopeion API',
+        'status': 'active',
+        'endpoints': {
+            '/api/predict': 'POST - Submit lifestyle data for health prediction',
+            '/api/predict/batch': 'POST - Submit a list of users for health prediction',
+            '/api/factors': 'GET - Recommendation factor catalogue, for ?factors=ids responses',
+            '/api/cache': 'GET - Prediction cache statistics',
+            '/api/batching': 'GET - Request batching statistics',
+            '/metrics': 'GET - Latency and error metrics in the Prometheus text format'
+        }
+    }, 200
+
+async def api_factors(scope, body, headers):
+    return {'factors': factor_catalogue()}, 200
+
+async def api_cache_stats(scope, body, headers):
+    return result_cache.stats(), 200
+
+async def api_batching_stats(scope, body, headers):
+    return scheduler.stats(), 200
+
+async def api_metrics(scope, body, headers):
+    return render().encode('utf-8'), 200
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('POST', '/api/predict'): api_predict,
+    ('POST', '/api/predict/batch'): api_predict_batch,
+    ('GET', '/api/factors'): api_factors,
+    ('GET', '/api/cache'): api_cache_stats,
+    ('GET', '/api/batching'): api_batching_stats,
+    ('GET', '/metrics'): api_metrics
+}
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Load the model bundle and the population sketches before accepting
+            # requests, so the routes never read them from disk on the event loop
+            await asyncio.get_running_loop().run_in_executor(executor, get_model_bundle)
+            await asyncio.get_running_loop().run_in_executor(executor, get_population)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """
+    ASGI application
+    """
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    headers = _headers(scope)
+    mimetype = negotiate(headers.get('accept'))
+    path = scope['path'].rstrip('/') or '/'
+    handler = ROUTES.get((scope['method'], path))
+    if handler is None:
+        if any(route_path == path for _, route_path in ROUTES):
+            return await _respond(send, {'error': 'Method not allowed'}, 405, mimetype)
+        return await _respond(send, {'error': 'Not found'}, 404, mimetype)
+
+    body = await _read_body(receive)
+    start = time.perf_counter()
+    try:
+        result, status = await handler(scope, body, headers)
+    except Exception as e:
+        record_error(path, e)
+        result, status = {'error': str(e)}, 500
+    await _respond(send, result, status, mimetype)
+    observe_request(path, status, time.perf_counter() - start)
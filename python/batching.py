@@ -0,0 +1,184 @@
+import os
+import time
+import queue
+import bisect
+import threading
+from concurrent.futures import Future
+
+# Request coalescing for the model API
+# Each predict_proba call on a one-row matrix is dominated by sklearn's per-call
+# overhead, so concurrent requests are collected for a short window and scored
+# as one matrix, then each request gets its own row of the result back
+
+# How long a batch waits for more requests, and the most rows it holds
+BATCH_WINDOW_MS = float(os.environ.get('BATCH_WINDOW_MS', 2))
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 64))
+
+# Threads dispatching batches; more than one lets batches overlap
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 1))
+
+# Bucket upper bounds of the batch size and queue delay (ms) histograms
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+QUEUE_DELAY_BUCKETS_MS = [0.1, 0.5, 1, 2, 5, 10, 25, 50, 100]
+
+class SchedulerBusy(RuntimeError):
+    """
+    Raised when the scheduler already holds max_pending requests
+    """
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        labels = [f"le_{bound}" for bound in self.buckets] + ['inf']
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+class MicroBatchScheduler:
+    """
+    Coalesces concurrent predictions into batches scored by predict_batch(items)
+    A batch is dispatched when it holds max_batch_size items or window_ms after its
+    first item arrived; an item submitted while nothing else is in flight is
+    dispatched at once, so an idle service pays no batching delay
+    """
+    def __init__(self, predict_batch, window_ms=BATCH_WINDOW_MS, max_batch_size=BATCH_MAX_SIZE,
+                 workers=BATCH_WORKERS, max_pending=None):
+        self.predict_batch = predict_batch
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._pid = None
+
+        # Metrics
+        self.batch_sizes = _Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delays = _Histogram(QUEUE_DELAY_BUCKETS_MS)
+        self.batches = 0
+        self.items = 0
+        # Items that failed, after retrying the items of a failed batch one by one
+        self.errors = 0
+
+    def _ensure_started(self):
+        # Dispatcher threads are started on first use, and again in forked
+        # workers, which do not inherit the threads of their parent
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f'batch-dispatcher-{i}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, item):
+        """
+        Queue one item, returning a concurrent.futures.Future of its result
+        """
+        self._ensure_started()
+        with self._lock:
+            if self.max_pending is not None and self._in_flight >= self.max_pending:
+                raise SchedulerBusy("Too many pending requests")
+            self._in_flight += 1
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item):
+        """
+        Score one item as part of the next batch, blocking until it is done
+        """
+        return self.submit(item).result()
+
+    def _collect(self):
+        # Block for the first item, then gather more until the window closes
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.window
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # Nobody else is waiting, so there is nothing to wait for
+            if self._in_flight <= len(batch):
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _score(self, items):
+        # Score a batch, returning a (result, error) pair per item
+        try:
+            results = self.predict_batch(items)
+        except Exception as e:
+            if len(items) == 1:
+                return [(None, e)]
+            # One bad item fails the whole batch, so retry each item on its own
+            # and only fail the ones that raise again
+            return [self._score([item])[0] for item in items]
+        if len(results) != len(items):
+            error = RuntimeError(f"predict_batch returned {len(results)} results for {len(items)} items")
+            return [(None, error)] * len(items)
+        return [(result, None) for result in results]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            outcomes = self._score([item for item, _, _ in batch])
+            failed = sum(error is not None for _, error in outcomes)
+
+            with self._lock:
+                self._in_flight -= len(batch)
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes.observe(len(batch))
+                for _, _, enqueued in batch:
+                    self.queue_delays.observe((start - enqueued) * 1000)
+                self.errors += failed
+
+            for (_, future, _), (result, error) in zip(batch, outcomes):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        """
+        Return the batching metrics for monitoring
+        """
+        with self._lock:
+            return {
+                'window_ms': self.window * 1000,
+                'max_batch_size': self.max_batch_size,
+                'in_flight': self._in_flight,
+                'batches': self.batches,
+                'items': self.items,
+                'errors': self.errors,
+                'batch_size': self.batch_sizes.to_dict(),
+                'queue_delay_ms': self.queue_delays.to_dict()
+            }
@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+# Performance benchmarks for the prediction services
+# Run `python benchmarks.py --output results.json` from this directory and
+# compare two runs with `--compare baseline.json` to catch latency regressions
+
+BENCHMARKS = []
+
+def benchmark(name, repeat=20, number=10):
+    """
+    Register a benchmark
+    The decorated function does any setup and returns the callable to time;
+    each of the repeat samples times number calls of it
+    """
+    def register(setup):
+        BENCHMARKS.append({'name': name, 'setup': setup, 'repeat': repeat, 'number': number})
+        return setup
+    return register
+
+def _time(fn, repeat, number):
+    # Warm up once so lazy loading is not measured
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    samples.sort()
+    return {
+        'repeat': repeat,
+        'number': number,
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max': samples[-1],
+        'ops_per_second': 1 / statistics.median(samples)
+    }
+
+# Sample inputs
+def sample_users(n, seed=0):
+    """
+    Build n random questionnaire submissions, as sent by the frontend
+    """
+    from predict import CATEGORICAL_FEATURES, LIST_FEATURES
+    from heuristics import EXERCISE_MAP
+
+    rng = random.Random(seed)
+    users = []
+    for _ in range(n):
+        weight = rng.randint(45, 120)
+        height = rng.randint(150, 200)
+        user = {
+            'age': rng.randint(18, 80),
+            'gender': rng.choice(CATEGORICAL_FEATURES['gender']),
+            'weight': weight,
+            'height': height,
+            'exerciseFrequency': rng.choice(list(EXERCISE_MAP)),
+            'sleepHours': rng.randint(4, 10),
+            'stressLevel': rng.randint(1, 10)
+        }
+        for field, feature in [('sleepQuality', 'sleep_quality'), ('dietType', 'diet_type'),
+                               ('waterIntake', 'water_intake'), ('smokingStatus', 'smoking_status'),
+                               ('alcoholConsumption', 'alcohol_consumption'),
+                               ('anxietyFrequency', 'anxiety_frequency'),
+                               ('depressionFrequency', 'depression_frequency'),
+                               ('socialConnections', 'social_connections'),
+                               ('workLifeBalance', 'work_life_balance'),
+                               ('mindfulnessPractice', 'mindfulness_practice'),
+                               ('bloodPressure', 'blood_pressure'), ('cholesterolLevels', 'cholesterol_levels')]:
+            user[field] = rng.choice(CATEGORICAL_FEATURES[feature])
+        for field, items in LIST_FEATURES.items():
+            user[field] = rng.sample(list(items), rng.randint(0, 3))
+        users.append(user)
+    return users
+
+def model_inputs(n, seed=0):
+    """
+    Build n submissions normalized the way the API passes them to the models
+    """
+    from submissions import normalize_submission
+    return [normalize_submission(user) for user in sample_users(n, seed)]
+
+def _django_client():
+    import django
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(ROOT_URLCONF='django_app.urls', ALLOWED_HOSTS=['*'], DEBUG=False)
+        django.setup()
+    from django.test import Client
+    return Client()
+
+# Model predictions (python/predict.py)
+@benchmark('predict.predict_health_risks.single')
+def bench_predict_single():
+    from predict import predict_health_risks, get_model_bundle
+    bundle = get_model_bundle()
+    user = model_inputs(1)[0]
+    return lambda: predict_health_risks(user, bundle)
+
+@benchmark('predict.predict_health_risks.single.compiled')
+def bench_predict_single_compiled():
+    from predict import predict_health_risks, get_model_bundle, set_inference_backend
+    bundle = set_inference_backend(dict(get_model_bundle()), 'compiled')
+    user = model_inputs(1)[0]
+    return lambda: predict_health_risks(user, bundle)
+
+@benchmark('predict.predict_health_risks_batch.100', repeat=10, number=3)
+def bench_predict_batch_100():
+    from predict import predict_health_risks_batch, get_model_bundle
+    bundle = get_model_bundle()
+    users = model_inputs(100)
+    return lambda: predict_health_risks_batch(users, bundle)
+
+@benchmark('predict.predict_health_risks_batch.100.compiled', repeat=10, number=3)
+def bench_predict_batch_100_compiled():
+    from predict import predict_health_risks_batch, get_model_bundle, set_inference_backend
+    bundle = set_inference_backend(dict(get_model_bundle()), 'compiled')
+    users = model_inputs(100)
+    return lambda: predict_health_risks_batch(users, bundle)
+
+@benchmark('predict.predict_health_risks_batch.100.cascade', repeat=10, number=3)
+def bench_predict_batch_100_cascade():
+    from predict import predict_health_risks_batch, get_model_bundle
+    bundle = dict(get_model_bundle())
+    users = model_inputs(100)
+    return lambda: predict_health_risks_batch(users, bundle, cascade=True)
+
+@benchmark('predict.predict_health_risks_batch.1000', repeat=5, number=1)
+def bench_predict_batch_1000():
+    from predict import predict_health_risks_batch, get_model_bundle
+    bundle = get_model_bundle()
+    users = model_inputs(1000)
+    return lambda: predict_health_risks_batch(users, bundle)
+
+@benchmark('predict.train_models', repeat=3, number=1)
+def bench_train_models():
+    from predict import train_models
+    return lambda: train_models(verbose=False)
+
+@benchmark('batching.MicroBatchScheduler.concurrent.64', repeat=10, number=3)
+def bench_scheduler_concurrent():
+    from concurrent.futures import wait
+    from batching import MicroBatchScheduler
+    from predict import predict_health_risks_batch, get_model_bundle
+    bundle = get_model_bundle()
+    scheduler = MicroBatchScheduler(lambda users: predict_health_risks_batch(users, bundle, factor_ids=True))
+    users = model_inputs(64)
+    return lambda: wait([scheduler.submit(user) for user in users])
+
+# Heuristic engine (python/app.py and python/django_app/views.py)
+@benchmark('app.mock_predict_health_risks.single', repeat=20, number=100)
+def bench_flask_mock_single():
+    from app import mock_predict_health_risks
+    user = sample_users(1)[0]
+    return lambda: mock_predict_health_risks(user)
+
+@benchmark('views.mock_predict_health_risks.single', repeat=20, number=100)
+def bench_django_mock_single():
+    _django_client()
+    from django_app.views import mock_predict_health_risks
+    user = sample_users(1)[0]
+    return lambda: mock_predict_health_risks(user)
+
+@benchmark('heuristics.mock_predict_health_risks_batch.1000', repeat=10, number=1)
+def bench_mock_batch_1000():
+    from heuristics import mock_predict_health_risks_batch
+    users = sample_users(1000)
+    return lambda: mock_predict_health_risks_batch(users)
+
+# Request decoding and validation (python/schema.py)
+@benchmark('schema.QUESTIONNAIRE.decode', repeat=20, number=1000)
+def bench_schema_decode():
+    from schema import QUESTIONNAIRE
+    body = json.dumps(sample_users(1)[0]).encode('utf-8')
+    return lambda: QUESTIONNAIRE.decode(body, 'application/json')
+
+# End-to-end HTTP routes through the framework test clients
+def _use_result_cache(module, enabled):
+    # Route benchmarks score every request with the result cache off; the
+    # .cached variants measure cache hits on an in-memory cache
+    from result_cache import ResultCache
+    module.result_cache = ResultCache() if enabled else ResultCache(maxsize=0)
+
+@benchmark('http.flask.predict./api/predict', repeat=20, number=10)
+def bench_flask_model_route():
+    import model_api
+    model_api.get_model_bundle()
+    _use_result_cache(model_api, False)
+    client = model_api.app.test_client()
+    user = sample_users(1)[0]
+    return lambda: client.post('/api/predict', json=user)
+
+@benchmark('http.flask.predict./api/predict.cached', repeat=20, number=10)
+def bench_flask_model_route_cached():
+    import model_api
+    model_api.get_model_bundle()
+    _use_result_cache(model_api, True)
+    client = model_api.app.test_client()
+    user = sample_users(1)[0]
+    return lambda: client.post('/api/predict', json=user)
+
+@benchmark('http.flask.app./api/predict', repeat=20, number=50)
+def bench_flask_mock_route():
+    import app
+    _use_result_cache(app, False)
+    client = app.app.test_client()
+    user = sample_users(1)[0]
+    return lambda: client.post('/api/predict', json=user)
+
+@benchmark('http.flask.app./api/predict.cached', repeat=20, number=50)
+def bench_flask_mock_route_cached():
+    import app
+    _use_result_cache(app, True)
+    client = app.app.test_client()
+    user = sample_users(1)[0]
+    return lambda: client.post('/api/predict', json=user)
+
+@benchmark('http.django./api/predict/', repeat=20, number=10)
+def bench_django_route():
+    client = _django_client()
+    from django_app import views
+    from model_registry import ModelRegistry
+    from predict import MODEL_BUNDLE_PATH, get_model_bundle, load_model_bundle, save_model_bundle
+    # Without a bundle the view serves the heuristic engine, so time the models
+    # on the bundle the other model benchmarks use
+    if not os.path.exists(MODEL_BUNDLE_PATH):
+        path = save_model_bundle(get_model_bundle(), os.path.join(tempfile.mkdtemp(), 'health_models.joblib'))
+        views.model_registry = ModelRegistry(path, load_model_bundle)
+    if views.model_registry.get() is None:
+        raise RuntimeError(f"The Django view could not load the model bundle: {views.model_registry.last_error}")
+    body = json.dumps(sample_users(1)[0])
+    return lambda: client.post('/api/predict/', data=body, content_type='application/json')
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(pattern=None, quick=False):
+    """
+    Run the registered benchmarks whose name matches pattern
+    Returns the results document saved by --output
+    """
+    import numpy
+    import sklearn
+
+    results = {}
+    for bench in BENCHMARKS:
+        if pattern and not re.search(pattern, bench['name']):
+            continue
+        repeat = max(1, bench['repeat'] // 5) if quick else bench['repeat']
+        fn = bench['setup']()
+        results[bench['name']] = _time(fn, repeat, bench['number'])
+        print(f"{bench['name']:<52} median {results[bench['name']]['median'] * 1e3:10.3f} ms", file=sys.stderr)
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'sklearn': sklearn.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+
+def compare_results(baseline, current, threshold=0.10):
+    """
+    Compare median timings against a baseline run
+    Returns the names of the benchmarks that got slower by more than threshold
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median'] / base['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = '  improved'
+        print(f"{name:<52} {base['median'] * 1e3:10.3f} ms -> {result['median'] * 1e3:10.3f} ms ({ratio:5.2f}x){flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the prediction services')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Slowdown ratio reported as a regression')
+    parser.add_argument('--only', help='Regular expression selecting benchmarks by name')
+    parser.add_argument('--quick', action='store_true', help='Fewer repeats, for a smoke run')
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.only, args.quick)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_results(baseline, current, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
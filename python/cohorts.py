@@ -0,0 +1,465 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock; the lock file is locked with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+from heuristics import mock_predict_health_risks_batch, HEURISTICS_VERSION
+from submissions import DATA_DIR, SETTLE_SECONDS, read_submission, normalize_submission, scan_new_files, chunked
+
+# Population statistics of the stored submissions for the admin pages
+# Running aggregates per cohort (age band, gender, smoking status, ...) are
+# kept in one small JSON file and folded forward with the submission files
+# written since the last update, using the same (mtime, id) watermark as
+# compaction.py (submissions.scan_new_files), so serving them costs O(cohorts)
+# rather than O(submissions).
+# Aggregates are sums and counts, so the partial aggregates of disjoint sets of
+# submissions merge exactly; a full recompute scores chunks of files in parallel
+# and merges them. It is only needed when the risk engine changes or files are
+# deleted, and runs offline (`python cohorts.py recompute`) or, when the endpoint
+# finds no usable aggregates, in a background thread of the serving worker
+
+# Kept beside the compacted store, whose reader ignores files starting with _
+COHORTS_PATH = os.environ.get(
+    'COHORTS_PATH', os.path.join(os.path.dirname(DATA_DIR), 'data-compacted', '_cohorts.json')
+)
+COHORTS_DATA_DIR = os.environ.get('COHORTS_DATA_DIR', DATA_DIR)
+
+# Minimum seconds between two scans of the data directory by the endpoint
+COHORTS_REFRESH_SECONDS = float(os.environ.get('COHORTS_REFRESH_SECONDS', 60))
+
+# Bumped when the aggregates or the engine scoring them change, forcing a recompute
+COHORTS_FORMAT = 1
+ENGINE_VERSION = f'heuristics-{HEURISTICS_VERSION}'
+
+AGE_BANDS = [(30, '18-29'), (40, '30-39'), (50, '40-49'), (60, '50-59'), (70, '60-69')]
+
+def age_band(age):
+    if not isinstance(age, (int, float)) or isinstance(age, bool):
+        return None
+    if age < 18:
+        return 'under-18'
+    for upper, label in AGE_BANDS:
+        if age < upper:
+            return label
+    return '70+'
+
+# Cohort dimensions and how a normalized submission is assigned to one of their values
+COHORT_DIMENSIONS = {
+    'age_band': lambda s: age_band(s.get('age')),
+    'gender': lambda s: s.get('gender'),
+    'smokingStatus': lambda s: s.get('smokingStatus'),
+    'alcoholConsumption': lambda s: s.get('alcoholConsumption'),
+    'exerciseFrequency': lambda s: s.get('exerciseFrequency'),
+    'dietType': lambda s: s.get('dietType'),
+    'bloodPressure': lambda s: s.get('bloodPressure')
+}
+
+# Numeric answers averaged per cohort
+MEAN_FIELDS = ['age', 'weight', 'height', 'bmi', 'sleepHours', 'stressLevel']
+
+# Risk factor counts, as on the ML analysis page
+RISK_FACTORS = {
+    'smoking': lambda s: s.get('smokingStatus') in ('regular', 'occasional'),
+    'alcohol': lambda s: s.get('alcoholConsumption') in ('heavy', 'moderate'),
+    'highBloodPressure': lambda s: s.get('bloodPressure') in ('high-stage1', 'high-stage2'),
+    'highCholesterol': lambda s: s.get('cholesterolLevels') == 'high'
+}
+
+RISKS = ['cardiovascular', 'metabolic', 'sleep', 'mental']
+
+# Risk score buckets of the results page: Low below 25, Moderate below 50, else High
+RISK_LEVELS = ['low', 'moderate', 'high']
+
+def risk_level(score):
+    return 'low' if score < 25 else 'moderate' if score < 50 else 'high'
+
+class CohortAggregate:
+    """
+    Counts and sums over a set of submissions, mergeable with the aggregate of another set
+    """
+    __slots__ = ('count', 'fields', 'risks', 'risk_factors')
+
+    def __init__(self):
+        self.count = 0
+        # field -> [answers, sum, sum of squares]
+        self.fields = {field: [0, 0.0, 0.0] for field in MEAN_FIELDS}
+        # risk -> [sum of scores, low, moderate, high]
+        self.risks = {risk: [0, 0, 0, 0] for risk in RISKS}
+        self.risk_factors = {factor: 0 for factor in RISK_FACTORS}
+
+    def add(self, submission, prediction):
+        self.count += 1
+        for field, moments in self.fields.items():
+            value = submission.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                moments[0] += 1
+                moments[1] += value
+                moments[2] += value * value
+        for risk, totals in self.risks.items():
+            score = prediction[risk]['risk']
+            totals[0] += score
+            totals[1 + RISK_LEVELS.index(risk_level(score))] += 1
+        for factor, rule in RISK_FACTORS.items():
+            if rule(submission):
+                self.risk_factors[factor] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        for field, moments in other.fields.items():
+            own = self.fields[field]
+            for i, value in enumerate(moments):
+                own[i] += value
+        for risk, totals in other.risks.items():
+            own = self.risks[risk]
+            for i, value in enumerate(totals):
+                own[i] += value
+        for factor, count in other.risk_factors.items():
+            self.risk_factors[factor] += count
+        return self
+
+    def state(self):
+        return {'count': self.count, 'fields': self.fields, 'risks': self.risks, 'risk_factors': self.risk_factors}
+
+    @classmethod
+    def from_state(cls, state):
+        aggregate = cls()
+        aggregate.count = state['count']
+        aggregate.fields.update(state['fields'])
+        aggregate.risks.update(state['risks'])
+        aggregate.risk_factors.update(state['risk_factors'])
+        return aggregate
+
+    def summary(self):
+        """
+        Return the statistics of the aggregate for the endpoint
+        """
+        means = {}
+        std = {}
+        for field, (n, total, squares) in self.fields.items():
+            means[field] = total / n if n else None
+            std[field] = max(squares / n - means[field] ** 2, 0.0) ** 0.5 if n else None
+        risks = {}
+        for risk, (total, *levels) in self.risks.items():
+            risks[risk] = {'mean': total / self.count if self.count else None, **dict(zip(RISK_LEVELS, levels))}
+        return {'count': self.count, 'means': means, 'std': std, 'risks': risks, 'riskFactors': dict(self.risk_factors)}
+
+class CohortSet:
+    """
+    The overall aggregate and one aggregate per value of every cohort dimension
+    """
+    def __init__(self):
+        self.overall = CohortAggregate()
+        self.cohorts = {dimension: {} for dimension in COHORT_DIMENSIONS}
+
+    def add(self, submission, prediction):
+        self.overall.add(submission, prediction)
+        for dimension, key in COHORT_DIMENSIONS.items():
+            value = key(submission)
+            value = 'unknown' if value is None or value == '' else str(value)
+            cohort = self.cohorts[dimension].get(value)
+            if cohort is None:
+                cohort = self.cohorts[dimension][value] = CohortAggregate()
+            cohort.add(submission, prediction)
+
+    def merge(self, other):
+        self.overall.merge(other.overall)
+        for dimension, values in other.cohorts.items():
+            for value, aggregate in values.items():
+                own = self.cohorts[dimension].get(value)
+                if own is None:
+                    self.cohorts[dimension][value] = CohortAggregate().merge(aggregate)
+                else:
+                    own.merge(aggregate)
+        return self
+
+    def state(self):
+        return {
+            'overall': self.overall.state(),
+            'cohorts': {dimension: {value: aggregate.state() for value, aggregate in values.items()}
+                        for dimension, values in self.cohorts.items()}
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        cohort_set = cls()
+        cohort_set.overall = CohortAggregate.from_state(state['overall'])
+        for dimension, values in state['cohorts'].items():
+            if dimension in cohort_set.cohorts:
+                cohort_set.cohorts[dimension] = {value: CohortAggregate.from_state(aggregate)
+                                                 for value, aggregate in values.items()}
+        return cohort_set
+
+    def summary(self, dimension=None):
+        dimensions = [dimension] if dimension else list(self.cohorts)
+        return {
+            'overall': self.overall.summary(),
+            'cohorts': {name: {value: aggregate.summary() for value, aggregate in sorted(self.cohorts[name].items())}
+                        for name in dimensions if name in self.cohorts}
+        }
+
+def aggregate_paths(paths, errors=None):
+    """
+    Score the submissions stored at paths and return their CohortSet
+    Unreadable files are skipped and recorded in errors as (path, message) when given
+    """
+    cohort_set = CohortSet()
+    for chunk in chunked(paths, 1000):
+        submissions = []
+        for path in chunk:
+            try:
+                submissions.append(normalize_submission(read_submission(path)))
+            except (OSError, ValueError) as e:
+                if errors is not None:
+                    errors.append((path, str(e)))
+        if not submissions:
+            continue
+        predictions = mock_predict_health_risks_batch(submissions, factor_ids=True)
+        for submission, prediction in zip(submissions, predictions):
+            cohort_set.add(submission, prediction)
+    return cohort_set
+
+def _aggregate_chunk(paths):
+    errors = []
+    return aggregate_paths(paths, errors).state(), errors
+
+class _FileLock:
+    """
+    An exclusive lock on a file, held until the lock is closed
+    Uses flock where available and msvcrt byte-range locking on Windows
+    """
+    def __init__(self, path):
+        self._file = open(path, 'w')
+        self._held = False
+
+    def acquire(self, blocking=True):
+        """
+        Take the lock, returning False when blocking is False and it is held elsewhere
+        """
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+        # msvcrt's blocking mode gives up after 10 seconds, so poll instead
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                self._held = True
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.05)
+
+    def close(self):
+        # Closing the file releases flock; msvcrt locks are released explicitly
+        if self._held:
+            self._held = False
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CohortStore:
+    """
+    Cohort aggregates persisted at path and kept up to date with the submissions in data_dir
+    """
+    def __init__(self, path=COHORTS_PATH, data_dir=COHORTS_DATA_DIR, refresh_seconds=COHORTS_REFRESH_SECONDS):
+        self.path = path
+        self.data_dir = data_dir
+        self.refresh_seconds = refresh_seconds
+        self.cohorts = CohortSet()
+        self.watermark = None
+        self.updated_at = None
+        self._loaded_mtime = None
+        self._last_refresh = None
+        self._rebuild = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Pick up the state written by another process
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._loaded_mtime:
+            return True
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('format') != COHORTS_FORMAT or state.get('engine') != ENGINE_VERSION:
+            return False
+        self.cohorts = CohortSet.from_state(state['cohorts'])
+        self.watermark = state['watermark']
+        self.updated_at = state['updated_at']
+        self._loaded_mtime = mtime
+        return True
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        state = {
+            'format': COHORTS_FORMAT,
+            'engine': ENGINE_VERSION,
+            'updated_at': self.updated_at,
+            'watermark': self.watermark,
+            'cohorts': self.cohorts.state()
+        }
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(self.path + '.tmp', self.path)
+        self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+    def _locked(self, blocking=True):
+        # Serializes updates between the worker processes (and threads) sharing the file
+        # Returns None when blocking is False and another update holds the lock
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock = _FileLock(self.path + '.lock')
+        if not lock.acquire(blocking):
+            lock.close()
+            return None
+        return lock
+
+    def update(self, settle_seconds=SETTLE_SECONDS, workers=None, rebuild=True, blocking=True):
+        """
+        Fold the submissions written since the last update into the aggregates
+        Falls back to a full recompute when there is no usable state on disk, unless rebuild is False
+        Returns the number of submissions added, or None when there is no usable state
+        and rebuild is False or when blocking is False and another update is running
+        """
+        lock = self._locked(blocking)
+        if lock is None:
+            return None
+        with lock:
+            with self._lock:
+                loaded = self._load()
+            if not loaded:
+                return self._recompute(settle_seconds, workers) if rebuild else None
+            new_files = scan_new_files(self.data_dir, self.watermark, settle_seconds)
+            if not new_files:
+                return 0
+            errors = []
+            cohorts = aggregate_paths([path for _, _, path in new_files], errors)
+            with self._lock:
+                self.cohorts.merge(cohorts)
+                self._advance(new_files)
+                self._save()
+            return len(new_files) - len(errors)
+
+    def recompute(self, settle_seconds=SETTLE_SECONDS, workers=None):
+        """
+        Rebuild the aggregates from every submission file, scoring chunks in parallel
+        Returns the number of submissions aggregated
+        """
+        with self._locked():
+            return self._recompute(settle_seconds, workers)
+
+    def _recompute(self, settle_seconds, workers):
+        files = scan_new_files(self.data_dir, None, settle_seconds)
+        paths = [path for _, _, path in files]
+        workers = workers or os.cpu_count() or 1
+        chunk_size = max(1000, -(-len(paths) // (workers * 4)))
+
+        # The previous aggregates keep being served until the new ones are complete
+        cohorts = CohortSet()
+        errors = []
+        if workers == 1 or len(paths) <= chunk_size:
+            cohorts = aggregate_paths(paths, errors)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for state, chunk_errors in executor.map(_aggregate_chunk, chunked(paths, chunk_size)):
+                    cohorts.merge(CohortSet.from_state(state))
+                    errors.extend(chunk_errors)
+
+        with self._lock:
+            self.cohorts = cohorts
+            self.watermark = None
+            self._advance(files)
+            self._save()
+        return len(paths) - len(errors)
+
+    def _advance(self, new_files):
+        if new_files:
+            last_mtime = new_files[-1][0]
+            ids = {submission_id for mtime_ns, submission_id, _ in new_files if mtime_ns == last_mtime}
+            if self.watermark and self.watermark.get('mtime_ns') == last_mtime:
+                ids |= set(self.watermark.get('ids', ()))
+            self.watermark = {'mtime_ns': last_mtime, 'ids': sorted(ids)}
+        self.updated_at = datetime.now(timezone.utc).isoformat()
+
+    def refresh(self):
+        """
+        Update the aggregates if the last update is older than refresh_seconds
+        Never blocks on another update; when there is no usable state the full
+        recompute runs in a background thread and summary() returns None until it is saved
+        """
+        now = time.monotonic()
+        if self._last_refresh is not None and now - self._last_refresh < self.refresh_seconds:
+            return
+        self._last_refresh = now
+        with self._lock:
+            loaded = self._load()
+        if loaded:
+            self.update(rebuild=False, blocking=False)
+        else:
+            self._start_rebuild()
+
+    def _start_rebuild(self):
+        # One recompute at a time, in a single process so a serving worker never forks
+        with self._lock:
+            if self._rebuild is not None and self._rebuild.is_alive():
+                return
+            self._rebuild = threading.Thread(target=self.update, kwargs={'workers': 1},
+                                             name='cohorts-rebuild', daemon=True)
+            self._rebuild.start()
+
+    def summary(self, dimension=None):
+        """
+        Return the cohort statistics for the endpoint, or None before the first aggregates are saved
+        """
+        with self._lock:
+            self._load()
+            if self.updated_at is None:
+                return None
+            return {'engine': ENGINE_VERSION, 'updated_at': self.updated_at, **self.cohorts.summary(dimension)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintain the cohort aggregates of the stored submissions')
+    parser.add_argument('command', choices=['update', 'recompute', 'show'], help='Incremental update, full recompute or print')
+    parser.add_argument('--data-dir', default=COHORTS_DATA_DIR, help='Directory of submission JSON files')
+    parser.add_argument('--path', default=COHORTS_PATH, help='Aggregate file')
+    parser.add_argument('--workers', type=int, help='Processes used by a full recompute (default: one per CPU)')
+    parser.add_argument('--dimension', choices=sorted(COHORT_DIMENSIONS), help='Only show this dimension')
+    args = parser.parse_args(argv)
+
+    store = CohortStore(args.path, args.data_dir)
+    start = time.perf_counter()
+    if args.command == 'update':
+        added = store.update(workers=args.workers)
+        print(f"Added {added} submissions in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    elif args.command == 'recompute':
+        added = store.recompute(workers=args.workers)
+        print(f"Aggregated {added} submissions in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    else:
+        summary = store.summary(args.dimension)
+        if summary is None:
+            sys.exit(f"No cohort aggregates at {args.path}, run `python cohorts.py update` first")
+        print(json.dumps(summary, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+from submissions import (
+    DATA_DIR, NUMERIC_FIELDS, LIST_FIELDS, LIST_FEATURES, MODEL_FIELDS, SETTLE_SECONDS,
+    parse_number, read_submission, normalize_submission, scan_new_files, chunked
+)
+
+# Columnar store of the submissions in data/
+# Each run folds the submission files written since the previous run into new
+# Parquet (or uncompressed Arrow IPC) part files, partitioned by submission
+# month as <output>/month=YYYY-MM/part-<run>-<chunk>.<ext>. Files are picked up
+# by an (mtime, id) watermark recorded in <output>/_watermark.json, which is only
+# advanced once all parts of a run are written; parts of a run that did not
+# finish are removed by the next one. Submissions are write-once, so a file
+# rewritten after it was compacted is stored again (see --full)
+#
+# Answers get fixed types: numbers are float64, height and BMI are derived, the
+# multi-select answers are kept as lists and also exploded to the 0/1 indicator
+# columns of submissions.LIST_FEATURES, and unknown fields are kept as JSON in 'extra'
+
+DEFAULT_DATA_DIR = DATA_DIR
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(DATA_DIR), 'data-compacted')
+
+WATERMARK_FILE = '_watermark.json'
+FORMAT_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Numeric answers, plus the derived BMI and the pain level the frontend also sends as a string
+NUMBER_COLUMNS = NUMERIC_FIELDS + ['painLevel', 'bmi']
+
+# Single-choice answers
+STRING_COLUMNS = [
+    'gender', 'exerciseFrequency', 'sleepQuality', 'dietType', 'waterIntake', 'smokingStatus',
+    'alcoholConsumption', 'anxietyFrequency', 'depressionFrequency', 'socialConnections',
+    'workLifeBalance', 'mindfulnessPractice', 'bloodPressure', 'cholesterolLevels',
+    'fastFoodFrequency', 'screenTime', 'outdoorTime', 'chronicPain', 'lastCheckup', 'vaccinationStatus'
+]
+
+INDICATOR_COLUMNS = [column for items in LIST_FEATURES.values() for column in items.values()]
+
+# Fields stored in their own columns; normalize_submission's model feature
+# mirrors are derived from them and not stored
+_KNOWN_FIELDS = set(['id', 'timestamp', 'exercise_frequency'] + NUMBER_COLUMNS + STRING_COLUMNS + LIST_FIELDS)
+_MIRRORED_FIELDS = set(MODEL_FIELDS.values())
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+        import pyarrow.dataset
+        import pyarrow.fs
+    except ImportError:
+        raise RuntimeError("Compaction requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+def submission_schema():
+    """
+    Arrow schema of the compacted submissions
+    """
+    pa = _pyarrow()
+    fields = [pa.field('id', pa.string()), pa.field('timestamp', pa.timestamp('ms', tz='UTC'))]
+    fields += [pa.field(column, pa.float64()) for column in NUMBER_COLUMNS]
+    fields += [pa.field('exercise_frequency', pa.int8())]
+    fields += [pa.field(column, pa.string()) for column in STRING_COLUMNS]
+    fields += [pa.field(column, pa.list_(pa.string())) for column in LIST_FIELDS]
+    fields += [pa.field(column, pa.int8()) for column in INDICATOR_COLUMNS]
+    fields += [pa.field('extra', pa.string())]
+    return pa.schema(fields)
+
+def _timestamp(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _number(value):
+    # Answers normalize_submission does not coerce, like painLevel, may still be strings
+    number = parse_number(value)
+    return None if number is None else float(number)
+
+def _string(value):
+    if value is None or value == '':
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def submission_columns(submissions, mtimes):
+    """
+    Convert normalized submissions into a dict of typed column lists, with their month partition
+    """
+    columns = {name: [] for name in submission_schema().names}
+    months = []
+    for submission, mtime_ns in zip(submissions, mtimes):
+        timestamp = _timestamp(submission.get('timestamp'))
+        when = timestamp or datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc)
+        months.append(when.strftime('%Y-%m'))
+
+        columns['id'].append(submission.get('id'))
+        columns['timestamp'].append(timestamp)
+        for column in NUMBER_COLUMNS:
+            columns[column].append(_number(submission.get(column)))
+        exercise_frequency = submission.get('exercise_frequency')
+        columns['exercise_frequency'].append(int(exercise_frequency) if _number(exercise_frequency) is not None else None)
+        for column in STRING_COLUMNS:
+            columns[column].append(_string(submission.get(column)))
+        for column in LIST_FIELDS:
+            answers = submission.get(column)
+            columns[column].append([str(answer) for answer in answers] if isinstance(answers, list) else None)
+
+        # The same 0/1 indicators FeatureEncoder sets for the multi-select answers
+        for field, items in LIST_FEATURES.items():
+            answers = set(submission.get(field) or ())
+            for item, column in items.items():
+                columns[column].append(1 if item in answers else 0)
+
+        extra = {key: value for key, value in submission.items()
+                 if key not in _KNOWN_FIELDS and key not in _MIRRORED_FIELDS}
+        columns['extra'].append(json.dumps(extra, sort_keys=True) if extra else None)
+    return columns, months
+
+def read_watermark(output_dir):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _write_watermark(output_dir, watermark):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def _remove_unfinished_parts(output_dir, last_run):
+    # Parts of runs after the watermark's, or temporary files, come from a run that did not finish
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(root, name))
+            elif name.startswith('part-'):
+                run = int(name.split('-')[1])
+                if run > last_run:
+                    os.remove(os.path.join(root, name))
+
+def _write_part(table, path, output_format):
+    pa = _pyarrow()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if output_format == 'arrow':
+        # Uncompressed so the reader can map the columns without copying them
+        pa.feather.write_feather(table, path + '.tmp', compression='uncompressed')
+    else:
+        pa.parquet.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def compact(data_dir=DEFAULT_DATA_DIR, output_dir=DEFAULT_OUTPUT_DIR, output_format=None, chunk_size=50000,
+            full=False, settle_seconds=SETTLE_SECONDS):
+    """
+    Fold the submissions written since the last run into new part files
+    With full, the store is rebuilt from every submission file
+    Returns a summary of the run
+    """
+    pa = _pyarrow()
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    watermark = None if full else read_watermark(output_dir)
+    if full:
+        for root, _, files in os.walk(output_dir):
+            for name in files:
+                if name.startswith('part-') or name == WATERMARK_FILE:
+                    os.remove(os.path.join(root, name))
+    output_format = output_format or (watermark or {}).get('format', 'parquet')
+    if watermark and output_format != watermark.get('format'):
+        raise ValueError(f"Store is in {watermark['format']} format; rebuild it with full=True to change it")
+    run = (watermark or {}).get('run', 0) + 1
+    _remove_unfinished_parts(output_dir, run - 1)
+
+    new_files = scan_new_files(data_dir, watermark, settle_seconds)
+    schema = submission_schema()
+    errors = []
+    rows = 0
+    parts = 0
+    for chunk_index, chunk in enumerate(chunked(new_files, chunk_size)):
+        submissions = []
+        submission_mtimes = []
+        for mtime_ns, _, path in chunk:
+            # Unreadable files are reported like iter_submissions does
+            try:
+                submission = read_submission(path)
+            except (OSError, ValueError) as e:
+                errors.append((path, str(e)))
+                continue
+            submissions.append(normalize_submission(submission))
+            submission_mtimes.append(mtime_ns)
+        if not submissions:
+            continue
+
+        columns, months = submission_columns(submissions, submission_mtimes)
+        table = pa.table(columns, schema=schema)
+
+        # One part per month present in the chunk
+        for month in sorted(set(months)):
+            mask = pa.array([m == month for m in months])
+            name = f"part-{run:06d}-{chunk_index:04d}{FORMAT_EXTENSIONS[output_format]}"
+            _write_part(table.filter(mask), os.path.join(output_dir, f"month={month}", name), output_format)
+            parts += 1
+        rows += len(submissions)
+
+    if new_files:
+        last_mtime = new_files[-1][0]
+        ids = [submission_id for mtime_ns, submission_id, _ in new_files if mtime_ns == last_mtime]
+        if watermark and watermark.get('mtime_ns') == last_mtime:
+            ids = sorted(set(ids) | set(watermark.get('ids', ())))
+        watermark = {
+            'format': output_format,
+            'run': run,
+            'mtime_ns': last_mtime,
+            'ids': ids,
+            'rows': (watermark or {}).get('rows', 0) + rows,
+            'compacted_at': datetime.now(timezone.utc).isoformat()
+        }
+        _write_watermark(output_dir, watermark)
+
+    return {
+        'run': run,
+        'files': len(new_files),
+        'rows': rows,
+        'parts': parts,
+        'errors': errors,
+        'seconds': time.perf_counter() - start
+    }
+
+def open_compacted(output_dir=DEFAULT_OUTPUT_DIR):
+    """
+    Open the compacted submissions as a pyarrow Dataset whose files are memory-mapped
+    """
+    pa = _pyarrow()
+    watermark = read_watermark(output_dir) or {}
+    file_format = 'ipc' if watermark.get('format') == 'arrow' else 'parquet'
+    return pa.dataset.dataset(
+        output_dir,
+        schema=submission_schema().append(pa.field('month', pa.string())),
+        format=file_format,
+        partitioning='hive',
+        filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=False,
+        ignore_prefixes=['_', '.']
+    )
+
+def read_compacted(output_dir=DEFAULT_OUTPUT_DIR, columns=None, filter=None):
+    """
+    Read the compacted submissions into a pyarrow Table
+    columns selects columns and filter is a pyarrow.dataset expression, e.g.
+    pyarrow.dataset.field('month') >= '2025-01'; only the matching partitions are read
+    """
+    return open_compacted(output_dir).to_table(columns=columns, filter=filter)
+
+def read_compacted_frame(output_dir=DEFAULT_OUTPUT_DIR, columns=None, filter=None):
+    """
+    Read the compacted submissions into a pandas DataFrame
+    """
+    return read_compacted(output_dir, columns, filter).to_pandas()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compact stored submissions into columnar files')
+    parser.add_argument('data_dir', nargs='?', default=DEFAULT_DATA_DIR, help='Directory of submission JSON files')
+    parser.add_argument('output_dir', nargs='?', default=DEFAULT_OUTPUT_DIR, help='Directory of the compacted store')
+    parser.add_argument('--format', choices=sorted(FORMAT_EXTENSIONS), help='File format of new stores (default: parquet)')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Submissions read per part file')
+    parser.add_argument('--full', action='store_true', help='Rebuild the store from every submission')
+    args = parser.parse_args(argv)
+
+    try:
+        summary = compact(args.data_dir, args.output_dir, args.format, args.chunk_size, args.full)
+    except (RuntimeError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+    for path, error in summary['errors']:
+        print(f"Skipped {path}: {error}", file=sys.stderr)
+    print(f"Run {summary['run']}: compacted {summary['rows']} of {summary['files']} new submissions "
+          f"into {summary['parts']} parts in {summary['seconds']:.2f}s", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/predict/', views.predict, name='predict'),
+    path('api/models/', views.model_status, name='model_status'),
+    path('metrics', views.metrics, name='metrics'),
 ]
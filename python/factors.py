@@ -0,0 +1,155 @@
+# Catalogue of the recommendation factors returned with each risk score
+# Every distinct factor is built once at import and identified by a small integer;
+# the scoring code emits these IDs and the text is only attached when a response
+# is serialized, or left to clients that fetch the catalogue once (/api/factors)
+
+class Factor:
+    """
+    One recommendation of the catalogue
+    A suggestion containing {placeholders} is a template filled from per-user parameters
+    """
+    __slots__ = ('id', 'key', 'name', 'impact', 'suggestion', 'templated', '_record')
+
+    def __init__(self, id, key, name, impact, suggestion):
+        self.id = id
+        self.key = key
+        self.name = name
+        self.impact = impact
+        self.suggestion = suggestion
+        self.templated = '{' in suggestion
+        # Static factors share one prebuilt response record
+        self._record = None if self.templated else {'name': name, 'impact': impact, 'suggestion': suggestion}
+
+    def materialize(self, params=None):
+        """
+        Return the response record of this factor
+        Records of static factors are shared and must be treated as read-only
+        """
+        if self._record is not None:
+            return self._record
+        return {'name': self.name, 'impact': self.impact, 'suggestion': self.suggestion.format(**(params or {}))}
+
+    def to_dict(self):
+        return {'id': self.id, 'key': self.key, 'name': self.name, 'impact': self.impact, 'suggestion': self.suggestion}
+
+# IDs are positions in this list, so new factors must be appended to keep
+# the IDs already known to clients and cached results stable
+CATALOGUE = [
+    # Cardiovascular
+    ('exercise.regular', 'Exercise', 'High positive impact', 'Continue your regular exercise routine'),
+    ('exercise.moderate_weekly', 'Exercise', 'Medium negative impact', 'Aim for at least 150 minutes of moderate exercise weekly'),
+    ('exercise.aerobic_weekly', 'Exercise', 'High negative impact', 'Aim for at least 150 minutes of moderate aerobic activity weekly'),
+    ('diet.heart_healthy', 'Diet', 'Medium positive impact', 'Maintain your heart-healthy diet'),
+    ('diet.reduce_sodium', 'Diet', 'Medium negative impact', 'Consider reducing sodium and saturated fat intake'),
+    ('diet.heart_generic', 'Diet', 'Medium impact', 'A diet low in sodium and saturated fat is beneficial for heart health'),
+    ('smoking.avoiding', 'Smoking', 'High positive impact', 'Continue avoiding tobacco products'),
+    ('smoking.quit', 'Smoking', 'High negative impact', 'Quitting smoking would significantly improve your cardiovascular health'),
+    ('blood_pressure.monitor', 'Blood Pressure', 'Low positive impact', 'Continue monitoring your blood pressure regularly'),
+    ('blood_pressure.lifestyle', 'Blood Pressure', 'Medium negative impact', 'Consider lifestyle changes to improve blood pressure'),
+    ('blood_pressure.consult', 'Blood Pressure', 'High negative impact', 'Consult with a healthcare provider about managing your blood pressure'),
+    ('family_history.checkups', 'Family History', 'Medium negative impact', 'Regular cardiovascular checkups are recommended'),
+    ('family_history.none', 'Family History', 'Low impact', 'Continue heart-healthy practices'),
+    ('family_history.given', 'Family History', 'Medium negative impact', 'Given your family history, regular cardiovascular checkups are recommended'),
+
+    # Metabolic
+    ('diet.balanced', 'Diet', 'High positive impact', 'Continue your balanced diet approach'),
+    ('diet.reduce_sugars', 'Diet', 'Medium negative impact', 'Consider reducing processed carbohydrates and added sugars'),
+    ('diet.metabolic_choice', 'Diet', 'High positive impact', 'Your diet choice is beneficial for metabolic health'),
+    ('diet.less_processed', 'Diet', 'Medium negative impact', 'Consider a more balanced diet with less processed foods'),
+    ('exercise.beneficial', 'Exercise', 'Medium positive impact', 'Your activity level is beneficial'),
+    ('exercise.add_cardio', 'Exercise', 'Medium negative impact', 'Adding cardio exercise would improve metabolic health'),
+    ('exercise.metabolic_generic', 'Exercise', 'Medium impact', 'Regular physical activity improves metabolic health'),
+    ('weight.healthy', 'Weight Management', 'Medium positive impact', 'Your weight is in a healthy range'),
+    ('weight.adjust', 'Weight Management', 'Medium negative impact', 'A 5-10% weight adjustment would benefit your metabolic health'),
+    ('water.good', 'Water Intake', 'Medium positive impact', 'Your hydration habits support good health'),
+    ('water.increase', 'Water Intake', 'Medium negative impact', 'Increase water intake to at least 8 glasses daily'),
+    ('hydration.increase', 'Hydration', 'Medium negative impact', 'Increase water intake to at least 8 glasses daily'),
+    ('hydration.good', 'Hydration', 'Medium positive impact', 'Continue with good hydration habits'),
+    ('cholesterol.maintain', 'Cholesterol', 'Medium positive impact', 'Maintain your healthy cholesterol levels'),
+    ('cholesterol.maintain_low', 'Cholesterol', 'Low positive impact', 'Maintain your healthy cholesterol levels'),
+    ('cholesterol.diet', 'Cholesterol', 'Medium negative impact', 'Consider dietary changes to improve cholesterol levels'),
+
+    # Sleep
+    ('sleep_duration.optimal', 'Sleep Duration', 'High positive impact', 'Your sleep duration is optimal'),
+    ('sleep_duration.optimal_range', 'Sleep Duration', 'Medium positive impact', 'Your sleep duration is in the optimal range'),
+    ('sleep_duration.adjust', 'Sleep Duration', 'Medium negative impact', 'Aim for 7-8 hours of sleep instead of your current {sleep_hours} hours'),
+    ('sleep_quality.excellent', 'Sleep Quality', 'High positive impact', 'Your sleep quality is excellent'),
+    ('sleep_quality.environment', 'Sleep Quality', 'Medium negative impact', 'Improve your sleep environment for better quality rest'),
+    ('sleep_environment.improve', 'Sleep Environment', 'High negative impact', 'Create a dark, quiet, and cool sleeping environment'),
+    ('sleep_environment.maintain', 'Sleep Environment', 'Medium positive impact', 'Maintain your comfortable sleep environment'),
+    ('stress.effective', 'Stress Management', 'Medium positive impact', 'Your stress management is effective'),
+    ('stress.techniques', 'Stress Management', 'Medium positive impact', 'Continue your effective stress management techniques'),
+    ('stress.before_sleep', 'Stress Management', 'High negative impact', 'Try meditation or deep breathing before sleep'),
+    ('evening_routine.screens', 'Evening Routine', 'Medium impact', 'Avoid screens 1 hour before bedtime and maintain a consistent sleep schedule'),
+    ('evening_routine.generic', 'Evening Routine', 'Medium impact', 'Establish a consistent pre-sleep routine to improve sleep quality'),
+    ('mindfulness_practice.supports_sleep', 'Mindfulness Practice', 'Medium positive impact', 'Your mindfulness practice supports good sleep'),
+    ('mindfulness_practice.bedtime', 'Mindfulness Practice', 'Low negative impact', 'Consider adding mindfulness to your bedtime routine'),
+
+    # Mental health
+    ('stress.working', 'Stress Management', 'High positive impact', 'Your stress management techniques are working well'),
+    ('stress.daily_mindfulness', 'Stress Management', 'High negative impact', 'Consider adding daily mindfulness practice to your routine'),
+    ('social_connections.excellent', 'Social Connections', 'High positive impact', 'Your social network provides excellent support'),
+    ('social_connections.increase', 'Social Connections', 'Medium negative impact', 'Try to increase meaningful social interactions weekly'),
+    ('social_connection.increase', 'Social Connection', 'Medium negative impact', 'Try to increase meaningful social interactions weekly'),
+    ('social_connection.strong', 'Social Connection', 'High positive impact', 'Continue maintaining your strong social connections'),
+    ('mindfulness.add_daily', 'Mindfulness', 'Medium negative impact', 'Consider adding daily mindfulness practice to your routine'),
+    ('mindfulness.regular', 'Mindfulness', 'High positive impact', 'Continue your regular mindfulness practice'),
+    ('work_life.good', 'Work-Life Balance', 'Medium positive impact', 'Your balance is good; continue prioritizing personal time'),
+    ('work_life.clearer_boundaries', 'Work-Life Balance', 'Medium negative impact', 'Set clearer boundaries between work and personal time'),
+    ('work_life.clear_boundaries', 'Work-Life Balance', 'High negative impact', 'Set clear boundaries between work and personal time'),
+    ('physical_activity.benefiting', 'Physical Activity', 'Medium positive impact', 'Regular exercise is benefiting your mental health'),
+    ('physical_activity.short_walks', 'Physical Activity', 'Medium negative impact', 'Even short walks can improve mood and reduce anxiety'),
+    ('physical_activity.generic', 'Physical Activity', 'Medium impact', 'Regular exercise can significantly improve mood and reduce anxiety'),
+    ('sleep_quality.mental_good', 'Sleep Quality', 'Medium positive impact', 'Your sleep pattern supports good mental health'),
+    ('sleep_quality.consistency', 'Sleep Quality', 'Medium negative impact', 'Improving sleep consistency could benefit your mental wellbeing')
+]
+
+FACTORS = tuple(Factor(i, *entry) for i, entry in enumerate(CATALOGUE))
+FACTOR_IDS = {factor.key: factor.id for factor in FACTORS}
+TEMPLATED_IDS = frozenset(factor.id for factor in FACTORS if factor.templated)
+
+# Shared response records of the static factors by ID, None for templated ones
+_RECORDS = tuple(factor._record for factor in FACTORS)
+
+def factor_id(key):
+    """
+    Return the ID of a catalogue factor
+    """
+    return FACTOR_IDS[key]
+
+def factor_catalogue():
+    """
+    Return the catalogue as served by /api/factors
+    """
+    return [factor.to_dict() for factor in FACTORS]
+
+def factor_entry(risk, ids, params):
+    """
+    Build the compact prediction of one model
+    Template parameters are only kept when one of the factors needs them
+    """
+    entry = {'risk': risk, 'factor_ids': ids}
+    if not TEMPLATED_IDS.isdisjoint(ids):
+        entry['factor_params'] = params
+    return entry
+
+def factor_records(ids, params=None):
+    """
+    Return the response records of a list of factor IDs
+    """
+    return [_RECORDS[i] or FACTORS[i].materialize(params) for i in ids]
+
+def materialize_prediction(prediction):
+    """
+    Replace the factor IDs of one user's predictions with the factor records
+    """
+    result = {}
+    for name, entry in prediction.items():
+        entry = dict(entry)
+        params = entry.pop('factor_params', None)
+        entry['factors'] = factor_records(entry.pop('factor_ids'), params)
+        result[name] = entry
+    return result
+
+def materialize_predictions(predictions):
+    return [materialize_prediction(prediction) for prediction in predictions]
@@ -0,0 +1,413 @@
+import numpy as np
+
+from factors import factor_id, factor_entry, factor_records
+
+# Heuristic health risk engine shared by the Flask and Django services
+# Risk scores are weighted sums of per-user terms, so the weights are kept in
+# compiled coefficient tables and a whole batch of users is scored with a few
+# vectorized column operations. Single users are scored as a batch of one
+
+# Bump when the weights or factor rules change, so cached results are invalidated
+HEURISTICS_VERSION = 1
+
+# Categorical inputs and the scores they map to
+EXERCISE_MAP = {
+    'sedentary': 0,
+    'light': 2,
+    'moderate': 4,
+    'active': 6,
+    'very-active': 7
+}
+
+SLEEP_QUALITY_SCORES = {
+    'poor': 2,
+    'fair': 4,
+    'average': 6,
+    'good': 8,
+    'excellent': 10
+}
+
+DIET_MAP = {
+    'balanced': 7,
+    'vegetarian': 8,
+    'vegan': 8,
+    'keto': 6,
+    'paleo': 6,
+    'mediterranean': 9,
+    'high-protein': 7
+}
+
+WATER_SCORES = {
+    'low': 3,
+    'moderate': 7,
+    'high': 10
+}
+
+FREQUENCY_SCORES = {
+    'rarely': 2,
+    'sometimes': 5,
+    'often': 7,
+    'constantly': 9
+}
+
+SOCIAL_SCORES = {
+    'limited': 3,
+    'moderate': 6,
+    'strong': 8,
+    'very-strong': 10
+}
+
+WORK_LIFE_SCORES = {
+    'poor': 2,
+    'fair': 4,
+    'moderate': 6,
+    'good': 8,
+    'excellent': 10
+}
+
+MINDFULNESS_SCORES = {
+    'never': 0,
+    'occasionally': 3,
+    'weekly': 7,
+    'daily': 10
+}
+
+SMOKING_FACTORS = {
+    'non-smoker': 0,
+    'former-smoker': 0.3,
+    'occasional': 0.5,
+    'regular': 1.0
+}
+
+ALCOHOL_FACTORS = {
+    'none': 0,
+    'occasional': 0.2,
+    'moderate': 0.5,
+    'heavy': 1.0
+}
+
+BP_FACTORS = {
+    'low': 0.2,
+    'normal': 0,
+    'elevated': 0.3,
+    'high-stage1': 0.6,
+    'high-stage2': 1.0,
+    'unknown': 0.3
+}
+
+CHOLESTEROL_FACTORS = {
+    'normal': 0,
+    'borderline': 0.5,
+    'high': 1.0,
+    'unknown': 0.3
+}
+
+def _lookup(values, table, missing):
+    # Score of each answer in a column, missing for answers not in the table
+    return np.array([table.get(value, missing) for value in values], dtype=np.float64)
+
+# Raw terms of the risk scores, each computed for a whole batch from the input
+# columns (see _input_columns) in one or two array operations
+RISK_TERMS = {
+    'age': lambda c: c['age'],
+    'bmi_excess': lambda c: np.maximum(0, (c['bmi'] - 18.5) / 15),
+    'inactive_days': lambda c: 7 - c['exercise_freq'],
+    'smoking': lambda c: _lookup(c['smoking_status'], SMOKING_FACTORS, 0),
+    'alcohol': lambda c: _lookup(c['alcohol'], ALCOHOL_FACTORS, 0.2),
+    'blood_pressure': lambda c: _lookup(c['blood_pressure'], BP_FACTORS, 0),
+    'cholesterol': lambda c: _lookup(c['cholesterol'], CHOLESTEROL_FACTORS, 0),
+    'family_heart': lambda c: c['family_heart'],
+    'heart_disease': lambda c: c['has_heart_disease'],
+    'diet_gap': lambda c: 10 - c['diet_quality'],
+    'water_gap': lambda c: 10 - _lookup(c['water_intake'], WATER_SCORES, 7),
+    'family_diabetes': lambda c: c['family_diabetes'],
+    'diabetes': lambda c: c['has_diabetes'],
+    'no_cardio': lambda c: ~c['has_cardio'],
+    'stress': lambda c: c['stress_level'],
+    'sleep_quality_gap': lambda c: 10 - c['sleep_quality_score'],
+    'sleep_deviation': lambda c: np.abs(c['sleep_hours'] - 7.5),
+    'anxiety': lambda c: _lookup(c['anxiety_freq'], FREQUENCY_SCORES, 5),
+    'mindfulness_gap': lambda c: 10 - _lookup(c['mindfulness_practice'], MINDFULNESS_SCORES, 0),
+    'work_life_gap': lambda c: 10 - _lookup(c['work_life_balance'], WORK_LIFE_SCORES, 6),
+    'depression': lambda c: _lookup(c['depression_freq'], FREQUENCY_SCORES, 5),
+    'social_gap': lambda c: 10 - _lookup(c['social_connections'], SOCIAL_SCORES, 6),
+    'family_mental': lambda c: c['family_mental'],
+    'mental_condition': lambda c: c['has_mental_condition']
+}
+
+# Each risk score is the sum of weight * term / scale over its terms
+RISK_WEIGHTS = {
+    'cardiovascular': [
+        ('age', 0.15, 80),
+        ('bmi_excess', 0.15, 1),
+        ('inactive_days', 0.10, 7),
+        ('smoking', 0.10, 1),
+        ('alcohol', 0.10, 1),
+        ('blood_pressure', 0.15, 1),
+        ('cholesterol', 0.10, 1),
+        ('family_heart', 0.05, 1),
+        ('heart_disease', 0.10, 1)
+    ],
+    'metabolic': [
+        ('bmi_excess', 0.20, 1),
+        ('diet_gap', 0.15, 10),
+        ('inactive_days', 0.10, 7),
+        ('water_gap', 0.10, 10),
+        ('cholesterol', 0.15, 1),
+        ('family_diabetes', 0.10, 1),
+        ('diabetes', 0.15, 1),
+        ('no_cardio', 0.05, 1)
+    ],
+    'sleep': [
+        ('stress', 0.20, 10),
+        ('sleep_quality_gap', 0.25, 10),
+        ('sleep_deviation', 0.15, 3.5),
+        ('alcohol', 0.10, 1),
+        ('anxiety', 0.10, 10),
+        ('mindfulness_gap', 0.10, 10),
+        ('work_life_gap', 0.10, 10)
+    ],
+    'mental': [
+        ('stress', 0.15, 10),
+        ('anxiety', 0.15, 10),
+        ('depression', 0.15, 10),
+        ('social_gap', 0.15, 10),
+        ('work_life_gap', 0.10, 10),
+        ('mindfulness_gap', 0.10, 10),
+        ('sleep_quality_gap', 0.05, 10),
+        ('inactive_days', 0.05, 7),
+        ('family_mental', 0.05, 1),
+        ('mental_condition', 0.05, 1)
+    ]
+}
+
+# Reported risk percentages are capped to these ranges
+RISK_BOUNDS = {
+    'cardiovascular': (10, 90),
+    'metabolic': (15, 85),
+    'sleep': (20, 80),
+    'mental': (15, 75)
+}
+
+RISK_NAMES = list(RISK_WEIGHTS)
+
+def _compile_weights(risk_weights):
+    # Term column, weight and scale of every risk, padded to the longest risk
+    # with zero-weight terms on an all-zero column so all risks sum in one pass
+    term_index = {term: i for i, term in enumerate(RISK_TERMS)}
+    width = max(len(risk_weights[name]) for name in RISK_NAMES)
+    padding = [(None, 0.0, 1)] * width
+    columns, weights, scales = [], [], []
+    for name in RISK_NAMES:
+        terms = (risk_weights[name] + padding)[:width]
+        columns.append([term_index.get(term, len(RISK_TERMS)) for term, _, _ in terms])
+        weights.append([weight for _, weight, _ in terms])
+        scales.append([scale for _, _, scale in terms])
+    return (np.array(columns, dtype=np.intp), np.array(weights, dtype=np.float64),
+            np.array(scales, dtype=np.float64))
+
+# Compiled tables used by score_risk_terms
+RISK_COLUMNS, RISK_COEFFICIENTS, RISK_SCALES = _compile_weights(RISK_WEIGHTS)
+RISK_LOWER = np.array([RISK_BOUNDS[name][0] for name in RISK_NAMES])
+RISK_UPPER = np.array([RISK_BOUNDS[name][1] for name in RISK_NAMES])
+
+def _bmi(user_data):
+    bmi = user_data.get('bmi', 25)
+    if not bmi and 'weight' in user_data and 'height' in user_data:
+        weight = user_data.get('weight', 70)
+        height = user_data.get('height', 170)
+        bmi = weight / ((height / 100) ** 2)
+    return bmi
+
+def _exercise_freq(value):
+    return EXERCISE_MAP.get(value, 3) if isinstance(value, str) else value
+
+def _diet_quality(user_data):
+    if 'dietType' in user_data:
+        return DIET_MAP.get(user_data['dietType'], 5)
+    return user_data.get('diet_quality', 5)
+
+def _has_mental_condition(existing_conditions):
+    return 'Anxiety Disorder' in existing_conditions or 'Depression' in existing_conditions
+
+def _answers(users, field, default):
+    return [user_data.get(field, default) for user_data in users]
+
+def _numbers(values):
+    return np.array(values, dtype=np.float64)
+
+def _flags(values):
+    return np.array(values, dtype=bool)
+
+def _input_columns(users):
+    """
+    Extract the engine inputs of a batch of users, one column per input, with the
+    defaults assumed for missing answers
+    Numeric inputs are float64 arrays, yes/no inputs bool arrays and categorical answers lists
+    """
+    exercise_types = _answers(users, 'exerciseTypes', [])
+    family_history = _answers(users, 'familyHistory', [])
+    conditions = _answers(users, 'existingConditions', [])
+    sleep_quality = _answers(users, 'sleepQuality', 'average')
+    return {
+        'age': _numbers(_answers(users, 'age', 30)),
+        'bmi': _numbers([_bmi(user_data) for user_data in users]),
+        'exercise_freq': _numbers([_exercise_freq(value) for value in _answers(users, 'exerciseFrequency', 3)]),
+        'has_cardio': _flags(['Cardio' in types for types in exercise_types]),
+        'sleep_hours': _numbers(_answers(users, 'sleepHours', 7)),
+        'sleep_quality': sleep_quality,
+        'sleep_quality_score': _lookup(sleep_quality, SLEEP_QUALITY_SCORES, 6),
+        'diet_quality': _numbers([_diet_quality(user_data) for user_data in users]),
+        'water_intake': _answers(users, 'waterIntake', 'moderate'),
+        'stress_level': _numbers(_answers(users, 'stressLevel', 5)),
+        'anxiety_freq': _answers(users, 'anxietyFrequency', 'sometimes'),
+        'depression_freq': _answers(users, 'depressionFrequency', 'sometimes'),
+        'social_connections': _answers(users, 'socialConnections', 'moderate'),
+        'work_life_balance': _answers(users, 'workLifeBalance', 'moderate'),
+        'mindfulness_practice': _answers(users, 'mindfulnessPractice', 'never'),
+        'smoking_status': _answers(users, 'smokingStatus', 'non-smoker'),
+        'alcohol': _answers(users, 'alcoholConsumption', 'occasional'),
+        'blood_pressure': _answers(users, 'bloodPressure', 'normal'),
+        'cholesterol': _answers(users, 'cholesterolLevels', 'normal'),
+        'family_heart': _flags(['Heart Disease' in history for history in family_history]),
+        'family_diabetes': _flags(['Diabetes' in history for history in family_history]),
+        'family_mental': _flags(['Mental Health Conditions' in history for history in family_history]),
+        'has_diabetes': _flags(['Diabetes' in existing for existing in conditions]),
+        'has_heart_disease': _flags(['Heart Disease' in existing for existing in conditions]),
+        'has_mental_condition': _flags([_has_mental_condition(existing) for existing in conditions])
+    }
+
+def _risk_term_matrix(columns):
+    """
+    Build the (n_users, n_terms) risk term matrix of a batch column by column, in RISK_TERMS order
+    """
+    terms = np.empty((len(columns['age']), len(RISK_TERMS)), dtype=np.float64)
+    for i, term in enumerate(RISK_TERMS.values()):
+        terms[:, i] = term(columns)
+    return terms
+
+def score_risk_terms(terms):
+    """
+    Score a (n_users, n_terms) matrix of risk terms
+    Returns a (n_users, 4) matrix of capped risk percentages in RISK_NAMES order
+    """
+    terms = np.asarray(terms, dtype=np.float64)
+    padded = np.zeros((terms.shape[0], terms.shape[1] + 1), dtype=np.float64)
+    padded[:, :-1] = terms
+
+    # Calculate risk scores (0-100)
+    # Lower is better in our system
+    # cumsum adds the weighted terms strictly in table order, which keeps the
+    # floating point rounding (and so the truncated percentages) identical to
+    # summing them one user at a time; the padding adds exact zeros at the end
+    weighted = RISK_COEFFICIENTS * padded[:, RISK_COLUMNS] / RISK_SCALES
+    scores = np.cumsum(weighted, axis=2)[:, :, -1]
+
+    risks = np.trunc(scores * 100).astype(int)
+    return np.clip(risks, RISK_LOWER, RISK_UPPER)
+
+def heuristic_risk_matrix(users):
+    """
+    Score a list of users without building recommendations, for bulk rescoring
+    """
+    if not users:
+        return np.empty((0, len(RISK_NAMES)), dtype=int)
+    return score_risk_terms(_risk_term_matrix(_input_columns(users)))
+
+def _isin(values, choices):
+    return _flags([value in choices for value in values])
+
+# Recommendation rules of each risk, as (condition, factor if true, factor if false)
+# Conditions map the input columns to a bool array; None always picks the first factor
+FACTOR_RULES = {
+    'cardiovascular': [
+        (lambda c: c['exercise_freq'] >= 5, 'exercise.regular', 'exercise.moderate_weekly'),
+        (lambda c: c['diet_quality'] >= 7, 'diet.heart_healthy', 'diet.reduce_sodium'),
+        (lambda c: _isin(c['smoking_status'], ('non-smoker',)), 'smoking.avoiding', 'smoking.quit'),
+        (lambda c: _isin(c['blood_pressure'], ('normal', 'low')), 'blood_pressure.monitor', 'blood_pressure.lifestyle'),
+        (lambda c: c['family_heart'], 'family_history.checkups', 'family_history.none')
+    ],
+    'metabolic': [
+        (lambda c: c['diet_quality'] >= 8, 'diet.balanced', 'diet.reduce_sugars'),
+        (lambda c: (c['exercise_freq'] >= 4) & c['has_cardio'], 'exercise.beneficial', 'exercise.add_cardio'),
+        (lambda c: (c['bmi'] >= 18.5) & (c['bmi'] <= 24.9), 'weight.healthy', 'weight.adjust'),
+        (lambda c: _isin(c['water_intake'], ('moderate', 'high')), 'water.good', 'water.increase'),
+        (lambda c: _isin(c['cholesterol'], ('normal',)), 'cholesterol.maintain', 'cholesterol.diet')
+    ],
+    'sleep': [
+        (lambda c: (c['sleep_hours'] >= 7) & (c['sleep_hours'] <= 8), 'sleep_duration.optimal', 'sleep_duration.adjust'),
+        (lambda c: _isin(c['sleep_quality'], ('good', 'excellent')), 'sleep_quality.excellent', 'sleep_quality.environment'),
+        (lambda c: c['stress_level'] <= 4, 'stress.effective', 'stress.before_sleep'),
+        (None, 'evening_routine.screens', None),
+        (lambda c: _isin(c['mindfulness_practice'], ('weekly', 'daily')), 'mindfulness_practice.supports_sleep', 'mindfulness_practice.bedtime')
+    ],
+    'mental': [
+        (lambda c: c['stress_level'] <= 3, 'stress.working', 'stress.daily_mindfulness'),
+        (lambda c: _isin(c['social_connections'], ('strong', 'very-strong')), 'social_connections.excellent', 'social_connections.increase'),
+        (lambda c: _isin(c['work_life_balance'], ('good', 'excellent')), 'work_life.good', 'work_life.clearer_boundaries'),
+        (lambda c: c['exercise_freq'] >= 3, 'physical_activity.benefiting', 'physical_activity.short_walks'),
+        (lambda c: c['sleep_quality_score'] >= 7, 'sleep_quality.mental_good', 'sleep_quality.consistency')
+    ]
+}
+
+def _compile_factor_rules(factor_rules):
+    # Every rule of every risk in RISK_NAMES order, with its factor keys resolved
+    # to catalogue IDs; rules without an alternative pick the same factor either way
+    rules = [rule for name in RISK_NAMES for rule in factor_rules[name]]
+    return (
+        [condition for condition, _, _ in rules],
+        np.array([factor_id(if_true) for _, if_true, _ in rules], dtype=np.intp),
+        np.array([factor_id(if_false or if_true) for _, if_true, if_false in rules], dtype=np.intp)
+    )
+
+FACTOR_CONDITIONS, FACTOR_IDS_IF_TRUE, FACTOR_IDS_IF_FALSE = _compile_factor_rules(FACTOR_RULES)
+
+def _factor_ids(columns):
+    """
+    Pick the factors of every risk for a batch
+    Returns an (n_users, n_risks, n_rules) nested list of catalogue IDs
+    """
+    n = len(columns['age'])
+    chosen = np.ones((n, len(FACTOR_CONDITIONS)), dtype=bool)
+    for i, condition in enumerate(FACTOR_CONDITIONS):
+        if condition is not None:
+            chosen[:, i] = condition(columns)
+    ids = np.where(chosen, FACTOR_IDS_IF_TRUE, FACTOR_IDS_IF_FALSE)
+    return ids.reshape(n, len(RISK_NAMES), -1).tolist()
+
+def _materialized_entry(risk, ids, params):
+    # What materialize_prediction makes of factor_entry(risk, ids, params)
+    return {'risk': risk, 'factors': factor_records(ids, params)}
+
+def mock_predict_health_risks_batch(users, factor_ids=False):
+    """
+    Score a list of users with the heuristic engine
+    The inputs are extracted column by column, and the risk terms and factor
+    rules are evaluated for the whole batch with array operations
+    With factor_ids the recommendations are returned as catalogue IDs (see factors.py)
+    """
+    if not users:
+        return []
+
+    columns = _input_columns(users)
+    risks = score_risk_terms(_risk_term_matrix(columns)).tolist()
+    ids = _factor_ids(columns)
+
+    # Only the output form asked for is built; templated factors show the answer as given
+    entry = factor_entry if factor_ids else _materialized_entry
+    predictions = []
+    for sleep_hours, user_risks, user_ids in zip(_answers(users, 'sleepHours', 7), risks, ids):
+        params = {'sleep_hours': sleep_hours}
+        predictions.append({
+            name: entry(risk, risk_ids, params)
+            for name, risk, risk_ids in zip(RISK_NAMES, user_risks, user_ids)
+        })
+    return predictions
+
+def mock_predict_health_risks(user_data, factor_ids=False):
+    """
+    Mock function to simulate model predictions with enhanced inputs
+    In a real app, this would use trained models
+    Scored as a batch of one, so single and batch results are always the same
+    """
+    return mock_predict_health_risks_batch([user_data], factor_ids)[0]
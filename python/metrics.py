@@ -0,0 +1,195 @@
+import time
+import bisect
+import functools
+import threading
+
+# Latency metrics of the prediction services, in the Prometheus text format
+# Each process keeps its own metrics (one per gunicorn worker), and every stage
+# of a prediction records its duration into a labelled histogram: decode and
+# validate in schema.py, encode and scale in predict.FeatureEncoder, each
+# model's predict_proba and the recommendations in predict_health_risks_batch,
+# and serialize in serialization.dumps. Requests batched by the scheduler
+# record the model stages once per batch
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bucket upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Metrics rendered by render(), in registration order
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    A monotonically increasing count per combination of label values
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}_total{_labels(self.labelnames, labels)} {_format(value)}'
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Histogram:
+    """
+    Counts of observed values in cumulative buckets per combination of label values
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label values: non-cumulative bucket counts (the last one is +Inf) and the sum
+        self._children = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            child[0][index] += 1
+            child[1] += value
+
+    def time(self, *labels):
+        """
+        Context manager observing the duration of its block
+        """
+        return _Timer(self, labels)
+
+    def count(self, *labels):
+        child = self._children.get(labels)
+        return sum(child[0]) if child else 0
+
+    def samples(self):
+        with self._lock:
+            children = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._children.items())
+        for labels, (counts, total) in children:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound is None else f'le="{_format(float(bound))}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_format(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+def render(registry=REGISTRY):
+    """
+    Render every metric of a registry in the Prometheus text exposition format
+    """
+    lines = []
+    for metric in registry:
+        name = metric.name + '_total' if metric.kind == 'counter' else metric.name
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+STAGE_SECONDS = Histogram(
+    'health_prediction_stage_seconds', 'Time spent in each stage of a prediction', ['stage']
+)
+MODEL_SECONDS = Histogram(
+    'health_model_predict_seconds', 'Time spent scoring each risk model', ['model']
+)
+REQUEST_SECONDS = Histogram(
+    'health_request_seconds', 'Request latency by route', ['route']
+)
+REQUESTS = Counter(
+    'health_requests', 'Requests by route and response status', ['route', 'status']
+)
+ERRORS = Counter(
+    'health_errors', 'Failed requests by route and exception type', ['route', 'error']
+)
+
+def record_error(route, error):
+    """
+    Count an exception raised while handling route
+    """
+    ERRORS.inc(route, type(error).__name__)
+
+def observe_request(route, status, seconds):
+    REQUEST_SECONDS.observe(seconds, route)
+    REQUESTS.inc(route, str(status))
+
+def instrument(route):
+    """
+    Decorate a Flask or Django view to record its latency, response status and errors
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = view(*args, **kwargs)
+                status = getattr(response, 'status_code', 200)
+                return response
+            except Exception as e:
+                record_error(route, e)
+                raise
+            finally:
+                observe_request(route, status, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# Framework helpers
+def flask_metrics_response():
+    """
+    Build the Flask response of a /metrics route
+    """
+    from flask import current_app
+    return current_app.response_class(render(), content_type=CONTENT_TYPE)
+
+def django_metrics_response():
+    """
+    Build the Django response of a /metrics route
+    """
+    from django.http import HttpResponse
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,96 @@
+from flask import Flask, request, jsonify
+
+from batching import MicroBatchScheduler
+from factors import factor_catalogue, materialize_prediction
+from predict import get_model_bundle, predict_health_risks_batch, annotate_percentiles
+from result_cache import cache_from_env
+from schema import QUESTIONNAIRE
+from serialization import flask_response
+from metrics import instrument, record_error, flask_metrics_response
+from profiling import profiled, is_profiling
+
+# Example Flask API to serve the model, run by `python predict.py serve`
+# It lives outside predict.py so the Django views, the ASGI app and the scripts
+# can load and score the models without importing Flask
+
+app = Flask(__name__)
+
+# Results of repeated submissions are served from the cache until the bundle changes
+result_cache = cache_from_env()
+
+# Concurrent /api/predict requests are scored together as one matrix
+scheduler = MicroBatchScheduler(lambda users: predict_health_risks_batch(users, factor_ids=True))
+
+def _wants_factor_ids():
+    # Clients that cache the factor catalogue ask for IDs with ?factors=ids
+    return request.args.get('factors') == 'ids'
+
+def _predict_one(user_data):
+    # Profiled requests are scored on their own thread so the profile shows the
+    # models rather than the wait for the batch scheduler
+    if is_profiling():
+        return predict_health_risks_batch([user_data], factor_ids=True)[0]
+    return scheduler.predict(user_data)
+
+@app.route('/api/predict', methods=['POST'])
+@instrument('/api/predict')
+@profiled('/api/predict')
+def api_predict():
+    try:
+        # Decode, coerce and validate the request in one pass, deriving BMI
+        user_data, errors = QUESTIONNAIRE.decode(request.get_data(), request.content_type)
+        if errors:
+            return flask_response({'error': 'Invalid input', 'errors': errors}, 400)
+        
+        # Make predictions, reusing the result of an identical submission
+        predictions = result_cache.get_or_compute(
+            user_data, get_model_bundle()['version'], lambda: _predict_one(user_data)
+        )
+        
+        # Rank each score among the stored submissions
+        predictions = annotate_percentiles([predictions], [user_data])[0]
+        
+        # Attach the factor text unless the client resolves IDs from /api/factors
+        if not _wants_factor_ids():
+            predictions = materialize_prediction(predictions)
+        
+        return flask_response(predictions)
+    
+    except Exception as e:
+        # Invalid input is reported above, so anything raised here is a server error
+        record_error('/api/predict', e)
+        return flask_response({'error': str(e)}, 500)
+
+@app.route('/api/predict/batch', methods=['POST'])
+@instrument('/api/predict/batch')
+def api_predict_batch():
+    try:
+        # Accept either a list of users or {"users": [...]}
+        users, errors = QUESTIONNAIRE.decode_many(request.get_data(), request.content_type)
+        if errors:
+            return flask_response({'error': 'Invalid input', 'errors': errors}, 400)
+        
+        # Make predictions for the whole batch at once
+        predictions = annotate_percentiles(predict_health_risks_batch(users, factor_ids=_wants_factor_ids()), users)
+        
+        return flask_response({'predictions': predictions})
+    
+    except Exception as e:
+        record_error('/api/predict/batch', e)
+        return flask_response({'error': str(e)}, 500)
+
+@app.route('/api/factors', methods=['GET'])
+def api_factors():
+    return jsonify({'factors': factor_catalogue()})
+
+@app.route('/api/cache', methods=['GET'])
+def api_cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/api/batching', methods=['GET'])
+def api_batching_stats():
+    return jsonify(scheduler.stats())
+
+@app.route('/metrics', methods=['GET'])
+def api_metrics():
+    return flask_metrics_response()
@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+
+# Process-wide registry for a model artifact on disk
+# The artifact is loaded lazily once per worker and reloaded when its file
+# changes, so deploying a new artifact does not require restarting workers
+
+class ModelRegistry:
+    """
+    Lazily loads a model artifact once per process and hot reloads it when the file changes
+    The file's mtime is checked at most once every check_interval seconds
+    """
+    def __init__(self, path, loader, check_interval=1.0):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._value = None
+        self._mtime = None
+        self._last_check = None
+
+        # Load metrics
+        self.load_count = 0
+        self.error_count = 0
+        self.last_load_seconds = None
+        self.total_load_seconds = 0.0
+        self.loaded_at = None
+        self.last_error = None
+
+    def get(self):
+        """
+        Return the loaded artifact, or None if it does not exist yet
+        """
+        value = self._value
+        last_check = self._last_check
+        if last_check is not None and time.monotonic() - last_check < self.check_interval:
+            return value
+
+        with self._lock:
+            # Another thread may have checked while we waited for the lock
+            if self._last_check is not None and time.monotonic() - self._last_check < self.check_interval:
+                return self._value
+
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+
+            if mtime is not None and mtime != self._mtime:
+                self._load(mtime)
+
+            self._last_check = time.monotonic()
+            return self._value
+
+    def _load(self, mtime):
+        start = time.perf_counter()
+        try:
+            value = self.loader(self.path)
+        except Exception as e:
+            # Keep serving the previous artifact if a new one fails to load
+            self.error_count += 1
+            self.last_error = str(e)
+            return
+
+        elapsed = time.perf_counter() - start
+        self._value = value
+        self._mtime = mtime
+        self.load_count += 1
+        self.last_load_seconds = elapsed
+        self.total_load_seconds += elapsed
+        self.loaded_at = time.time()
+        self.last_error = None
+
+    def reload(self):
+        """
+        Force the next get() to check the artifact file again
+        """
+        with self._lock:
+            self._last_check = None
+            self._mtime = None
+
+    def stats(self):
+        """
+        Return load metrics for monitoring
+        """
+        return {
+            'path': self.path,
+            'loaded': self._value is not None,
+            'load_count': self.load_count,
+            'error_count': self.error_count,
+            'last_load_seconds': self.last_load_seconds,
+            'total_load_seconds': self.total_load_seconds,
+            'loaded_at': self.loaded_at,
+            'last_error': self.last_error
+        }
@@ -1,20 +1,89 @@
+import os
+import sys
+import copy
+import math
+import time
+import json
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import joblib
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 
+from factors import factor_id, factor_entry, materialize_predictions
+from metrics import STAGE_SECONDS, MODEL_SECONDS
+from sketches import load_population
+from submissions import LIST_FEATURES
+
 # In a real implementation, this would be a trained model
 # For demonstration purposes, we'll create a simple model
 
+# The fitted scaler, models and feature columns are exported together as one
+# versioned artifact by `python predict.py train` and loaded by the API, so
+# importing this module no longer trains anything
+MODEL_BUNDLE_FORMAT = 1
+MODEL_BUNDLE_PATH = os.environ.get(
+    'MODEL_BUNDLE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'health_models.joblib')
+)
+
+# Threads used inside the RandomForest models (None = sklearn default of one)
+MODEL_N_JOBS = int(os.environ['MODEL_N_JOBS']) if os.environ.get('MODEL_N_JOBS') else None
+
+# 'compiled' scores small batches with the flat-array trees of tree_compile.py
+# instead of sklearn's predict_proba, with identical probabilities; batches
+# larger than COMPILED_MAX_ROWS are faster through sklearn and still use it
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'sklearn')
+COMPILED_MAX_ROWS = int(os.environ.get('COMPILED_MAX_ROWS', 128))
+
+# Opt-in early-exit scoring: every model scores with its first CASCADE_TREES
+# trees and only evaluates the rest for users whose risk bucket (RISK_BOUNDARIES,
+# the Low/Moderate/High cut-offs of the results page) the remaining trees could
+# still change, going by the smallest and largest leaf of each remaining tree.
+# Users exiting early keep their exact bucket and get an estimate of their risk
+# points; at the default 90 of 100 trees most users exit. Setting CASCADE_TOLERANCE
+# also lets users exit when only a final probability within that distance of a
+# boundary could change their bucket, which is faster but can change buckets;
+# measure it with `python predict.py cascade-report` first
+CASCADE_ENABLED = os.environ.get('CASCADE_ENABLED', '').lower() in ('1', 'true', 'yes')
+CASCADE_TREES = int(os.environ.get('CASCADE_TREES', 90))
+CASCADE_TOLERANCE = float(os.environ['CASCADE_TOLERANCE']) if os.environ.get('CASCADE_TOLERANCE') else None
+RISK_BOUNDARIES = (0.25, 0.5)
+
+# Levels of each categorical input, one-hot encoded as '<feature>_<level>' columns
+CATEGORICAL_FEATURES = {
+    'gender': ['male', 'female'],
+    'sleep_quality': ['poor', 'fair', 'average', 'good', 'excellent'],
+    'diet_type': ['balanced', 'vegetarian', 'vegan', 'keto', 'paleo', 'mediterranean', 'high-protein'],
+    'water_intake': ['low', 'moderate', 'high'],
+    'smoking_status': ['non-smoker', 'former-smoker', 'occasional', 'regular'],
+    'alcohol_consumption': ['none', 'occasional', 'moderate', 'heavy'],
+    'anxiety_frequency': ['rarely', 'sometimes', 'often', 'constantly'],
+    'depression_frequency': ['rarely', 'sometimes', 'often', 'constantly'],
+    'social_connections': ['limited', 'moderate', 'strong', 'very-strong'],
+    'work_life_balance': ['poor', 'fair', 'moderate', 'good', 'excellent'],
+    'mindfulness_practice': ['never', 'occasionally', 'weekly', 'daily'],
+    'blood_pressure': ['low', 'normal', 'elevated', 'high-stage1', 'high-stage2', 'unknown'],
+    'cholesterol_levels': ['normal', 'borderline', 'high', 'unknown']
+}
+
 # Function to generate synthetic lifestyle data
 def generate_synthetic_data(n_samples=1000):
     np.random.seed(42)
     
     # Generate features
     age = np.random.randint(18, 80, n_samples)
-    gender = np.random.choice(['male', 'female'], n_samples)
+    gender = np.random.choice(CATEGORICAL_FEATURES['gender'], n_samples)
     weight = np.random.normal(70, 15, n_samples)  # in kg
     height = np.random.normal(170, 10, n_samples)  # in cm
     
@@ -36,36 +105,36 @@ def generate_synthetic_data(n_samples=1000):
     sleep_hours = np.clip(sleep_hours, 3, 12)
     
     # Sleep quality
-    sleep_quality = np.random.choice(['poor', 'fair', 'average', 'good', 'excellent'], n_samples)
+    sleep_quality = np.random.choice(CATEGORICAL_FEATURES['sleep_quality'], n_samples)
     
     # Diet quality (1-10)
     diet_quality = np.random.randint(1, 11, n_samples)
     
     # Diet type
-    diet_type = np.random.choice(['balanced', 'vegetarian', 'vegan', 'keto', 'paleo', 'mediterranean', 'high-protein'], n_samples)
+    diet_type = np.random.choice(CATEGORICAL_FEATURES['diet_type'], n_samples)
     
     # Water intake
-    water_intake = np.random.choice(['low', 'moderate', 'high'], n_samples)
+    water_intake = np.random.choice(CATEGORICAL_FEATURES['water_intake'], n_samples)
     
     # Stress level (1-10)
     stress_level = np.random.randint(1, 11, n_samples)
     
     # Smoking status
-    smoking_status = np.random.choice(['non-smoker', 'former-smoker', 'occasional', 'regular'], n_samples)
+    smoking_status = np.random.choice(CATEGORICAL_FEATURES['smoking_status'], n_samples)
     
     # Alcohol consumption
-    alcohol_consumption = np.random.choice(['none', 'occasional', 'moderate', 'heavy'], n_samples)
+    alcohol_consumption = np.random.choice(CATEGORICAL_FEATURES['alcohol_consumption'], n_samples)
     
     # Mental health indicators
-    anxiety_frequency = np.random.choice(['rarely', 'sometimes', 'often', 'constantly'], n_samples)
-    depression_frequency = np.random.choice(['rarely', 'sometimes', 'often', 'constantly'], n_samples)
-    social_connections = np.random.choice(['limited', 'moderate', 'strong', 'very-strong'], n_samples)
-    work_life_balance = np.random.choice(['poor', 'fair', 'moderate', 'good', 'excellent'], n_samples)
-    mindfulness_practice = np.random.choice(['never', 'occasionally', 'weekly', 'daily'], n_samples)
+    anxiety_frequency = np.random.choice(CATEGORICAL_FEATURES['anxiety_frequency'], n_samples)
+    depression_frequency = np.random.choice(CATEGORICAL_FEATURES['depression_frequency'], n_samples)
+    social_connections = np.random.choice(CATEGORICAL_FEATURES['social_connections'], n_samples)
+    work_life_balance = np.random.choice(CATEGORICAL_FEATURES['work_life_balance'], n_samples)
+    mindfulness_practice = np.random.choice(CATEGORICAL_FEATURES['mindfulness_practice'], n_samples)
     
     # Physical health indicators
-    blood_pressure = np.random.choice(['low', 'normal', 'elevated', 'high-stage1', 'high-stage2', 'unknown'], n_samples)
-    cholesterol_levels = np.random.choice(['normal', 'borderline', 'high', 'unknown'], n_samples)
+    blood_pressure = np.random.choice(CATEGORICAL_FEATURES['blood_pressure'], n_samples)
+    cholesterol_levels = np.random.choice(CATEGORICAL_FEATURES['cholesterol_levels'], n_samples)
     
     # Family history (binary indicators)
     family_heart_disease = np.random.choice([0, 1], n_samples)
@@ -129,6 +198,42 @@ def generate_synthetic_data(n_samples=1000):
         'condition_depression': condition_depression
     })
     
+    return _add_risk_labels(data)
+
+
+
+def _add_risk_labels(data):
+    """
+    Add the binary risk targets computed from the generated features
+    """
+    age = data['age']
+    bmi = data['bmi']
+    exercise_frequency = data['exercise_frequency']
+    exercise_types_cardio = data['exercise_types_cardio']
+    sleep_hours = data['sleep_hours']
+    sleep_quality = data['sleep_quality']
+    diet_quality = data['diet_quality']
+    diet_type = data['diet_type']
+    water_intake = data['water_intake']
+    stress_level = data['stress_level']
+    smoking_status = data['smoking_status']
+    alcohol_consumption = data['alcohol_consumption']
+    anxiety_frequency = data['anxiety_frequency']
+    depression_frequency = data['depression_frequency']
+    social_connections = data['social_connections']
+    work_life_balance = data['work_life_balance']
+    mindfulness_practice = data['mindfulness_practice']
+    blood_pressure = data['blood_pressure']
+    cholesterol_levels = data['cholesterol_levels']
+    family_heart_disease = data['family_heart_disease']
+    family_diabetes = data['family_diabetes']
+    family_stroke = data['family_stroke']
+    family_mental_health = data['family_mental_health']
+    condition_diabetes = data['condition_diabetes']
+    condition_heart_disease = data['condition_heart_disease']
+    condition_anxiety = data['condition_anxiety']
+    condition_depression = data['condition_depression']
+    
     # Generate target variables (health risks)
     # These are more comprehensive models incorporating the new variables
     
@@ -196,391 +301,1066 @@ def generate_synthetic_data(n_samples=1000):
     
     return data
 
-# Generate synthetic data
-data = generate_synthetic_data(1000)
-
-# Prepare features and targets
-X = data.drop(['cardiovascular_risk', 'metabolic_risk', 'sleep_risk', 'mental_risk'], axis=1)
-y_cardio = data['cardiovascular_risk']
-y_metabolic = data['metabolic_risk']
-y_sleep = data['sleep_risk']
-y_mental = data['mental_risk']
-
-# Convert categorical variables to dummy variables
-X = pd.get_dummies(X)
-
-# Split data
-X_train, X_test, y_cardio_train, y_cardio_test = train_test_split(X, y_cardio, test_size=0.2, random_state=42)
-_, _, y_metabolic_train, y_metabolic_test = train_test_split(X, y_metabolic, test_size=0.2, random_state=42)
-_, _, y_sleep_train, y_sleep_test = train_test_split(X, y_sleep, test_size=0.2, random_state=42)
-_, _, y_mental_train, y_mental_test = train_test_split(X, y_mental, test_size=0.2, random_state=42)
-
-# Scale features
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-# Train models
-models = {
-    'cardiovascular': RandomForestClassifier(n_estimators=100, random_state=42),
-    'metabolic': GradientBoostingClassifier(n_estimators=100, random_state=42),
-    'sleep': RandomForestClassifier(n_estimators=100, random_state=42),
-    'mental': GradientBoostingClassifier(n_estimators=100, random_state=42)
+# Categorical dtypes of the generated columns, with sorted levels so
+# get_dummies produces the same columns in the same order as for strings
+CATEGORICAL_DTYPES = {
+    feature: pd.CategoricalDtype(sorted(levels)) for feature, levels in CATEGORICAL_FEATURES.items()
 }
 
-# Train each model
-models['cardiovascular'].fit(X_train_scaled, y_cardio_train)
-models['metabolic'].fit(X_train_scaled, y_metabolic_train)
-models['sleep'].fit(X_train_scaled, y_sleep_train)
-models['mental'].fit(X_train_scaled, y_mental_train)
-
-# Evaluate models
-for name, model in models.items():
-    if name == 'cardiovascular':
-        y_test = y_cardio_test
-    elif name == 'metabolic':
-        y_test = y_metabolic_test
-    elif name == 'sleep':
-        y_test = y_sleep_test
-    else:  # mental
-        y_test = y_mental_test
-    
-    y_pred = model.predict(X_test_scaled)
-    accuracy = accuracy_score(y_test, y_pred)
-    print(f"{name.capitalize()} Model Accuracy: {accuracy:.4f}")
-    print(classification_report(y_test, y_pred))
-    print()
+def iter_synthetic_data(n_samples, chunk_size=100000, seed=42):
+    """
+    Yield synthetic lifestyle data in DataFrames of at most chunk_size rows
+    Uses a local random Generator and categorical columns instead of Python strings,
+    so tens of millions of rows can be produced in bounded memory. The risk targets
+    use the same formulas as generate_synthetic_data (the random draws differ).
+    """
+    rng = np.random.default_rng(seed)
+    
+    exercise_type_features = list(LIST_FEATURES['exerciseTypes'].values())
+    history_features = list(LIST_FEATURES['familyHistory'].values()) + list(LIST_FEATURES['existingConditions'].values())
+    
+    for start in range(0, n_samples, chunk_size):
+        n = min(chunk_size, n_samples - start)
+        
+        def categorical(feature):
+            # Draw uniformly over the levels, directly as category codes
+            dtype = CATEGORICAL_DTYPES[feature]
+            return pd.Categorical.from_codes(rng.integers(0, len(dtype.categories), n, dtype=np.int8), dtype=dtype)
+        
+        def binary():
+            return rng.integers(0, 2, n, dtype=np.int8)
+        
+        # Columns are generated in the same order as generate_synthetic_data
+        weight = rng.normal(70, 15, n)  # in kg
+        height = rng.normal(170, 10, n)  # in cm
+        columns = {
+            'age': rng.integers(18, 80, n, dtype=np.int16),
+            'gender': categorical('gender'),
+            'weight': weight,
+            'height': height,
+            'bmi': weight / ((height / 100) ** 2),
+            'exercise_frequency': rng.integers(0, 8, n, dtype=np.int8)
+        }
+        for feature in exercise_type_features:
+            columns[feature] = binary()
+        columns['sleep_hours'] = np.clip(rng.normal(7, 1.5, n), 3, 12)
+        columns['sleep_quality'] = categorical('sleep_quality')
+        columns['diet_quality'] = rng.integers(1, 11, n, dtype=np.int8)
+        columns['diet_type'] = categorical('diet_type')
+        columns['water_intake'] = categorical('water_intake')
+        columns['stress_level'] = rng.integers(1, 11, n, dtype=np.int8)
+        for feature in ['smoking_status', 'alcohol_consumption', 'anxiety_frequency', 'depression_frequency',
+                        'social_connections', 'work_life_balance', 'mindfulness_practice',
+                        'blood_pressure', 'cholesterol_levels']:
+            columns[feature] = categorical(feature)
+        for feature in history_features:
+            columns[feature] = binary()
+        
+        yield _add_risk_labels(pd.DataFrame(columns))
 
-# Function to predict health risks for a new user
-def predict_health_risks(user_data):
+def write_synthetic_data(output, n_samples, chunk_size=100000, seed=42):
     """
-    Predict health risks based on user data
-    This function is enhanced to handle the new physical and mental health inputs
+    Write synthetic data to a CSV or Parquet file one chunk at a time
+    Returns the number of rows written
     """
-    # Convert to DataFrame
-    user_df = pd.DataFrame([user_data])
-    
-    # Process exercise types if provided
-    if 'exerciseTypes' in user_data:
-        exercise_types = user_data['exerciseTypes']
-        user_df['exercise_types_cardio'] = 1 if 'Cardio' in exercise_types else 0
-        user_df['exercise_types_strength'] = 1 if 'Strength Training' in exercise_types else 0
-        user_df['exercise_types_flexibility'] = 1 if 'Flexibility/Yoga' in exercise_types else 0
-        user_df['exercise_types_sports'] = 1 if 'Sports' in exercise_types else 0
-        user_df['exercise_types_walking'] = 1 if 'Walking' in exercise_types else 0
-    
-    # Process family history if provided
-    if 'familyHistory' in user_data:
-        family_history = user_data['familyHistory']
-        user_df['family_heart_disease'] = 1 if 'Heart Disease' in family_history else 0
-        user_df['family_diabetes'] = 1 if 'Diabetes' in family_history else 0
-        user_df['family_cancer'] = 1 if 'Cancer' in family_history else 0
-        user_df['family_hypertension'] = 1 if 'High Blood Pressure' in family_history else 0
-        user_df['family_stroke'] = 1 if 'Stroke' in family_history else 0
-        user_df['family_mental_health'] = 1 if 'Mental Health Conditions' in family_history else 0
-    
-    # Process existing conditions if provided
-    if 'existingConditions' in user_data:
-        conditions = user_data['existingConditions']
-        user_df['condition_diabetes'] = 1 if 'Diabetes' in conditions else 0
-        user_df['condition_hypertension'] = 1 if 'Hypertension' in conditions else 0
-        user_df['condition_heart_disease'] = 1 if 'Heart Disease' in conditions else 0
-        user_df['condition_asthma'] = 1 if 'Asthma' in conditions else 0
-        user_df['condition_arthritis'] = 1 if 'Arthritis' in conditions else 0
-        user_df['condition_thyroid'] = 1 if 'Thyroid Disorder' in conditions else 0
-        user_df['condition_anxiety'] = 1 if 'Anxiety Disorder' in conditions else 0
-        user_df['condition_depression'] = 1 if 'Depression' in conditions else 0
-    
-    # Convert categorical variables
-    user_df = pd.get_dummies(user_df)
-    
-    # Ensure all columns from training are present
-    for col in X.columns:
-        if col not in user_df.columns:
-            user_df[col] = 0
-    
-    # Keep only columns used during training
-    user_df = user_df[X.columns]
+    rows = 0
+    if output.endswith('.parquet'):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        writer = None
+        try:
+            for chunk in iter_synthetic_data(n_samples, chunk_size, seed):
+                table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(output, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for i, chunk in enumerate(iter_synthetic_data(n_samples, chunk_size, seed)):
+            chunk.to_csv(output, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            rows += len(chunk)
+    return rows
+
+# Target column of each risk model in the training data
+MODEL_TARGETS = {
+    'cardiovascular': 'cardiovascular_risk',
+    'metabolic': 'metabolic_risk',
+    'sleep': 'sleep_risk',
+    'mental': 'mental_risk'
+}
+
+def build_models(n_jobs=MODEL_N_JOBS):
+    """
+    Create the unfitted risk models
+    """
+    return {
+        'cardiovascular': RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs),
+        'metabolic': GradientBoostingClassifier(n_estimators=100, random_state=42),
+        'sleep': RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs),
+        'mental': GradientBoostingClassifier(n_estimators=100, random_state=42)
+    }
+
+def _fit_model(model, X, y):
+    # Fit one model and time it, run concurrently by fit_models
+    start = time.perf_counter()
+    model.fit(X, y)
+    return model, time.perf_counter() - start
+
+def fit_models(models, X, targets, fit_jobs=len(MODEL_TARGETS)):
+    """
+    Fit the models concurrently on the same scaled features
+    targets maps each model name to its labels
+    Returns the fitted models and the fit wall time of each model in seconds
+    """
+    # Tree building releases the GIL, so threads fit the models in parallel
+    # without copying the training data into other processes
+    names = list(models)
+    results = joblib.Parallel(n_jobs=fit_jobs, prefer='threads')(
+        joblib.delayed(_fit_model)(models[name], X, targets[name]) for name in names
+    )
+    fitted = {name: model for name, (model, _) in zip(names, results)}
+    fit_seconds = {name: seconds for name, (_, seconds) in zip(names, results)}
+    return fitted, fit_seconds
+
+# Function to train the four risk models
+def train_models(n_samples=1000, verbose=True, n_jobs=MODEL_N_JOBS, fit_jobs=len(MODEL_TARGETS), data=None):
+    """
+    Train the risk models on synthetic data, or on data when given
+    Returns a model bundle with the fitted scaler, models and feature columns
+    """
+    # Generate synthetic data
+    if data is None:
+        data = generate_synthetic_data(n_samples)
+    
+    # Prepare features and targets
+    targets = [MODEL_TARGETS[name] for name in MODEL_TARGETS]
+    X = data.drop(targets, axis=1)
+    Y = data[targets]
+    
+    # Convert categorical variables to dummy variables
+    X = pd.get_dummies(X)
+    
+    # Split data once for all models
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.2, random_state=42)
     
     # Scale features
-    user_scaled = scaler.transform(user_df)
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    
+    # Train models
+    models, fit_seconds = fit_models(
+        build_models(n_jobs),
+        X_train_scaled,
+        {name: Y_train[target] for name, target in MODEL_TARGETS.items()},
+        fit_jobs
+    )
+    
+    # Evaluate models
+    if verbose:
+        for name, model in models.items():
+            y_test = Y_test[MODEL_TARGETS[name]]
+            y_pred = model.predict(X_test_scaled)
+            accuracy = accuracy_score(y_test, y_pred)
+            print(f"{name.capitalize()} Model Accuracy: {accuracy:.4f} (fit in {fit_seconds[name]:.2f}s)")
+            print(classification_report(y_test, y_pred))
+            print()
+    
+    bundle = {
+        'format': MODEL_BUNDLE_FORMAT,
+        'version': datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+        'sklearn_version': sklearn.__version__,
+        'scaler': scaler,
+        'models': models,
+        'feature_columns': list(X.columns),
+        'fit_seconds': fit_seconds
+    }
+    return _prepare_bundle(bundle)
+
+def update_models(bundle, data, extra_trees=20, fit_jobs=len(MODEL_TARGETS), verbose=True):
+    """
+    Grow the RandomForest models of a bundle with extra trees fitted on new labelled data
+    Existing trees and the fitted scaler are kept; the GradientBoosting models are unchanged
+    Returns a new bundle with a new version
+    """
+    targets = [MODEL_TARGETS[name] for name in MODEL_TARGETS]
+    
+    # Encode the new rows with the bundle's training columns and scaler
+    X_new = pd.get_dummies(data.drop(targets, axis=1))
+    X_new = X_new.reindex(columns=bundle['feature_columns'], fill_value=0).fillna(0)
+    X_new_scaled = bundle['scaler'].transform(X_new)
+    
+    # warm_start makes fit() keep the existing trees and only build the new ones
+    # The models are copied so the bundle being served is left untouched
+    models = {}
+    new_targets = {}
+    for name, model in bundle['models'].items():
+        if not isinstance(model, RandomForestClassifier):
+            continue
+        y_new = data[MODEL_TARGETS[name]]
+        if set(np.unique(y_new)) != set(model.classes_):
+            raise ValueError(f"New data for the {name} model must contain every class in {list(model.classes_)}")
+        model = copy.copy(model)
+        model.estimators_ = list(model.estimators_)
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + extra_trees)
+        models[name] = model
+        new_targets[name] = y_new
+    
+    fitted, fit_seconds = fit_models(models, X_new_scaled, new_targets, fit_jobs)
     
-    # Make predictions
-    predictions = {}
+    if verbose:
+        for name, seconds in fit_seconds.items():
+            print(f"{name.capitalize()} Model: added {extra_trees} trees in {seconds:.2f}s")
+    
+    updated = {k: v for k, v in bundle.items() if k not in _RUNTIME_BUNDLE_KEYS}
+    updated['models'] = dict(bundle['models'], **fitted)
+    updated['version'] = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    updated['fit_seconds'] = fit_seconds
+    return _prepare_bundle(updated)
+
+# Bundle entries derived at load time rather than stored in the artifact
+_RUNTIME_BUNDLE_KEYS = ('encoder', 'feature_profiles', 'compiled')
+
+# Number of most important features considered when picking recommendations
+TOP_FEATURES = 8  # Get more features to generate more recommendations
+
+# Recommendation families of each model and the top features that enable them
+RECOMMENDATION_FEATURE_RULES = {
+    'cardiovascular': {
+        'exercise': lambda f: 'exercise' in f,
+        'blood_pressure': lambda f: 'blood_pressure' in f,
+        'family_history': lambda f: 'family' in f and ('heart' in f or 'stroke' in f)
+    },
+    'metabolic': {
+        'diet': lambda f: 'diet' in f,
+        'water': lambda f: 'water' in f,
+        'cholesterol': lambda f: 'cholesterol' in f
+    },
+    'sleep': {
+        'sleep_quality': lambda f: 'sleep_quality' in f,
+        'stress': lambda f: 'stress' in f or 'anxiety' in f,
+        'sleep_hours': lambda f: 'sleep_hours' in f
+    },
+    'mental': {
+        'social': lambda f: 'social' in f,
+        'mindfulness': lambda f: 'mindfulness' in f,
+        'work_life': lambda f: 'work_life' in f
+    }
+}
+
+def build_feature_profiles(models, feature_columns, top_k=TOP_FEATURES):
+    """
+    Precompute each model's top features and recommendation flags
+    Feature importances are static for a fitted model but costly to compute,
+    so this runs once per bundle instead of once per request
+    """
+    profiles = {}
     for name, model in models.items():
-        # Get probability of high risk (class 1)
-        prob = model.predict_proba(user_scaled)[0][1]
-        risk_percentage = int(prob * 100)
-        
-        # Get feature importances for this model
-        importances = model.feature_importances_
-        feature_importance = dict(zip(X.columns, importances))
-        
         # Sort features by importance
+        feature_importance = dict(zip(feature_columns, model.feature_importances_))
         sorted_features = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)
-        top_features = sorted_features[:8]  # Get more features to generate more recommendations
+        top_features = sorted_features[:top_k]
         
-        # Generate recommendations based on top features and new inputs
-        recommendations = []
-        
-        # Cardiovascular recommendations
-        if name == 'cardiovascular':
-            if any(f for f, _ in top_features if 'exercise' in f):
-                if user_data.get('exerciseFrequency', '') in ['sedentary', 'light'] or user_data.get('exercise_frequency', 0) < 3:
-                    recommendations.append({
-                        "name": "Exercise",
-                        "impact": "High negative impact",
-                        "suggestion": "Aim for at least 150 minutes of moderate aerobic activity weekly"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Exercise",
-                        "impact": "High positive impact",
-                        "suggestion": "Continue your regular exercise routine"
-                    })
-            
-            if any(f for f, _ in top_features if 'blood_pressure' in f):
-                if user_data.get('bloodPressure', '') in ['high-stage1', 'high-stage2']:
-                    recommendations.append({
-                        "name": "Blood Pressure",
-                        "impact": "High negative impact",
-                        "suggestion": "Consult with a healthcare provider about managing your blood pressure"
-                    })
+        rules = RECOMMENDATION_FEATURE_RULES.get(name, {})
+        profiles[name] = {
+            'top_features': top_features,
+            'flags': {family: any(rule(f) for f, _ in top_features) for family, rule in rules.items()}
+        }
+    return profiles
+
+def _prepare_bundle(bundle):
+    """
+    Build the runtime helpers of a model bundle
+    """
+    bundle['encoder'] = FeatureEncoder(bundle['feature_columns'], bundle['scaler'])
+    
+    # Serving artifacts carry their compiled trees and feature profiles instead of the models
+    if 'models' not in bundle:
+        return bundle
+    
+    bundle['feature_profiles'] = build_feature_profiles(bundle['models'], bundle['feature_columns'])
+    if MODEL_N_JOBS is not None:
+        set_model_n_jobs(bundle, MODEL_N_JOBS)
+    set_inference_backend(bundle, INFERENCE_BACKEND)
+    return bundle
+
+def set_inference_backend(bundle, backend):
+    """
+    Select how the models of a bundle are evaluated, 'sklearn' or 'compiled'
+    """
+    if 'models' not in bundle:
+        if backend != 'compiled':
+            raise ValueError("Serving artifacts only support the compiled inference backend")
+        return bundle
+    if backend == 'compiled':
+        if 'compiled' not in bundle:
+            from tree_compile import compile_models
+            bundle['compiled'] = compile_models(bundle['models'])
+    elif backend == 'sklearn':
+        bundle.pop('compiled', None)
+    else:
+        raise ValueError(f"Unknown inference backend {backend!r}")
+    return bundle
+
+def set_model_n_jobs(bundle, n_jobs):
+    """
+    Set the number of threads used for tree parallelism by the models that support it
+    Only worth raising for large batches; single-row predictions are faster with one thread
+    """
+    for model in bundle.get('models', {}).values():
+        if hasattr(model, 'n_jobs'):
+            model.n_jobs = n_jobs
+    return bundle
+
+def save_model_bundle(bundle, path=MODEL_BUNDLE_PATH):
+    """
+    Write a model bundle to disk
+    The artifact is left uncompressed so its arrays can be memory-mapped on load
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    
+    # Write to a temporary file first so running workers never see a partial artifact
+    tmp_path = path + '.tmp'
+    joblib.dump({k: v for k, v in bundle.items() if k not in _RUNTIME_BUNDLE_KEYS}, tmp_path)
+    os.replace(tmp_path, path)
+    
+    return path
+
+def load_model_bundle(path=MODEL_BUNDLE_PATH, mmap_mode='r'):
+    """
+    Load a model bundle written by save_model_bundle, or a serving artifact
+    written by save_serving_artifact (see serving_artifact.py)
+    """
+    from serving_artifact import is_serving_artifact, load_serving_artifact
+    if is_serving_artifact(path):
+        return _prepare_bundle(load_serving_artifact(path))
+    
+    bundle = joblib.load(path, mmap_mode=mmap_mode)
+    
+    if not isinstance(bundle, dict) or bundle.get('format') != MODEL_BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported model bundle format in {path}")
+    
+    if bundle.get('sklearn_version') != sklearn.__version__:
+        print(f"Warning: model bundle was trained with scikit-learn {bundle.get('sklearn_version')}, "
+              f"running {sklearn.__version__}", file=sys.stderr)
+    
+    return _prepare_bundle(bundle)
+
+# Model bundle used by the API, loaded once per process on first use
+_model_bundle = None
+_model_bundle_lock = threading.Lock()
+
+def get_model_bundle():
+    """
+    Return the process-wide model bundle, loading it on first use
+    """
+    global _model_bundle
+    if _model_bundle is None:
+        with _model_bundle_lock:
+            if _model_bundle is None:
+                if os.path.exists(MODEL_BUNDLE_PATH):
+                    _model_bundle = load_model_bundle(MODEL_BUNDLE_PATH)
                 else:
-                    recommendations.append({
-                        "name": "Blood Pressure",
-                        "impact": "Low positive impact",
-                        "suggestion": "Continue monitoring your blood pressure regularly"
-                    })
-            
-            if any(f for f, _ in top_features if 'family' in f and ('heart' in f or 'stroke' in f)):
-                recommendations.append({
-                    "name": "Family History",
-                    "impact": "Medium negative impact",
-                    "suggestion": "Given your family history, regular cardiovascular checkups are recommended"
-                })
+                    # No exported artifact yet, fall back to training in-process
+                    print(f"Model bundle not found at {MODEL_BUNDLE_PATH}, training in-process. "
+                          f"Run `python predict.py train` to export one.", file=sys.stderr)
+                    _model_bundle = train_models(verbose=False)
+    return _model_bundle
+
+# Function to convert raw user inputs into model feature columns
+def _to_float(value):
+    # Numeric inputs may arrive as strings from the questionnaire
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return value if math.isfinite(value) else 0.0
+
+class FeatureEncoder:
+    """
+    Encodes raw user inputs straight into scaled float32 model rows
+    Built once per model bundle from the training columns and the fitted scaler
+    """
+    def __init__(self, feature_columns, scaler=None):
+        self.feature_columns = list(feature_columns)
+        self.n_features = len(self.feature_columns)
+        column_index = {col: i for i, col in enumerate(self.feature_columns)}
         
-        # Metabolic recommendations
-        elif name == 'metabolic':
-            if any(f for f, _ in top_features if 'diet' in f):
-                if user_data.get('dietType', '') in ['balanced', 'mediterranean']:
-                    recommendations.append({
-                        "name": "Diet",
-                        "impact": "High positive impact",
-                        "suggestion": "Your diet choice is beneficial for metabolic health"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Diet",
-                        "impact": "Medium negative impact",
-                        "suggestion": "Consider a more balanced diet with less processed foods"
-                    })
-            
-            if any(f for f, _ in top_features if 'water' in f):
-                if user_data.get('waterIntake', '') == 'low':
-                    recommendations.append({
-                        "name": "Hydration",
-                        "impact": "Medium negative impact",
-                        "suggestion": "Increase water intake to at least 8 glasses daily"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Hydration",
-                        "impact": "Medium positive impact",
-                        "suggestion": "Continue with good hydration habits"
-                    })
-            
-            if any(f for f, _ in top_features if 'cholesterol' in f):
-                if user_data.get('cholesterolLevels', '') in ['high', 'borderline']:
-                    recommendations.append({
-                        "name": "Cholesterol",
-                        "impact": "Medium negative impact",
-                        "suggestion": "Consider dietary changes to improve cholesterol levels"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Cholesterol",
-                        "impact": "Low positive impact",
-                        "suggestion": "Maintain your healthy cholesterol levels"
-                    })
+        # Categorical inputs map each level to the index of its dummy column
+        self.categorical_index = {}
+        dummy_columns = set()
+        for feature, levels in CATEGORICAL_FEATURES.items():
+            level_index = {}
+            for level in levels:
+                col = f'{feature}_{level}'
+                if col in column_index:
+                    level_index[level] = column_index[col]
+                    dummy_columns.add(col)
+            self.categorical_index[feature] = level_index
         
-        # Sleep recommendations
-        elif name == 'sleep':
-            if any(f for f, _ in top_features if 'sleep_quality' in f):
-                if user_data.get('sleepQuality', '') in ['poor', 'fair']:
-                    recommendations.append({
-                        "name": "Sleep Environment",
-                        "impact": "High negative impact",
-                        "suggestion": "Create a dark, quiet, and cool sleeping environment"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Sleep Environment",
-                        "impact": "Medium positive impact",
-                        "suggestion": "Maintain your comfortable sleep environment"
-                    })
-            
-            if any(f for f, _ in top_features if 'stress' in f or 'anxiety' in f):
-                if user_data.get('stressLevel', 0) > 6 or user_data.get('anxietyFrequency', '') in ['often', 'constantly']:
-                    recommendations.append({
-                        "name": "Stress Management",
-                        "impact": "High negative impact",
-                        "suggestion": "Try meditation or deep breathing before sleep"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Stress Management",
-                        "impact": "Medium positive impact",
-                        "suggestion": "Continue your effective stress management techniques"
-                    })
-            
-            if any(f for f, _ in top_features if 'sleep_hours' in f):
-                sleep_hours = user_data.get('sleepHours', 7)
-                if sleep_hours < 6 or sleep_hours > 9:
-                    recommendations.append({
-                        "name": "Sleep Duration",
-                        "impact": "Medium negative impact",
-                        "suggestion": f"Aim for 7-8 hours of sleep instead of your current {sleep_hours} hours"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Sleep Duration",
-                        "impact": "Medium positive impact",
-                        "suggestion": "Your sleep duration is in the optimal range"
-                    })
+        # Every other training column is a numeric input copied as-is
+        self.numeric_index = {col: i for col, i in column_index.items() if col not in dummy_columns}
         
-        # Mental health recommendations
-        elif name == 'mental':
-            if any(f for f, _ in top_features if 'social' in f):
-                if user_data.get('socialConnections', '') in ['limited', 'moderate']:
-                    recommendations.append({
-                        "name": "Social Connection",
-                        "impact": "Medium negative impact",
-                        "suggestion": "Try to increase meaningful social interactions weekly"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Social Connection",
-                        "impact": "High positive impact",
-                        "suggestion": "Continue maintaining your strong social connections"
-                    })
-            
-            if any(f for f, _ in top_features if 'mindfulness' in f):
-                if user_data.get('mindfulnessPractice', '') in ['never', 'occasionally']:
-                    recommendations.append({
-                        "name": "Mindfulness",
-                        "impact": "Medium negative impact",
-                        "suggestion": "Consider adding daily mindfulness practice to your routine"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Mindfulness",
-                        "impact": "High positive impact",
-                        "suggestion": "Continue your regular mindfulness practice"
-                    })
-            
-            if any(f for f, _ in top_features if 'work_life' in f):
-                if user_data.get('workLifeBalance', '') in ['poor', 'fair']:
-                    recommendations.append({
-                        "name": "Work-Life Balance",
-                        "impact": "High negative impact",
-                        "suggestion": "Set clear boundaries between work and personal time"
-                    })
-                else:
-                    recommendations.append({
-                        "name": "Work-Life Balance",
-                        "impact": "Medium positive impact",
-                        "suggestion": "Your balance is good; continue prioritizing personal time"
-                    })
+        # List inputs reset their whole indicator group and set one column per selected item
+        self.list_index = {}
+        for feature, items in LIST_FEATURES.items():
+            item_index = {item: column_index[col] for item, col in items.items() if col in column_index}
+            self.list_index[feature] = (np.array(sorted(item_index.values()), dtype=np.intp), item_index)
         
-        # Add generic recommendations if we don't have enough specific ones
-        if len(recommendations) < 5:
-            if name == 'cardiovascular' and not any(r["name"] == "Diet" for r in recommendations):
-                recommendations.append({
-                    "name": "Diet",
-                    "impact": "Medium impact",
-                    "suggestion": "A diet low in sodium and saturated fat is beneficial for heart health"
-                })
-            
-            if name == 'metabolic' and not any(r["name"] == "Exercise" for r in recommendations):
-                recommendations.append({
-                    "name": "Exercise",
-                    "impact": "Medium impact",
-                    "suggestion": "Regular physical activity improves metabolic health"
-                })
-            
-            if name == 'sleep' and not any(r["name"] == "Evening Routine" for r in recommendations):
-                recommendations.append({
-                    "name": "Evening Routine",
-                    "impact": "Medium impact",
-                    "suggestion": "Establish a consistent pre-sleep routine to improve sleep quality"
-                })
-            
-            if name == 'mental' and not any(r["name"] == "Physical Activity" for r in recommendations):
-                recommendations.append({
-                    "name": "Physical Activity",
-                    "impact": "Medium impact",
-                    "suggestion": "Regular exercise can significantly improve mood and reduce anxiety"
-                })
+        if scaler is not None:
+            self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+            self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        else:
+            self.mean = None
+            self.scale = None
         
-        # Limit to top 5 recommendations
-        recommendations = recommendations[:5]
+        self._local = threading.local()
+    
+    def _buffers(self, n_rows):
+        # Per-thread preallocated float64 work matrix and float32 output matrix, grown on demand
+        local = self._local
+        if getattr(local, 'rows', 0) < n_rows:
+            local.work = np.empty((n_rows, self.n_features), dtype=np.float64)
+            local.out = np.empty((n_rows, self.n_features), dtype=np.float32)
+            local.rows = n_rows
+        return local.work[:n_rows], local.out[:n_rows]
+    
+    def encode_row(self, user_data, row):
+        """
+        Write the unscaled features of one user into row
+        """
+        row[:] = 0
+        numeric_index = self.numeric_index
+        categorical_index = self.categorical_index
+        for key, value in user_data.items():
+            idx = numeric_index.get(key)
+            if idx is not None:
+                if value is not None and not isinstance(value, (list, dict)):
+                    row[idx] = _to_float(value)
+                continue
+            level_index = categorical_index.get(key)
+            if level_index is not None and isinstance(value, str):
+                idx = level_index.get(value)
+                if idx is not None:
+                    row[idx] = 1.0
         
-        predictions[name] = {
-            "risk": risk_percentage,
-            "factors": recommendations
-        }
+        for key, (group, item_index) in self.list_index.items():
+            items = user_data.get(key)
+            if items is None:
+                continue
+            row[group] = 0
+            for item in items:
+                idx = item_index.get(item)
+                if idx is not None:
+                    row[idx] = 1.0
+        return row
+    
+    def encode(self, users, out=None):
+        """
+        Encode a list of users into an unscaled float64 matrix
+        """
+        if out is None:
+            out = np.empty((len(users), self.n_features), dtype=np.float64)
+        for user_data, row in zip(users, out):
+            self.encode_row(user_data, row)
+        return out
     
-    return predictions
-
-# Example usage
-example_user = {
-    'age': 45,
-    'gender': 'male',
-    'weight': 85,
-    'height': 175,
-    'bmi': 85 / ((175 / 100) ** 2),
-    'exercise_frequency': 2,
-    'sleep_hours': 6,
-    'diet_quality': 6,
-    'stress_level': 7,
-    'smoking_status': 'former-smoker',
-    'alcohol_consumption': 'moderate'
+    def transform(self, users, reuse_buffers=False):
+        """
+        Encode and scale a list of users, equivalent to get_dummies plus scaler.transform
+        Returns float32, the dtype the tree models evaluate on
+        With reuse_buffers the result is a per-thread buffer overwritten by the next call
+        """
+        if reuse_buffers:
+            work, out = self._buffers(len(users))
+        else:
+            work = None
+            out = np.empty((len(users), self.n_features), dtype=np.float32)
+        
+        with STAGE_SECONDS.time('encode'):
+            X = self.encode(users, work)
+        
+        # Scale in float64 like StandardScaler so the float32 rows match sklearn exactly
+        with STAGE_SECONDS.time('scale'):
+            if self.mean is not None:
+                X -= self.mean
+                X /= self.scale
+            np.copyto(out, X, casting='same_kind')
+        return out
+
+# Recommendation rules of each model, as (feature flag, condition, factor if true, factor if false)
+# A rule applies when its family is among the model's top features (see RECOMMENDATION_FEATURE_RULES)
+RECOMMENDATION_RULES = {
+    'cardiovascular': [
+        ('exercise',
+         lambda u: u.get('exerciseFrequency', '') in ['sedentary', 'light'] or u.get('exercise_frequency', 0) < 3,
+         'exercise.aerobic_weekly', 'exercise.regular'),
+        ('blood_pressure', lambda u: u.get('bloodPressure', '') in ['high-stage1', 'high-stage2'],
+         'blood_pressure.consult', 'blood_pressure.monitor'),
+        ('family_history', None, 'family_history.given', None)
+    ],
+    'metabolic': [
+        ('diet', lambda u: u.get('dietType', '') in ['balanced', 'mediterranean'],
+         'diet.metabolic_choice', 'diet.less_processed'),
+        ('water', lambda u: u.get('waterIntake', '') == 'low', 'hydration.increase', 'hydration.good'),
+        ('cholesterol', lambda u: u.get('cholesterolLevels', '') in ['high', 'borderline'],
+         'cholesterol.diet', 'cholesterol.maintain_low')
+    ],
+    'sleep': [
+        ('sleep_quality', lambda u: u.get('sleepQuality', '') in ['poor', 'fair'],
+         'sleep_environment.improve', 'sleep_environment.maintain'),
+        ('stress', lambda u: u.get('stressLevel', 0) > 6 or u.get('anxietyFrequency', '') in ['often', 'constantly'],
+         'stress.before_sleep', 'stress.techniques'),
+        ('sleep_hours', lambda u: u.get('sleepHours', 7) < 6 or u.get('sleepHours', 7) > 9,
+         'sleep_duration.adjust', 'sleep_duration.optimal_range')
+    ],
+    'mental': [
+        ('social', lambda u: u.get('socialConnections', '') in ['limited', 'moderate'],
+         'social_connection.increase', 'social_connection.strong'),
+        ('mindfulness', lambda u: u.get('mindfulnessPractice', '') in ['never', 'occasionally'],
+         'mindfulness.add_daily', 'mindfulness.regular'),
+        ('work_life', lambda u: u.get('workLifeBalance', '') in ['poor', 'fair'],
+         'work_life.clear_boundaries', 'work_life.good')
+    ]
+}
+
+# Generic recommendation added when a model has fewer than 5 specific ones
+GENERIC_RECOMMENDATIONS = {
+    'cardiovascular': 'diet.heart_generic',
+    'metabolic': 'exercise.metabolic_generic',
+    'sleep': 'evening_routine.generic',
+    'mental': 'physical_activity.generic'
+}
+
+# The rules with the factor keys resolved to catalogue IDs
+_RECOMMENDATION_ID_RULES = {
+    name: [
+        (family, condition, factor_id(if_true), factor_id(if_false) if if_false else None)
+        for family, condition, if_true, if_false in rules
+    ]
+    for name, rules in RECOMMENDATION_RULES.items()
 }
+_GENERIC_RECOMMENDATION_IDS = {name: factor_id(key) for name, key in GENERIC_RECOMMENDATIONS.items()}
 
-# Get predictions
-predictions = predict_health_risks(example_user)
-print("Health Risk Predictions:")
-for category, result in predictions.items():
-    print(f"\n{category.capitalize()} Risk: {result['risk']}%")
-    print("Key Factors:")
-    for factor in result['factors']:
-        print(f"  - {factor['name']}: {factor['impact']}")
-        print(f"    Suggestion: {factor['suggestion']}")
+def _build_recommendations(name, user_data, flags):
+    """
+    Pick the recommendations for one model from its feature flags and the user inputs
+    Returns catalogue IDs (see factors.py)
+    """
+    recommendations = []
+    for family, condition, if_true, if_false in _RECOMMENDATION_ID_RULES.get(name, []):
+        if not flags[family]:
+            continue
+        if condition is None or condition(user_data):
+            recommendations.append(if_true)
+        elif if_false is not None:
+            recommendations.append(if_false)
+    
+    # Add generic recommendations if we don't have enough specific ones
+    if len(recommendations) < 5 and name in _GENERIC_RECOMMENDATION_IDS:
+        recommendations.append(_GENERIC_RECOMMENDATION_IDS[name])
+    
+    # Limit to top 5 recommendations
+    return recommendations[:5]
 
-# Example Flask API to serve the model
-from flask import Flask, request, jsonify
+# Models compiled for the cascade of the last bundle scored with the sklearn backend
+_cascade_compiled = (None, None)
 
-app = Flask(__name__)
+def _cascade_models(bundle):
+    global _cascade_compiled
+    # Compiled trees for the cascade, without switching the bundle's inference backend
+    if 'compiled' in bundle:
+        return bundle['compiled']
+    models, compiled = _cascade_compiled
+    if models is not bundle['models']:
+        from tree_compile import compile_models
+        compiled = compile_models(bundle['models'])
+        _cascade_compiled = (bundle['models'], compiled)
+    return compiled
 
-@app.route('/api/predict', methods=['POST'])
-def api_predict():
-    try:
-        # Get data from request
-        user_data = request.json
+# Function to predict health risks for a batch of users
+def predict_health_risks_batch(users, bundle=None, factor_ids=False, cascade=None):
+    """
+    Predict health risks for a list of users
+    All users are encoded into one matrix and each model is evaluated once for the whole batch
+    With factor_ids the recommendations are returned as catalogue IDs (see factors.py)
+    cascade enables early-exit scoring (default: CASCADE_ENABLED)
+    """
+    if bundle is None:
+        bundle = get_model_bundle()
+    models = bundle.get('models')
+    feature_profiles = bundle['feature_profiles']
+    if cascade is None:
+        cascade = CASCADE_ENABLED
+    
+    if not users:
+        return []
+    
+    # Encode and scale all users at once into the reusable per-thread buffers
+    users_scaled = bundle['encoder'].transform(users, reuse_buffers=True)
+    
+    # Small batches are faster through the compiled trees, when enabled;
+    # the cascade and serving artifacts always run on them
+    if cascade or models is None:
+        compiled = _cascade_models(bundle)
+    else:
+        compiled = bundle.get('compiled') if len(users) <= COMPILED_MAX_ROWS else None
+    
+    predictions = [{} for _ in users]
+    recommendation_seconds = 0.0
+    for name in (models if models is not None else compiled):
+        # Get probability of high risk (class 1) for every user
+        with MODEL_SECONDS.time(name):
+            if cascade:
+                probs, _ = compiled[name].predict_positive_cascade(
+                    users_scaled, CASCADE_TREES, CASCADE_TOLERANCE, RISK_BOUNDARIES
+                )
+            elif compiled is not None:
+                probs = compiled[name].predict_positive(users_scaled)
+            else:
+                probs = models[name].predict_proba(users_scaled)[:, 1]
+        
+        # Recommendation families enabled by this model's top features
+        flags = feature_profiles[name]['flags']
+        
+        start = time.perf_counter()
+        for user_data, prob, user_predictions in zip(users, probs, predictions):
+            user_predictions[name] = factor_entry(
+                int(prob * 100),
+                _build_recommendations(name, user_data, flags),
+                {'sleep_hours': user_data.get('sleepHours', 7)}
+            )
+        recommendation_seconds += time.perf_counter() - start
+    
+    STAGE_SECONDS.observe(recommendation_seconds, 'recommendations')
+    
+    if factor_ids:
+        return predictions
+    with STAGE_SECONDS.time('materialize'):
+        return materialize_predictions(predictions)
+
+# Function to predict health risks for a new user
+def predict_health_risks(user_data, bundle=None, factor_ids=False, cascade=None):
+    """
+    Predict health risks based on user data
+    This function is enhanced to handle the new physical and mental health inputs
+    """
+    return predict_health_risks_batch([user_data], bundle, factor_ids, cascade)[0]
+
+def _risk_bucket(probs, boundaries=RISK_BOUNDARIES):
+    # Bucket of each risk score, as the results page buckets int(prob * 100)
+    scores = (np.asarray(probs) * 100).astype(int)
+    return np.searchsorted(np.array(boundaries) * 100, scores, side='right')
+
+def _synthetic_features(bundle, n_samples, seed):
+    # Fresh synthetic rows encoded and scaled the way train_models does
+    data = next(iter_synthetic_data(n_samples, chunk_size=n_samples, seed=seed))
+    X = pd.get_dummies(data.drop(list(MODEL_TARGETS.values()), axis=1))
+    X = X.reindex(columns=bundle['feature_columns'], fill_value=0).astype(np.float64)
+    return bundle['scaler'].transform(X).astype(np.float32)
+
+def cascade_report(bundle=None, n_samples=10000, first_trees=CASCADE_TREES, tolerance=CASCADE_TOLERANCE, seed=7):
+    """
+    Compare cascade scoring against the full ensembles on fresh synthetic users
+    Returns, per model, the share of users that exited early, the share whose risk
+    bucket is unchanged, the mean and max absolute risk difference in points and
+    the speedup over scoring every tree with the compiled models
+    """
+    if bundle is None:
+        bundle = get_model_bundle()
+    compiled = _cascade_models(bundle)
+    X = _synthetic_features(bundle, n_samples, seed)
+    
+    report = {}
+    for name, ensemble in compiled.items():
+        start = time.perf_counter()
+        full = ensemble.predict_positive(X)
+        full_seconds = time.perf_counter() - start
         
-        # Calculate BMI if not provided
-        if 'bmi' not in user_data and 'weight' in user_data and 'height' in user_data:
-            user_data['bmi'] = user_data['weight'] / ((user_data['height'] / 100) ** 2)
+        start = time.perf_counter()
+        probs, exited = ensemble.predict_positive_cascade(X, first_trees, tolerance, RISK_BOUNDARIES)
+        cascade_seconds = time.perf_counter() - start
         
-        # Make predictions
-        predictions = predict_health_risks(user_data)
+        difference = np.abs((probs * 100).astype(int) - (full * 100).astype(int))
+        report[name] = {
+            'early_exit_rate': float(exited.mean()),
+            'bucket_agreement': float((_risk_bucket(probs) == _risk_bucket(full)).mean()),
+            'mean_abs_risk_difference': float(difference.mean()),
+            'max_abs_risk_difference': int(difference.max()),
+            'speedup': full_seconds / cascade_seconds
+        }
+    return report
+
+def _process_memory():
+    # Resident and proportional (shared pages split between processes) set sizes in MB
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    memory[key.lower() + '_mb'] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        memory['rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return memory
+
+def _memory_worker(path, barrier, results):
+    baseline = _process_memory()
+    bundle = load_model_bundle(path)
+    predict_health_risks({'age': 45, 'gender': 'male', 'weight': 85, 'height': 175}, bundle)
+    # Measure once every worker has loaded its copy, so shared pages are split between them
+    barrier.wait()
+    memory = _process_memory()
+    # Memory taken by the loaded models, over the interpreter and libraries imported before
+    results.put(memory | {'models_' + key: memory[key] - value for key, value in baseline.items()})
+    barrier.wait()
+
+def measure_worker_memory(path, workers=2):
+    """
+    Load an artifact in concurrent fresh worker processes and return their average memory use
+    The models_ entries are the increase over each worker's memory before loading;
+    the totals are dominated by the interpreter, numpy, pandas and sklearn
+    """
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_memory_worker, args=(path, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {key: sum(m[key] for m in measurements) / workers for key in measurements[0]}
+
+def serving_artifact_report(bundle_path, artifact_path, n_samples=10000, workers=2, seed=7):
+    """
+    Compare a serving artifact with the model bundle it was exported from
+    Reports the file sizes; per model the share of users whose probabilities agree
+    within SERVING_PROBABILITY_TOLERANCE (the float32 leaf values rule out exact
+    equality), the share with identical risk scores and risk buckets and the largest
+    probability difference; and the memory of each of `workers` concurrent workers
+    holding each artifact
+    """
+    from serving_artifact import SERVING_PROBABILITY_TOLERANCE
+    
+    bundle = load_model_bundle(bundle_path)
+    serving = load_model_bundle(artifact_path)
+    X = _synthetic_features(bundle, n_samples, seed)
+    X_serving = _synthetic_features(serving, n_samples, seed)
+    
+    report = {
+        'bundle_bytes': os.path.getsize(bundle_path),
+        'artifact_bytes': os.path.getsize(artifact_path),
+        'features': {'bundle': len(bundle['feature_columns']), 'artifact': len(serving['feature_columns'])},
+        'probability_tolerance': SERVING_PROBABILITY_TOLERANCE,
+        'models': {}
+    }
+    for name, model in bundle['models'].items():
+        full = model.predict_proba(X)[:, 1]
+        quantized = serving['compiled'][name].predict_positive(X_serving)
+        difference = np.abs(full - quantized)
+        report['models'][name] = {
+            'probability_agreement': float((difference <= SERVING_PROBABILITY_TOLERANCE).mean()),
+            'max_abs_probability_difference': float(difference.max()),
+            'risk_agreement': float(((full * 100).astype(int) == (quantized * 100).astype(int)).mean()),
+            'bucket_agreement': float((_risk_bucket(full) == _risk_bucket(quantized)).mean())
+        }
+    
+    if workers:
+        report['worker_memory'] = {
+            'bundle': measure_worker_memory(bundle_path, workers),
+            'artifact': measure_worker_memory(artifact_path, workers)
+        }
+    return report
+
+# Bulk scoring of stored submissions
+class _JsonlWriter:
+    def __init__(self, output):
+        self._file = sys.stdout if output == '-' else open(output, 'w', encoding='utf-8')
+    
+    def write(self, submissions, predictions):
+        lines = []
+        for submission, user_predictions in zip(submissions, predictions):
+            lines.append(json.dumps({
+                'id': submission.get('id'),
+                'timestamp': submission.get('timestamp'),
+                'predictions': user_predictions
+            }))
+        self._file.write('\n'.join(lines) + '\n')
+    
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+class _ParquetWriter:
+    def __init__(self, output):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self._pa = pyarrow
+        self._output = output
+        self._writer = None
+    
+    def write(self, submissions, predictions):
+        pa = self._pa
+        columns = {
+            'id': [submission.get('id') for submission in submissions],
+            'timestamp': [submission.get('timestamp') for submission in submissions]
+        }
+        for name in predictions[0]:
+            columns[f'{name}_risk'] = [user_predictions[name]['risk'] for user_predictions in predictions]
+        columns['predictions'] = [json.dumps(user_predictions) for user_predictions in predictions]
+        table = pa.table(columns)
         
-        return jsonify(predictions)
+        # Each chunk becomes a row group so the file is never held in memory
+        if self._writer is None:
+            self._writer = pa.parquet.ParquetWriter(self._output, table.schema)
+        self._writer.write_table(table)
+    
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def _init_scoring_worker(bundle, bundle_path, n_jobs):
+    global _model_bundle
+    # A bundle passed by the caller is inherited by forked workers and pickled for spawned ones
+    if bundle is not None:
+        _model_bundle = bundle
+    # Forked workers inherit the parent's bundle copy-on-write; spawned ones load it from disk
+    elif _model_bundle is None:
+        if os.path.exists(bundle_path):
+            _model_bundle = load_model_bundle(bundle_path)
+        else:
+            _model_bundle = get_model_bundle()
+    set_model_n_jobs(_model_bundle, n_jobs)
+
+def _score_paths(paths):
+    # Runs in a worker process: read, normalize and score one chunk of submission files
+    from submissions import iter_submissions
+    
+    errors = []
+    submissions = list(iter_submissions(paths, errors))
+    predictions = predict_health_risks_batch(submissions, _model_bundle) if submissions else []
+    
+    # Only send back what the writers need
+    keys = [{'id': submission.get('id'), 'timestamp': submission.get('timestamp')} for submission in submissions]
+    return keys, predictions, errors
+
+def _score_chunks_parallel(paths, chunk_size, workers, n_jobs, bundle=None):
+    """
+    Score chunks of submission paths in a process pool, yielding results in input order
+    Only file paths are sent to the workers, which score them with the given bundle
+    or else the parent's model bundle
+    """
+    # Load the bundle before the pool starts so forked workers share its memory
+    if bundle is None:
+        get_model_bundle()
+    
+    from submissions import chunked
+    
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_scoring_worker,
+                             initargs=(bundle, MODEL_BUNDLE_PATH, n_jobs)) as executor:
+        # Keep a bounded number of chunks in flight so memory does not grow with the directory
+        pending = deque()
+        for chunk in chunked(paths, chunk_size):
+            pending.append(executor.submit(_score_paths, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def score_directory(directory, output='-', output_format='jsonl', chunk_size=256, bundle=None,
+                    workers=1, n_jobs=1):
+    """
+    Score every submission stored in a directory with the batch prediction path
+    Files are streamed and scored chunk by chunk, so memory use does not grow with the directory
+    With workers > 1 chunks are scored in parallel worker processes
+    Returns the number of scored submissions and the list of (path, error) for skipped files
+    """
+    # Local import so the API does not depend on the submission store helpers
+    from submissions import iter_submission_paths, iter_submissions, chunked
+    
+    if output_format == 'parquet':
+        writer = _ParquetWriter(output)
+    else:
+        writer = _JsonlWriter(output)
+    
+    errors = []
+    scored = 0
+    try:
+        paths = iter_submission_paths(directory)
+        if workers > 1:
+            for keys, predictions, chunk_errors in _score_chunks_parallel(paths, chunk_size, workers, n_jobs, bundle):
+                errors.extend(chunk_errors)
+                if keys:
+                    writer.write(keys, predictions)
+                    scored += len(keys)
+        else:
+            if bundle is None:
+                bundle = get_model_bundle()
+            if n_jobs is not None:
+                set_model_n_jobs(bundle, n_jobs)
+            for chunk in chunked(iter_submissions(paths, errors), chunk_size):
+                writer.write(chunk, predict_health_risks_batch(chunk, bundle))
+                scored += len(chunk)
+    finally:
+        writer.close()
+    
+    return scored, errors
+
+# Quantile sketches of the stored submissions' scores, built by `python sketches.py build --engine model`
+_population = None
+
+def get_population():
+    """
+    Return the population sketches of the serving bundle's scores, or None
+    They are loaded on first use and again when the bundle version changes
+    """
+    global _population
+    version = f"model-{get_model_bundle()['version']}"
+    if _population is None or _population[0] != version:
+        _population = (version, load_population('model', version))
+    return _population[1]
+
+def annotate_percentiles(predictions, users):
+    """
+    Add population percentiles to the predictions of a list of users, when sketches are available
+    """
+    population = get_population()
+    if population is None:
+        return predictions
+    return [population.annotate(prediction, user_data) for prediction, user_data in zip(predictions, users)]
+
+def run_example():
+    """
+    Print predictions for an example user
+    """
+    # Example usage
+    example_user = {
+        'age': 45,
+        'gender': 'male',
+        'weight': 85,
+        'height': 175,
+        'bmi': 85 / ((175 / 100) ** 2),
+        'exercise_frequency': 2,
+        'sleep_hours': 6,
+        'diet_quality': 6,
+        'stress_level': 7,
+        'smoking_status': 'former-smoker',
+        'alcohol_consumption': 'moderate'
+    }
+
+    # Get predictions
+    predictions = predict_health_risks(example_user)
+    print("Health Risk Predictions:")
+    for category, result in predictions.items():
+        print(f"\n{category.capitalize()} Risk: {result['risk']}%")
+        print("Key Factors:")
+        for factor in result['factors']:
+            print(f"  - {factor['name']}: {factor['impact']}")
+            print(f"    Suggestion: {factor['suggestion']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Health risk prediction models')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    train_parser = subparsers.add_parser('train', help='Train the models and export the model bundle')
+    train_parser.add_argument('--output', default=MODEL_BUNDLE_PATH, help='Path of the model bundle to write')
+    train_parser.add_argument('--samples', type=int, default=1000, help='Number of synthetic training rows')
+    train_parser.add_argument('--n-jobs', type=int, default=MODEL_N_JOBS, help='Threads used by the RandomForest models')
+    train_parser.add_argument('--seed', type=int, help='Train on the chunked synthetic generator with this seed')
+    train_parser.add_argument('--fit-jobs', type=int, default=len(MODEL_TARGETS), help='Models fitted concurrently')
     
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+    generate_parser = subparsers.add_parser('generate', help='Write synthetic training data in chunks')
+    generate_parser.add_argument('output', help='Output .csv or .parquet file')
+    generate_parser.add_argument('--samples', type=int, default=1000000, help='Number of rows')
+    generate_parser.add_argument('--chunk-size', type=int, default=100000, help='Rows generated at a time')
+    generate_parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    
+    score_parser = subparsers.add_parser('score-dir', help='Score every stored submission in a directory')
+    score_parser.add_argument('directory', help='Directory of submission JSON files, e.g. ../data')
+    score_parser.add_argument('--output', default='-', help='Output file, or - for stdout')
+    score_parser.add_argument('--format', choices=['jsonl', 'parquet'], help='Output format (default: from the output extension)')
+    score_parser.add_argument('--chunk-size', type=int, default=256, help='Submissions scored per batch')
+    score_parser.add_argument('--workers', type=int, default=1, help='Worker processes (default: 1, 0 for one per CPU)')
+    score_parser.add_argument('--n-jobs', type=int, default=1, help='Threads per model inside each worker')
+    
+    cascade_parser = subparsers.add_parser('cascade-report', help='Report the accuracy and speed of cascade scoring')
+    cascade_parser.add_argument('--samples', type=int, default=10000, help='Number of synthetic users scored')
+    cascade_parser.add_argument('--first-trees', type=int, default=CASCADE_TREES, help='Trees scored before exiting')
+    cascade_parser.add_argument('--tolerance', type=float, default=CASCADE_TOLERANCE,
+                                help='Also exit when only scores this close to a boundary could change bucket')
+    
+    export_parser = subparsers.add_parser('export-serving', help='Export a quantized, memory-mapped serving artifact')
+    export_parser.add_argument('output', help='Path of the serving artifact to write')
+    export_parser.add_argument('--bundle', default=MODEL_BUNDLE_PATH, help='Model bundle to export')
+    export_parser.add_argument('--samples', type=int, default=10000, help='Synthetic users compared after export')
+    export_parser.add_argument('--workers', type=int, default=2, help='Concurrent workers measured for memory, 0 to skip')
+    
+    subparsers.add_parser('serve', help='Run the development API server')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'train':
+        data = None
+        if args.seed is not None:
+            data = pd.concat(iter_synthetic_data(args.samples, seed=args.seed), ignore_index=True)
+        bundle = train_models(args.samples, n_jobs=args.n_jobs, fit_jobs=args.fit_jobs, data=data)
+        path = save_model_bundle(bundle, args.output)
+        print(f"Model bundle {bundle['version']} written to {path}")
+        return
+    
+    if args.command == 'generate':
+        try:
+            rows = write_synthetic_data(args.output, args.samples, args.chunk_size, args.seed)
+        except RuntimeError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"Wrote {rows} rows to {args.output}", file=sys.stderr)
+        return
+    
+    if args.command == 'score-dir':
+        output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'jsonl')
+        try:
+            workers = args.workers or os.cpu_count()
+            scored, errors = score_directory(args.directory, args.output, output_format, args.chunk_size,
+                                             workers=workers, n_jobs=args.n_jobs)
+        except RuntimeError as e:
+            parser.exit(1, f"{e}\n")
+        for path, error in errors:
+            print(f"Skipped {path}: {error}", file=sys.stderr)
+        print(f"Scored {scored} submissions", file=sys.stderr)
+        return
+    
+    if args.command == 'cascade-report':
+        report = cascade_report(n_samples=args.samples, first_trees=args.first_trees, tolerance=args.tolerance)
+        print(json.dumps(report, indent=2))
+        return
+    
+    if args.command == 'export-serving':
+        from serving_artifact import save_serving_artifact
+        save_serving_artifact(load_model_bundle(args.bundle), args.output)
+        report = serving_artifact_report(args.bundle, args.output, args.samples, args.workers)
+        print(json.dumps(report, indent=2))
+        return
+    
+    if args.command is None:
+        run_example()
+    # The Flask app is imported only here so the library does not need Flask
+    from model_api import app
+    app.run(debug=True)
 
 # Run the Flask app when executed directly
 if __name__ == '__main__':
-    app.run(debug=True)
+    main()
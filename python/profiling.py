@@ -0,0 +1,244 @@
+import os
+import sys
+import hmac
+import time
+import atexit
+import random
+import cProfile
+import pstats
+import tempfile
+import threading
+import functools
+from collections import Counter
+
+# On-demand profiling of live prediction requests
+# Disabled unless PROFILE_SAMPLE_RATE or PROFILE_TOKEN is set, in which case
+# views decorated with profiled() run a fraction of their requests, or those
+# sending the token in the X-Profile-Token header, under a profiler. Profiles
+# are aggregated per route and written to PROFILE_DIR as <route>.<pid>.pstats
+# (cProfile, for snakeviz or pstats) or <route>.<pid>.collapsed (stack sampling,
+# for flamegraph.pl or speedscope), every PROFILE_DUMP_EVERY profiled requests
+# and when the worker exits
+#
+# When profiling is disabled the decorator returns the view unchanged
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'health-profiles'))
+
+# 'cprofile' traces every call; 'sample' records the request thread's stack
+# every PROFILE_INTERVAL_MS, which costs far less on the profiled requests
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 1))
+PROFILE_DUMP_EVERY = int(os.environ.get('PROFILE_DUMP_EVERY', 50))
+
+def _route_slug(route):
+    return route.strip('/').replace('/', '_') or 'index'
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class _StackSampler:
+    """
+    Background thread recording the stacks of the threads serving profiled requests
+    """
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self.active = {}
+        self.stacks = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        # Started on first use, and again in forked workers
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name='profile-sampler', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def start(self, route):
+        self._ensure_started()
+        with self._lock:
+            self.active[threading.get_ident()] = route
+        self._wake.set()
+
+    def stop(self):
+        with self._lock:
+            self.active.pop(threading.get_ident(), None)
+            if not self.active:
+                self._wake.clear()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self.active.items())
+            frames = sys._current_frames()
+            for thread_id, route in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        self.stacks.setdefault(route, Counter())[';'.join(reversed(stack))] += 1
+
+    def collapsed(self, route):
+        with self._lock:
+            stacks = dict(self.stacks.get(route, {}))
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+def _token_bytes(token):
+    # Header values arrive as latin-1 decoded str (WSGI) or already as bytes
+    if isinstance(token, bytes):
+        return token
+    return token.encode('utf-8', 'surrogateescape')
+
+class RequestProfiler:
+    """
+    Decides which requests are profiled and aggregates their profiles per route
+    """
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, token=PROFILE_TOKEN, directory=PROFILE_DIR,
+                 mode=PROFILE_MODE, interval_ms=PROFILE_INTERVAL_MS, dump_every=PROFILE_DUMP_EVERY):
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError(f"Unknown profile mode {mode!r}")
+        self.sample_rate = sample_rate
+        self.token = token
+        self.directory = directory
+        self.mode = mode
+        self.dump_every = dump_every
+        self.sampler = _StackSampler(interval_ms) if mode == 'sample' else None
+
+        self._stats = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or bool(self.token)
+
+    def should_profile(self, token=None):
+        """
+        Whether to profile a request sending token in the profile header
+        """
+        # compare_digest only accepts ASCII str, so any header value is compared as bytes
+        if token and self.token and hmac.compare_digest(_token_bytes(token), _token_bytes(self.token)):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def is_profiling(self):
+        """
+        Whether the current thread is serving a profiled request
+        """
+        return getattr(self._local, 'active', False)
+
+    def profile(self, route, call):
+        """
+        Run call() under the profiler and aggregate its profile into route's
+        """
+        self._local.active = True
+        if self.sampler is not None:
+            self.sampler.start(route)
+            try:
+                return call()
+            finally:
+                self.sampler.stop()
+                self._local.active = False
+                self._finished(route)
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return call()
+        finally:
+            profile.disable()
+            self._local.active = False
+            with self._lock:
+                if route in self._stats:
+                    self._stats[route].add(profile)
+                else:
+                    self._stats[route] = pstats.Stats(profile)
+            self._finished(route)
+
+    def _finished(self, route):
+        with self._lock:
+            self._counts[route] += 1
+            due = self._counts[route] % self.dump_every == 0
+        if due:
+            self.dump(route)
+
+    def dump(self, route=None):
+        """
+        Write the aggregated profiles of route, or of every route, to the profile directory
+        Returns the paths written
+        """
+        with self._lock:
+            routes = [route] if route is not None else list(self._counts)
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for route in routes:
+            base = os.path.join(self.directory, f"{_route_slug(route)}.{os.getpid()}")
+            if self.sampler is not None:
+                path = base + '.collapsed'
+                with open(path + '.tmp', 'w') as f:
+                    f.write(self.sampler.collapsed(route))
+            else:
+                path = base + '.pstats'
+                with self._lock:
+                    stats = self._stats.get(route)
+                    if stats is None:
+                        continue
+                    stats.dump_stats(path + '.tmp')
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+        return paths
+
+    def stats(self):
+        """
+        Return the number of profiled requests per route
+        """
+        with self._lock:
+            return {'mode': self.mode, 'sample_rate': self.sample_rate, 'directory': self.directory,
+                    'profiled': dict(self._counts)}
+
+profiler = RequestProfiler()
+
+if profiler.enabled:
+    atexit.register(profiler.dump)
+
+def _request_token(args):
+    # Django views receive the request, Flask views read the context-local one
+    if args and hasattr(args[0], 'headers'):
+        return args[0].headers.get(PROFILE_HEADER)
+    from flask import request
+    return request.headers.get(PROFILE_HEADER)
+
+def profiled(route):
+    """
+    Decorate a Flask or Django view so its requests can be profiled
+    """
+    def decorator(view):
+        if not profiler.enabled:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _request_token(args) if profiler.token else None
+            if not profiler.should_profile(token):
+                return view(*args, **kwargs)
+            return profiler.profile(route, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+def is_profiling():
+    """
+    Whether the current thread is serving a profiled request
+    """
+    return profiler.is_profiling()
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from submissions import parse_number
+
+# Cache of prediction results keyed on the normalized user input
+# Users often resubmit the same questionnaire (shared results re-fetches,
+# retries), so identical inputs are answered without re-running the models
+
+# Fields that identify a submission but do not affect its predictions
+IGNORED_FIELDS = {'id', 'timestamp'}
+
+def canonical_key(user_data):
+    """
+    Hash a user input so equivalent submissions share a key
+    Numeric strings are coerced to numbers, list answers are sorted and
+    identifying fields are ignored
+    """
+    normalized = {}
+    for field, value in user_data.items():
+        if field in IGNORED_FIELDS:
+            continue
+        if isinstance(value, str):
+            number = parse_number(value)
+            if number is not None:
+                value = number
+        elif isinstance(value, list):
+            value = sorted(set(value), key=str)
+        normalized[field] = value
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a TTL, optionally backed by a SQLite file shared between workers
+    Entries belong to a model version; when the version changes the old entries are dropped
+    Cached values are shared between callers and must be treated as read-only
+    """
+    def __init__(self, maxsize=10000, ttl=3600, disk_path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.version = None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS results '
+                    '(key TEXT, version TEXT, created REAL, value TEXT, PRIMARY KEY (key, version))'
+                )
+
+    def _connection(self):
+        # One SQLite connection per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def _set_version(self, version):
+        # Called with the lock held
+        if version == self.version:
+            return
+        self.version = version
+        self._entries.clear()
+        # Rows of other versions are never read back; prune the expired ones
+        # rather than all of them, as other services may share the file
+        if self.disk_path:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM results WHERE created < ?', (time.time() - self.ttl,))
+
+    def get(self, key, version):
+        """
+        Return the cached value for key, or None
+        """
+        now = time.time()
+        with self._lock:
+            self._set_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.disk_path:
+            row = self._connection().execute(
+                'SELECT created, value FROM results WHERE key = ? AND version = ?', (key, str(version))
+            ).fetchone()
+            if row is not None and now - row[0] <= self.ttl:
+                value = json.loads(row[1])
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, row[0], value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, created, value):
+        # Called with the lock held
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key, version, value):
+        """
+        Cache value for key under version
+        """
+        created = time.time()
+        with self._lock:
+            self._set_version(version)
+            self._store(key, created, value)
+
+        if self.disk_path:
+            with self._connection() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO results (key, version, created, value) VALUES (?, ?, ?, ?)',
+                    (key, str(version), created, json.dumps(value))
+                )
+
+    def get_or_compute(self, user_data, version, compute):
+        """
+        Return the cached result for user_data, calling compute() on a miss
+        """
+        if self.maxsize <= 0:
+            return compute()
+        key = canonical_key(user_data)
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM results')
+
+    def stats(self):
+        """
+        Return the cache counters for monitoring
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'version': self.version,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+def cache_from_env(prefix='PREDICTION_CACHE'):
+    """
+    Build a ResultCache configured by <prefix>_SIZE, <prefix>_TTL and <prefix>_PATH
+    A size of 0 disables caching
+    """
+    return ResultCache(
+        maxsize=int(os.environ.get(f'{prefix}_SIZE', 10000)),
+        ttl=float(os.environ.get(f'{prefix}_TTL', 3600)),
+        disk_path=os.environ.get(f'{prefix}_PATH') or None
+    )
@@ -0,0 +1,232 @@
+import math
+
+from metrics import STAGE_SECONDS
+from serialization import loads
+from submissions import derive_model_inputs
+
+# Questionnaire schema shared by the prediction services
+# Mirrors healthDataSchema in lib/validation.ts: the field checks are compiled
+# once into per-field validators, and a request body is decoded, coerced,
+# defaulted and validated in a single pass that reports errors instead of raising
+
+def _number(value):
+    # Numeric answers arrive as strings from the questionnaire; they become an
+    # int when integral, while JSON numbers keep their type
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value if math.isfinite(value) else None
+    if not isinstance(value, str):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    if not math.isfinite(number):
+        return None
+    return int(number) if number.is_integer() else number
+
+# Returned by validators for values that fail their checks
+INVALID = object()
+
+class Field:
+    """
+    A questionnaire field
+    kind is 'number', 'string', 'level' (a string answer or its numeric score) or 'list';
+    number fields are bounded by minimum and maximum, exclusive when flagged
+    """
+    __slots__ = ('name', 'kind', 'message', 'required', 'default', 'minimum', 'maximum',
+                 'exclusive_minimum', 'exclusive_maximum')
+
+    def __init__(self, name, kind, message=None, required=False, default=None, minimum=None, maximum=None,
+                 exclusive_minimum=False, exclusive_maximum=False):
+        self.name = name
+        self.kind = kind
+        self.message = message or f"{name} is required"
+        self.required = required
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.exclusive_minimum = exclusive_minimum
+        self.exclusive_maximum = exclusive_maximum
+
+    def compile(self):
+        """
+        Build the validator of this field
+        It returns the coerced value, or INVALID when the value fails the checks
+        """
+        if self.kind == 'number':
+            low = -math.inf if self.minimum is None else self.minimum
+            high = math.inf if self.maximum is None else self.maximum
+            exclusive_low, exclusive_high = self.exclusive_minimum, self.exclusive_maximum
+
+            def validate(value):
+                number = value if type(value) is int else _number(value)
+                if (number is None or number < low or number > high
+                        or (exclusive_low and number == low) or (exclusive_high and number == high)):
+                    return INVALID
+                return number
+        elif self.kind in ('string', 'level'):
+            accepts_number = self.kind == 'level'
+
+            def validate(value):
+                if type(value) is str:
+                    return value if value else INVALID
+                if accepts_number and _number(value) is not None:
+                    return value
+                return INVALID
+        else:
+            def validate(value):
+                if type(value) is str:
+                    value = [value]
+                if type(value) is not list or not all(type(item) is str for item in value):
+                    return INVALID
+                return value
+        return validate
+
+# Fields of healthDataSchema, with the defaults the heuristic engine assumes
+# when an answer is missing (see heuristics._input_columns)
+QUESTIONNAIRE_FIELDS = [
+    Field('age', 'number', "Age must be a positive number between 0 and 120", required=True, default=30,
+          minimum=0, maximum=120),
+    Field('gender', 'string', "Gender is required", required=True),
+    Field('weight', 'number', "Weight must be a positive number (in kg)", required=True,
+          minimum=0, maximum=500, exclusive_minimum=True),
+    Field('heightFeet', 'number', "Height (feet) must be a positive number between 0 and 10", required=True,
+          minimum=0, maximum=10),
+    Field('heightInches', 'number', "Height (inches) must be a number between 0 and 11", required=True,
+          minimum=0, maximum=12, exclusive_maximum=True),
+    Field('exerciseFrequency', 'level', "Exercise frequency is required", required=True),
+    Field('exerciseTypes', 'list', "Exercise types must be a list of strings", default=[]),
+    Field('sleepHours', 'number', "Sleep hours must be a positive number between 0 and 24", required=True, default=7,
+          minimum=0, maximum=24),
+    Field('sleepQuality', 'string', "Sleep quality is required", required=True, default='average'),
+    Field('dietType', 'string', "Diet type is required", required=True),
+    Field('waterIntake', 'string', "Water intake is required", required=True, default='moderate'),
+    Field('stressLevel', 'number', "Stress level must be a number between 1 and 10", required=True, default=5,
+          minimum=1, maximum=10),
+    Field('smokingStatus', 'string', "Smoking status is required", required=True, default='non-smoker'),
+    Field('alcoholConsumption', 'string', "Alcohol consumption is required", required=True, default='occasional'),
+    Field('anxietyFrequency', 'string', "Anxiety frequency is required", required=True, default='sometimes'),
+    Field('depressionFrequency', 'string', "Depression frequency is required", required=True, default='sometimes'),
+    Field('socialConnections', 'string', "Social connections is required", required=True, default='moderate'),
+    Field('workLifeBalance', 'string', "Work-life balance is required", required=True, default='moderate'),
+    Field('mindfulnessPractice', 'string', "Mindfulness practice is required", required=True, default='never'),
+    Field('bloodPressure', 'string', "Blood pressure is required", required=True, default='normal'),
+    Field('cholesterolLevels', 'string', "Cholesterol levels is required", required=True, default='normal'),
+    Field('familyHistory', 'list', "Family history must be a list of strings", default=[]),
+    Field('existingConditions', 'list', "Existing conditions must be a list of strings", default=[]),
+
+    # Accepted by the Python services in addition to the questionnaire answers
+    Field('height', 'number', "Height must be a positive number (in cm)", minimum=0, maximum=300, exclusive_minimum=True),
+    Field('bmi', 'number', "BMI must be a positive number", minimum=0, exclusive_minimum=True)
+]
+
+class Schema:
+    """
+    A compiled set of fields
+    Fields that are not declared are passed through unchanged
+    """
+    def __init__(self, fields):
+        self.fields = {field.name: field for field in fields}
+        self._validators = [(field.name, field.compile()) for field in fields]
+        self._required = [field for field in fields if field.required]
+        self._defaults = [(field.name, field.default) for field in fields if field.default is not None]
+
+    def validate(self, data, partial=True, defaults=False):
+        """
+        Coerce and validate one input dict
+        Returns (data, errors) where errors maps field names to messages, as
+        validateHealthData does; data is a new dict with the coerced values
+        Missing required fields are only reported when partial is False, and
+        missing fields get their defaults when defaults is True
+        """
+        if not isinstance(data, dict):
+            return None, {'general': ["Expected a JSON object"]}
+
+        clean = dict(data)
+        errors = None
+        for name, validate in self._validators:
+            value = clean.get(name, INVALID)
+            if value is INVALID:
+                continue
+            coerced = validate(value)
+            if coerced is INVALID:
+                if errors is None:
+                    errors = {}
+                errors[name] = [self.fields[name].message]
+            elif coerced is not value:
+                clean[name] = coerced
+
+        if not partial:
+            for field in self._required:
+                if field.name not in clean:
+                    if errors is None:
+                        errors = {}
+                    errors[field.name] = [field.message]
+
+        if errors:
+            return None, errors
+
+        # Derive height, BMI and the model feature names as for stored submissions
+        derive_model_inputs(clean)
+
+        if defaults:
+            for name, default in self._defaults:
+                if name not in clean:
+                    clean[name] = list(default) if isinstance(default, list) else default
+
+        return clean, None
+
+    def validate_many(self, users, partial=True, defaults=False):
+        """
+        Validate a list of inputs, or {"users": [...]}
+        Errors are keyed by the position of the invalid inputs
+        """
+        if isinstance(users, dict):
+            users = users.get('users', [])
+        if not isinstance(users, list):
+            return None, {'general': ["Expected a list of users"]}
+
+        clean = []
+        errors = {}
+        for i, user_data in enumerate(users):
+            user_data, user_errors = self.validate(user_data, partial, defaults)
+            if user_errors:
+                errors[str(i)] = user_errors
+            clean.append(user_data)
+        if errors:
+            return None, errors
+        return clean, None
+
+    def decode(self, body, content_type=None, partial=True, defaults=False):
+        """
+        Decode a request body and validate it as one input
+        """
+        with STAGE_SECONDS.time('decode'):
+            data, errors = _decode(body, content_type)
+        if errors:
+            return None, errors
+        # Coercion, defaults and the derived model inputs
+        with STAGE_SECONDS.time('validate'):
+            return self.validate(data, partial, defaults)
+
+    def decode_many(self, body, content_type=None, partial=True, defaults=False):
+        """
+        Decode a request body and validate it as a list of inputs
+        """
+        with STAGE_SECONDS.time('decode'):
+            data, errors = _decode(body, content_type)
+        if errors:
+            return None, errors
+        with STAGE_SECONDS.time('validate'):
+            return self.validate_many(data, partial, defaults)
+
+def _decode(body, content_type):
+    try:
+        return loads(body, content_type or 'application/json'), None
+    except Exception as e:
+        # Decoders raise their own error types on malformed bodies
+        return None, {'general': [f"Invalid request body: {e}"]}
+
+QUESTIONNAIRE = Schema(QUESTIONNAIRE_FIELDS)
@@ -0,0 +1,151 @@
+import os
+import json
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+# Request and response serialization for the Flask and Django services
+# JSON goes through the fastest available encoder (orjson, then msgspec, then
+# the standard library) and internal callers may negotiate msgpack instead
+# through the Accept and Content-Type headers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = {MSGPACK_MIMETYPE, 'application/x-msgpack'}
+
+def _default(obj):
+    # numpy scalars and arrays come straight from the models
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def _select_json_backend():
+    backend = os.environ.get('SERIALIZER_BACKEND')
+    if backend is None:
+        backend = 'orjson' if orjson else 'msgspec' if msgspec else 'json'
+
+    if backend == 'orjson' and orjson:
+        options = orjson.OPT_SERIALIZE_NUMPY
+        return 'orjson', lambda obj: orjson.dumps(obj, default=_default, option=options), orjson.loads
+    if backend == 'msgspec' and msgspec:
+        encoder = msgspec.json.Encoder(enc_hook=_default)
+        decoder = msgspec.json.Decoder()
+        return 'msgspec', encoder.encode, decoder.decode
+    return 'json', lambda obj: json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8'), json.loads
+
+JSON_BACKEND, dumps_json, loads_json = _select_json_backend()
+
+if msgspec:
+    _msgpack_encoder = msgspec.msgpack.Encoder(enc_hook=_default)
+    dumps_msgpack = _msgpack_encoder.encode
+    loads_msgpack = msgspec.msgpack.Decoder().decode
+elif msgpack:
+    dumps_msgpack = lambda obj: msgpack.packb(obj, default=_default)
+    loads_msgpack = lambda data: msgpack.unpackb(data, raw=False)
+else:
+    dumps_msgpack = loads_msgpack = None
+
+if msgspec:
+    # Typed shapes of a prediction response, for callers decoding them
+    class Factor(msgspec.Struct):
+        name: str
+        impact: str
+        suggestion: str
+
+    class RiskPrediction(msgspec.Struct, omit_defaults=True):
+        risk: int
+        factors: list[Factor] = []
+        factor_ids: list[int] = []
+        factor_params: dict = {}
+        # Population percentiles, when sketches are available (see sketches.PopulationSketches.annotate)
+        percentile: float | None = None
+        cohort: str | None = None
+        cohort_percentile: float | None = None
+
+    class Prediction(msgspec.Struct, omit_defaults=True):
+        cardiovascular: RiskPrediction
+        metabolic: RiskPrediction
+        sleep: RiskPrediction
+        mental: RiskPrediction
+
+    class BatchPrediction(msgspec.Struct):
+        predictions: list[Prediction]
+
+def decode_prediction(data, content_type=JSON_MIMETYPE, batch=False):
+    """
+    Decode a prediction response
+    Returns typed structs when msgspec is installed and plain dicts otherwise
+    """
+    if msgspec:
+        target = BatchPrediction if batch else Prediction
+        if is_msgpack(content_type):
+            return msgspec.msgpack.decode(data, type=target)
+        return msgspec.json.decode(data, type=target)
+    return loads(data, content_type)
+
+def is_msgpack(content_type):
+    return bool(content_type) and content_type.split(';')[0].strip().lower() in MSGPACK_MIMETYPES
+
+def negotiate(accept):
+    """
+    Pick the response mimetype from an Accept header
+    msgpack is only used when it is asked for and an encoder is installed
+    """
+    if accept and dumps_msgpack and any(is_msgpack(part) for part in accept.split(',')):
+        return MSGPACK_MIMETYPE
+    return JSON_MIMETYPE
+
+def dumps(obj, mimetype=JSON_MIMETYPE):
+    """
+    Encode obj to bytes
+    """
+    with STAGE_SECONDS.time('serialize'):
+        if mimetype == MSGPACK_MIMETYPE:
+            return dumps_msgpack(obj)
+        return dumps_json(obj)
+
+def loads(data, content_type=JSON_MIMETYPE):
+    """
+    Decode a request body according to its Content-Type
+    Request handlers go through schema.QUESTIONNAIRE, which decodes with this
+    """
+    if is_msgpack(content_type):
+        if loads_msgpack is None:
+            raise ValueError("msgpack bodies require msgspec or msgpack (pip install msgspec)")
+        return loads_msgpack(data)
+    return loads_json(data)
+
+# Framework helpers
+def flask_response(obj, status=200):
+    """
+    Build a Flask response in the format negotiated with the current request
+    """
+    from flask import request, current_app
+    mimetype = negotiate(request.headers.get('Accept'))
+    return current_app.response_class(dumps(obj, mimetype), status=status, mimetype=mimetype)
+
+def django_response(request, obj, status=200):
+    """
+    Build a Django response in the format negotiated with request
+    """
+    from django.http import HttpResponse
+    mimetype = negotiate(request.headers.get('Accept'))
+    return HttpResponse(dumps(obj, mimetype), status=status, content_type=mimetype)
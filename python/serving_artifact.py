@@ -0,0 +1,188 @@
+import os
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from tree_compile import CompiledEnsemble, compile_models
+
+# Reduced-memory serving artifact for the risk models
+# Only what inference needs is kept: the compiled trees of tree_compile.py with
+# float32 thresholds and leaf values and int32 node and feature indices, the
+# scaler parameters of the features the trees split on, and the precomputed
+# feature profiles. The arrays are stored raw in one file and memory-mapped
+# read-only on load, so every worker on a host shares one physical copy
+#
+# Thresholds are rounded down to the largest float32 not above them: features
+# are float32, so x <= t and x <= float32(t) route every row the same way and
+# only the leaf values lose precision. Probabilities are therefore not expected
+# to equal predict_proba exactly: the rounded boosting stages move them by about
+# 1e-8, well within SERVING_PROBABILITY_TOLERANCE
+
+SERVING_ARTIFACT_MAGIC = b'HPSERVE1'
+SERVING_ARTIFACT_FORMAT = 2
+
+# Largest probability difference from the source models that counts as agreement
+SERVING_PROBABILITY_TOLERANCE = 1e-6
+
+# Arrays are aligned so they can be viewed in place
+_ALIGNMENT = 64
+
+_ENSEMBLE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_value', 'roots', 'tree_means')
+
+class ScalerParams:
+    """
+    Mean and scale of the fitted StandardScaler, for the columns kept in the artifact
+    """
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+def _round_down_float32(values):
+    # Largest float32 not above each float64 value
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+def quantize_bundle(bundle):
+    """
+    Build the arrays and header of a serving artifact from a model bundle
+    """
+    compiled = bundle.get('compiled') or compile_models(bundle['models'])
+
+    # Features split on by any tree; the others are dropped from the encoder too
+    used = np.unique(np.concatenate([
+        ensemble.feature[ensemble.left != np.arange(ensemble.n_nodes)] for ensemble in compiled.values()
+    ]))
+    remap = np.zeros(len(bundle['feature_columns']), dtype=np.int32)
+    remap[used] = np.arange(len(used), dtype=np.int32)
+
+    arrays = {
+        'scaler.mean': np.asarray(bundle['scaler'].mean_, dtype=np.float64)[used],
+        'scaler.scale': np.asarray(bundle['scaler'].scale_, dtype=np.float64)[used]
+    }
+    models = {}
+    for name, ensemble in compiled.items():
+        leaf_value = ensemble.leaf_value.astype(np.float32)
+        is_leaf = ensemble.left == np.arange(ensemble.n_nodes)
+        arrays.update({
+            f'{name}.feature': np.where(is_leaf, 0, remap[ensemble.feature]).astype(np.int32),
+            f'{name}.threshold': _round_down_float32(ensemble.threshold),
+            f'{name}.left': ensemble.left.astype(np.int32),
+            f'{name}.right': ensemble.right.astype(np.int32),
+            f'{name}.leaf_value': leaf_value,
+            f'{name}.roots': ensemble.roots.astype(np.int32),
+            f'{name}.tree_means': np.asarray(ensemble.tree_means, dtype=np.float64)
+        })
+        models[name] = {'kind': ensemble.kind, 'max_depth': int(ensemble.max_depth), 'init_raw': ensemble.init_raw}
+
+    profiles = {
+        name: {
+            'top_features': [(feature, float(importance)) for feature, importance in profile['top_features']],
+            'flags': profile['flags']
+        }
+        for name, profile in bundle['feature_profiles'].items()
+    }
+
+    header = {
+        'format': SERVING_ARTIFACT_FORMAT,
+        'version': bundle['version'],
+        'sklearn_version': bundle.get('sklearn_version'),
+        'feature_columns': [bundle['feature_columns'][i] for i in used],
+        'models': models,
+        'feature_profiles': profiles
+    }
+    return header, arrays
+
+def _align(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+def save_serving_artifact(bundle, path):
+    """
+    Write the serving artifact of a model bundle
+    Layout: magic, header length, JSON header, then each array at an aligned offset
+    """
+    header, arrays = quantize_bundle(bundle)
+
+    # Lay out the arrays; the header length does not depend on the offsets
+    # because they are relative to the end of the padded header
+    offset = 0
+    header['arrays'] = {}
+    for key, array in arrays.items():
+        header['arrays'][key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix_length = len(SERVING_ARTIFACT_MAGIC) + 8
+    data_start = _align(prefix_length + len(header_bytes))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # Write to a temporary file first so running workers never see a partial artifact
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SERVING_ARTIFACT_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for key, array in arrays.items():
+            f.seek(data_start + header['arrays'][key]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+    return path
+
+def is_serving_artifact(path):
+    """
+    Whether path is a serving artifact rather than a joblib model bundle
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SERVING_ARTIFACT_MAGIC)) == SERVING_ARTIFACT_MAGIC
+    except (IsADirectoryError, FileNotFoundError):
+        return False
+
+def load_serving_artifact(path):
+    """
+    Memory-map a serving artifact as a model bundle without sklearn models
+    Its arrays are read-only views of the shared file mapping
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    prefix_length = len(SERVING_ARTIFACT_MAGIC) + 8
+    if buffer[:len(SERVING_ARTIFACT_MAGIC)] != SERVING_ARTIFACT_MAGIC:
+        raise ValueError(f"Not a serving artifact: {path}")
+    (header_length,) = struct.unpack('<Q', buffer[len(SERVING_ARTIFACT_MAGIC):prefix_length])
+    header = json.loads(buffer[prefix_length:prefix_length + header_length])
+    if header.get('format') != SERVING_ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported serving artifact format in {path}")
+    data_start = _align(prefix_length + header_length)
+
+    def array(key):
+        spec = header['arrays'][key]
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        return np.frombuffer(buffer, dtype, count, data_start + spec['offset']).reshape(spec['shape'])
+
+    compiled = {}
+    for name, spec in header['models'].items():
+        fields = {key: array(f'{name}.{key}') for key in _ENSEMBLE_ARRAYS}
+        compiled[name] = CompiledEnsemble(
+            spec['kind'], fields['feature'], fields['threshold'], fields['left'], fields['right'],
+            fields['leaf_value'], fields['roots'], spec['max_depth'], spec['init_raw'], fields['tree_means']
+        )
+
+    return {
+        'format': header['format'],
+        'version': header['version'],
+        'sklearn_version': header['sklearn_version'],
+        'feature_columns': header['feature_columns'],
+        'scaler': ScalerParams(array('scaler.mean'), array('scaler.scale')),
+        'compiled': compiled,
+        'feature_profiles': header['feature_profiles'],
+        'serving_artifact': path
+    }
@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import math
+import time
+import bisect
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from cohorts import age_band, ENGINE_VERSION as HEURISTICS_ENGINE
+from heuristics import heuristic_risk_matrix, RISK_NAMES
+from submissions import DATA_DIR, iter_submission_paths, iter_submissions, chunked
+
+# Population percentiles of the risk scores
+# A KLL quantile sketch per risk summarizes the scores of the stored submissions,
+# for everyone and per age band, gender, and age band and gender. Sketches are
+# built offline (python sketches.py build) and merge exactly like the data they
+# summarize, so parallel build jobs each sketch a share of the files and their
+# sketches are combined. At startup each sketch is flattened into its sorted
+# distinct scores and cumulative weights, so the percentile of a score is one
+# binary search
+#
+# A sketch keeps at most about 3k scores whatever the number of submissions; at
+# k=200 its percentiles are within about 1 point of the exact ones
+
+SKETCHES_DIR = os.environ.get('SKETCHES_DIR', os.path.join(os.path.dirname(DATA_DIR), 'data-compacted'))
+SKETCHES_FORMAT = 1
+SKETCH_K = 200
+
+# Smallest cohort whose sketch is used for a cohort percentile
+SKETCH_MIN_COUNT = int(os.environ.get('SKETCH_MIN_COUNT', 200))
+
+# Sketches describe the scores of one engine; app.py serves the heuristics, model_api.py and asgi.py the models
+ENGINES = ['heuristics', 'model']
+
+def sketch_path(engine):
+    """
+    Default sketch file of an engine, beside the compacted store
+    """
+    return os.path.join(SKETCHES_DIR, f'_sketches-{engine}.json')
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch of a stream of numbers (Karnin, Lang and Liberty)
+    Level h holds items standing for 2**h values each; a full level is sorted and
+    every other item, from a random offset, moves up
+    """
+    def __init__(self, k=SKETCH_K, seed=None):
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _grow(self):
+        self.compactors.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self):
+        while self._size >= self._max_size:
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self._grow()
+                    items.sort()
+                    # An odd item stays at this level so no weight is lost
+                    kept = [items.pop()] if len(items) % 2 else []
+                    self.compactors[level + 1].extend(items[self._rng.getrandbits(1)::2])
+                    self.compactors[level] = kept
+                    break
+            self._size = sum(len(items) for items in self.compactors)
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self._size = sum(len(items) for items in self.compactors)
+        self._compress()
+        return self
+
+    def weighted_items(self):
+        return [(value, 1 << level) for level, items in enumerate(self.compactors) for value in items]
+
+    def state(self):
+        return {'k': self.k, 'count': self.count, 'compactors': self.compactors}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state['k'])
+        sketch.count = state['count']
+        sketch.compactors = [list(items) for items in state['compactors']]
+        sketch._max_size = sum(sketch._capacity(level) for level in range(len(sketch.compactors)))
+        sketch._size = sum(len(items) for items in sketch.compactors)
+        return sketch
+
+class QuantileTable:
+    """
+    Sorted distinct values of a sketch with their cumulative weights, for lookups
+    """
+    __slots__ = ('count', 'values', 'cumulative')
+
+    def __init__(self, sketch):
+        weights = {}
+        for value, weight in sketch.weighted_items():
+            weights[value] = weights.get(value, 0) + weight
+        self.count = sketch.count
+        self.values = sorted(weights)
+        self.cumulative = []
+        total = 0
+        for value in self.values:
+            total += weights[value]
+            self.cumulative.append(total)
+
+    def percentile(self, value):
+        """
+        Percentage of the population scoring below value, counting half of those scoring exactly value
+        """
+        if not self.values:
+            return None
+        i = bisect.bisect_left(self.values, value)
+        below = self.cumulative[i - 1] if i else 0
+        equal = self.cumulative[i] - below if i < len(self.values) and self.values[i] == value else 0
+        return round(100 * (below + equal / 2) / self.cumulative[-1], 1)
+
+    def quantile(self, q):
+        if not self.values:
+            return None
+        i = bisect.bisect_left(self.cumulative, q * self.cumulative[-1])
+        return self.values[min(i, len(self.values) - 1)]
+
+def user_cohorts(user_data):
+    """
+    Cohorts of a user, narrowest first
+    """
+    band = age_band(user_data.get('age'))
+    gender = user_data.get('gender') or None
+    cohorts = []
+    if band and gender:
+        cohorts.append(f'age_band={band},gender={gender}')
+    if band:
+        cohorts.append(f'age_band={band}')
+    if gender:
+        cohorts.append(f'gender={gender}')
+    return cohorts
+
+class PopulationSketches:
+    """
+    A sketch per risk for everyone and for each cohort, scored by one engine
+    """
+    def __init__(self, engine, k=SKETCH_K):
+        self.engine = engine
+        self.k = k
+        self.sketches = {}
+        self.built_at = None
+        self._tables = None
+
+    def _cohort(self, cohort):
+        sketches = self.sketches.get(cohort)
+        if sketches is None:
+            sketches = self.sketches[cohort] = {risk: KLLSketch(self.k) for risk in RISK_NAMES}
+        return sketches
+
+    def add(self, user_data, scores):
+        """
+        Add one user's risk scores, in RISK_NAMES order
+        """
+        for cohort in ['all'] + user_cohorts(user_data):
+            for sketch, score in zip(self._cohort(cohort).values(), scores):
+                sketch.update(score)
+
+    def merge(self, other):
+        if other.engine != self.engine:
+            raise ValueError(f"Cannot merge sketches of {other.engine} into sketches of {self.engine}")
+        for cohort, sketches in other.sketches.items():
+            own = self._cohort(cohort)
+            for risk, sketch in sketches.items():
+                own[risk].merge(sketch)
+        self._tables = None
+        return self
+
+    @property
+    def count(self):
+        sketches = self.sketches.get('all')
+        return sketches[RISK_NAMES[0]].count if sketches else 0
+
+    def state(self):
+        return {
+            'format': SKETCHES_FORMAT,
+            'engine': self.engine,
+            'k': self.k,
+            'built_at': self.built_at,
+            'sketches': {cohort: {risk: sketch.state() for risk, sketch in sketches.items()}
+                         for cohort, sketches in self.sketches.items()}
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get('format') != SKETCHES_FORMAT:
+            raise ValueError("Unsupported sketch file format")
+        population = cls(state['engine'], state['k'])
+        population.built_at = state.get('built_at')
+        population.sketches = {
+            cohort: {risk: KLLSketch.from_state(sketch) for risk, sketch in sketches.items()}
+            for cohort, sketches in state['sketches'].items()
+        }
+        return population
+
+    def tables(self):
+        if self._tables is None:
+            self._tables = {cohort: {risk: QuantileTable(sketch) for risk, sketch in sketches.items()}
+                            for cohort, sketches in self.sketches.items()}
+        return self._tables
+
+    def annotate(self, prediction, user_data):
+        """
+        Return a copy of one user's prediction with the percentile of each risk score
+        among everyone and, if large enough, among the narrowest cohort of the user
+        """
+        tables = self.tables()
+        overall = tables.get('all')
+        if overall is None:
+            return prediction
+        cohort = None
+        for name in user_cohorts(user_data):
+            if name in tables and tables[name][RISK_NAMES[0]].count >= SKETCH_MIN_COUNT:
+                cohort = name
+                break
+
+        result = {}
+        for risk, entry in prediction.items():
+            entry = dict(entry, percentile=overall[risk].percentile(entry['risk']))
+            if cohort is not None:
+                entry['cohort'] = cohort
+                entry['cohort_percentile'] = tables[cohort][risk].percentile(entry['risk'])
+            result[risk] = entry
+        return result
+
+    def summary(self):
+        tables = self.tables()
+        return {
+            'engine': self.engine,
+            'built_at': self.built_at,
+            'count': self.count,
+            'cohorts': {
+                cohort: {'count': by_risk[RISK_NAMES[0]].count,
+                         'quantiles': {risk: {f'p{int(q * 100)}': table.quantile(q) for q in (0.1, 0.25, 0.5, 0.75, 0.9)}
+                                       for risk, table in by_risk.items()}}
+                for cohort, by_risk in sorted(tables.items())
+            }
+        }
+
+def save_sketches(population, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(population.state(), f, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+    return path
+
+def load_sketches(path):
+    with open(path) as f:
+        return PopulationSketches.from_state(json.load(f))
+
+def load_population(engine, engine_version, path=None):
+    """
+    Load the sketches served next to an engine at startup
+    Returns None, and responses carry no percentiles, when the file is missing
+    or was built from another version of the engine
+    """
+    path = path or os.environ.get('SKETCHES_PATH') or sketch_path(engine)
+    if not os.path.exists(path):
+        return None
+    try:
+        population = load_sketches(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring population sketches at {path}: {e}", file=sys.stderr)
+        return None
+    if population.engine != engine_version:
+        print(f"Ignoring population sketches at {path}: built for {population.engine}, "
+              f"serving {engine_version}", file=sys.stderr)
+        return None
+    population.tables()
+    return population
+
+def engine_version(engine):
+    if engine == 'heuristics':
+        return HEURISTICS_ENGINE
+    from predict import get_model_bundle
+    return f"model-{get_model_bundle()['version']}"
+
+def _score_matrix(engine, submissions):
+    if engine == 'heuristics':
+        return heuristic_risk_matrix(submissions).tolist()
+    from predict import predict_health_risks_batch
+    predictions = predict_health_risks_batch(submissions, factor_ids=True)
+    return [[prediction[risk]['risk'] for risk in RISK_NAMES] for prediction in predictions]
+
+def sketch_paths(paths, engine, version, errors=None, k=SKETCH_K):
+    """
+    Score the submissions stored at paths and sketch their risk scores
+    """
+    population = PopulationSketches(version, k)
+    for chunk in chunked(iter_submissions(paths, errors), 1000):
+        for submission, scores in zip(chunk, _score_matrix(engine, chunk)):
+            population.add(submission, scores)
+    return population
+
+def _sketch_chunk(args):
+    paths, engine, version, k = args
+    errors = []
+    return sketch_paths(paths, engine, version, errors, k).state(), errors
+
+def build_sketches(data_dir=DATA_DIR, engine='heuristics', workers=None, k=SKETCH_K):
+    """
+    Sketch the scores of every stored submission, in parallel chunks that are merged
+    Returns the sketches and the (path, error) of skipped files
+    """
+    version = engine_version(engine)
+    paths = list(iter_submission_paths(data_dir))
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1000, -(-len(paths) // (workers * 4)))
+
+    errors = []
+    if workers == 1 or len(paths) <= chunk_size:
+        population = sketch_paths(paths, engine, version, errors, k)
+    else:
+        # Forked workers share the model bundle loaded by engine_version
+        population = PopulationSketches(version, k)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = [(chunk, engine, version, k) for chunk in chunked(paths, chunk_size)]
+            for state, chunk_errors in executor.map(_sketch_chunk, jobs):
+                population.merge(PopulationSketches.from_state(state))
+                errors.extend(chunk_errors)
+    population.built_at = datetime.now(timezone.utc).isoformat()
+    return population, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the population quantile sketches of the risk scores')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Sketch the scores of every stored submission')
+    build_parser.add_argument('--engine', choices=ENGINES, default='heuristics', help='Engine scoring the submissions')
+    build_parser.add_argument('--data-dir', default=DATA_DIR, help='Directory of submission JSON files')
+    build_parser.add_argument('--output', help='Sketch file (default: the engine\'s file in SKETCHES_DIR)')
+    build_parser.add_argument('--workers', type=int, help='Processes scoring chunks (default: one per CPU)')
+    build_parser.add_argument('--k', type=int, default=SKETCH_K, help='Sketch size parameter')
+
+    merge_parser = subparsers.add_parser('merge', help='Merge sketch files built from disjoint sets of submissions')
+    merge_parser.add_argument('output', help='Sketch file to write')
+    merge_parser.add_argument('inputs', nargs='+', help='Sketch files to merge')
+
+    show_parser = subparsers.add_parser('show', help='Print the quantiles of a sketch file')
+    show_parser.add_argument('path', help='Sketch file')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        population, errors = build_sketches(args.data_dir, args.engine, args.workers, args.k)
+        path = save_sketches(population, args.output or sketch_path(args.engine))
+        for error_path, error in errors:
+            print(f"Skipped {error_path}: {error}", file=sys.stderr)
+        print(f"Sketched {population.count} submissions into {path} in {time.perf_counter() - start:.2f}s",
+              file=sys.stderr)
+    elif args.command == 'merge':
+        try:
+            population = load_sketches(args.inputs[0])
+            for path in args.inputs[1:]:
+                population.merge(load_sketches(path))
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+        population.built_at = datetime.now(timezone.utc).isoformat()
+        save_sketches(population, args.output)
+        print(f"Merged {population.count} submissions into {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(load_sketches(args.path).summary(), indent=2))
+
+if __name__ == '__main__':
+    main()
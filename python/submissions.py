@@ -0,0 +1,220 @@
+import os
+import json
+import time
+from itertools import islice
+
+from heuristics import EXERCISE_MAP
+
+# Stored questionnaire submissions
+# The Next.js app writes one pretty-printed JSON file per submission into data/
+# (see lib/data-utils.ts), with numeric answers sent as strings
+
+# Directory the Next.js app writes submissions to
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Files modified more recently than this may still be being written, since the
+# frontend does not write submissions atomically
+SETTLE_SECONDS = 2
+
+# Sentinel answers of the multi-select questions that mean "nothing selected"
+NONE_ANSWERS = {'None of the above', 'None'}
+
+# Numeric questionnaire fields, stored as strings by the frontend
+NUMERIC_FIELDS = ['age', 'weight', 'height', 'heightFeet', 'heightInches', 'sleepHours', 'stressLevel']
+
+# Multi-select questionnaire fields
+LIST_FIELDS = ['exerciseTypes', 'familyHistory', 'existingConditions', 'allergies', 'medications']
+
+# Multi-select inputs from the questionnaire and the indicator columns they set
+LIST_FEATURES = {
+    'exerciseTypes': {
+        'Cardio': 'exercise_types_cardio',
+        'Strength Training': 'exercise_types_strength',
+        'Flexibility/Yoga': 'exercise_types_flexibility',
+        'Sports': 'exercise_types_sports',
+        'Walking': 'exercise_types_walking'
+    },
+    'familyHistory': {
+        'Heart Disease': 'family_heart_disease',
+        'Diabetes': 'family_diabetes',
+        'Cancer': 'family_cancer',
+        'High Blood Pressure': 'family_hypertension',
+        'Stroke': 'family_stroke',
+        'Mental Health Conditions': 'family_mental_health'
+    },
+    'existingConditions': {
+        'Diabetes': 'condition_diabetes',
+        'Hypertension': 'condition_hypertension',
+        'Heart Disease': 'condition_heart_disease',
+        'Asthma': 'condition_asthma',
+        'Arthritis': 'condition_arthritis',
+        'Thyroid Disorder': 'condition_thyroid',
+        'Anxiety Disorder': 'condition_anxiety',
+        'Depression': 'condition_depression'
+    }
+}
+
+# Questionnaire fields and the model feature they feed (see predict.generate_synthetic_data)
+MODEL_FIELDS = {
+    'age': 'age',
+    'gender': 'gender',
+    'weight': 'weight',
+    'height': 'height',
+    'sleepHours': 'sleep_hours',
+    'sleepQuality': 'sleep_quality',
+    'dietType': 'diet_type',
+    'waterIntake': 'water_intake',
+    'stressLevel': 'stress_level',
+    'smokingStatus': 'smoking_status',
+    'alcoholConsumption': 'alcohol_consumption',
+    'anxietyFrequency': 'anxiety_frequency',
+    'depressionFrequency': 'depression_frequency',
+    'socialConnections': 'social_connections',
+    'workLifeBalance': 'work_life_balance',
+    'mindfulnessPractice': 'mindfulness_practice',
+    'bloodPressure': 'blood_pressure',
+    'cholesterolLevels': 'cholesterol_levels'
+}
+
+def parse_number(value):
+    """
+    Parse a numeric answer, returning an int when it is integral and None when it is not a number
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = value
+    elif isinstance(value, str) and value.strip():
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    if number != number or number in (float('inf'), float('-inf')):
+        return None
+    return int(number) if float(number).is_integer() else number
+
+def derive_model_inputs(user_data):
+    """
+    Complete a coerced questionnaire input in place for predict_health_risks
+    Height and BMI are derived, "None of the above" answers are dropped and
+    questionnaire fields are mirrored onto the model feature names
+    Shared by normalize_submission and schema.Schema.validate, so stored and
+    posted submissions reach the models identically
+    """
+    # Derive height in cm from feet and inches when it is missing
+    if 'height' not in user_data and 'heightFeet' in user_data:
+        inches = user_data['heightFeet'] * 12 + user_data.get('heightInches', 0)
+        user_data['height'] = round(inches * 2.54, 1)
+
+    # Calculate BMI if not provided
+    if 'bmi' not in user_data and user_data.get('weight') and user_data.get('height'):
+        user_data['bmi'] = user_data['weight'] / ((user_data['height'] / 100) ** 2)
+
+    # Drop sentinel answers from multi-select questions
+    for field in LIST_FIELDS:
+        if field in user_data:
+            answers = user_data[field]
+            if not isinstance(answers, list):
+                answers = [answers] if answers else []
+            user_data[field] = [answer for answer in answers if answer not in NONE_ANSWERS]
+
+    # Mirror questionnaire answers onto the model feature names
+    for field, feature in MODEL_FIELDS.items():
+        if field in user_data and feature not in user_data:
+            user_data[feature] = user_data[field]
+
+    exercise_frequency = user_data.get('exerciseFrequency')
+    if 'exercise_frequency' not in user_data and exercise_frequency is not None:
+        if isinstance(exercise_frequency, str):
+            user_data['exercise_frequency'] = EXERCISE_MAP.get(exercise_frequency, 3)
+        else:
+            user_data['exercise_frequency'] = exercise_frequency
+
+    return user_data
+
+def normalize_submission(submission):
+    """
+    Convert a stored submission into the input expected by predict_health_risks
+    Numeric strings become numbers and the model inputs are derived
+    """
+    user_data = dict(submission)
+
+    # Coerce numeric answers, dropping the ones that are not numbers
+    for field in NUMERIC_FIELDS:
+        if field in user_data:
+            number = parse_number(user_data[field])
+            if number is None:
+                del user_data[field]
+            else:
+                user_data[field] = number
+
+    return derive_model_inputs(user_data)
+
+def iter_submission_paths(directory):
+    """
+    Yield the paths of the submission files in a directory without listing it all at once
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.is_file():
+                yield entry.path
+
+def scan_new_files(directory, watermark=None, settle_seconds=0):
+    """
+    Return (mtime_ns, id, path) of the submission files past a watermark, oldest first
+    Files modified in the last settle_seconds may still be being written and are left for the next run
+    """
+    after = (watermark or {}).get('mtime_ns', -1)
+    before = time.time_ns() - int(settle_seconds * 1e9)
+    seen_at_watermark = set((watermark or {}).get('ids', ()))
+    new = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            mtime_ns = entry.stat().st_mtime_ns
+            submission_id = entry.name[:-len('.json')]
+            if mtime_ns > before:
+                continue
+            if mtime_ns > after or (mtime_ns == after and submission_id not in seen_at_watermark):
+                new.append((mtime_ns, submission_id, entry.path))
+    new.sort()
+    return new
+
+def read_submission(path):
+    """
+    Read one stored submission
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        submission = json.load(f)
+    if not isinstance(submission, dict):
+        raise ValueError(f"Submission {path} is not a JSON object")
+    submission.setdefault('id', os.path.splitext(os.path.basename(path))[0])
+    return submission
+
+def iter_submissions(paths, errors=None):
+    """
+    Yield the normalized submissions read from paths
+    Unreadable files are skipped and recorded in errors as (path, message) when given
+    """
+    for path in paths:
+        try:
+            submission = read_submission(path)
+        except (OSError, ValueError) as e:
+            if errors is not None:
+                errors.append((path, str(e)))
+            continue
+        yield normalize_submission(submission)
+
+def chunked(iterable, size):
+    """
+    Yield lists of up to size items from an iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,43 @@
+import os
+import json
+import sys
+
+import pytest
+
+# The services import their modules from python/, as when run from that directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def bundle():
+    """
+    A small model bundle trained on synthetic data
+    """
+    from predict import train_models
+    return train_models(n_samples=1000, verbose=False)
+
+@pytest.fixture(scope='session')
+def users():
+    """
+    Submissions normalized the way the API passes them to the models
+    """
+    from benchmarks import model_inputs
+    return model_inputs(200)
+
+@pytest.fixture(scope='session')
+def submission_dir(tmp_path_factory):
+    """
+    A directory of stored submissions, with the string answers and feet/inches height of the frontend
+    """
+    from benchmarks import sample_users
+    directory = tmp_path_factory.mktemp('data')
+    for i, user_data in enumerate(sample_users(60)):
+        submission = {field: value for field, value in user_data.items() if field != 'height'}
+        for field in ('age', 'weight', 'sleepHours', 'stressLevel'):
+            submission[field] = str(submission[field])
+        inches = user_data['height'] / 2.54
+        submission['heightFeet'] = str(int(inches // 12))
+        submission['heightInches'] = str(int(inches % 12))
+        submission['timestamp'] = f'2025-10-10T09:{i // 60:02d}:{i % 60:02d}.000Z'
+        with open(directory / f'{i:08d}-0000-0000-0000-000000000000.json', 'w', encoding='utf-8') as f:
+            json.dump(submission, f, indent=2)
+    return str(directory)
@@ -0,0 +1,60 @@
+import json
+import asyncio
+import threading
+
+import asgi
+import predict
+from predict import predict_health_risks_batch
+from schema import QUESTIONNAIRE
+
+def _request(method, path, body=b'', messages=None):
+    messages = messages or [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(b'content-type', b'application/json')]}
+    asyncio.run(asgi.app(scope, receive, send))
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+def test_batch_route(bundle, users, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    status, body = _request('POST', '/api/predict/batch', json.dumps(users[:10]).encode('utf-8'))
+    assert status == 200
+    validated, _ = QUESTIONNAIRE.validate_many(users[:10])
+    assert body['predictions'] == predict_health_risks_batch(validated, bundle)
+    assert asgi._pending_batches == 0
+
+def test_batch_route_is_bounded(bundle, users, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    monkeypatch.setattr(asgi, 'ASGI_MAX_PENDING_BATCHES', 0)
+    status, body = _request('POST', '/api/predict/batch', json.dumps(users[:10]).encode('utf-8'))
+    assert status == 503
+    assert asgi._pending_batches == 0
+
+def test_startup_loads_off_the_event_loop(bundle, monkeypatch):
+    threads = []
+    monkeypatch.setattr(asgi, 'get_model_bundle', lambda: threads.append(threading.current_thread()) or bundle)
+    monkeypatch.setattr(asgi, 'get_population', lambda: threads.append(threading.current_thread()))
+    sent = []
+
+    async def receive():
+        return {'type': 'lifespan.startup'} if not sent else await asyncio.Future()
+
+    async def send(message):
+        sent.append(message)
+
+    async def startup():
+        task = asyncio.ensure_future(asgi.app({'type': 'lifespan'}, receive, send))
+        while not sent:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(startup())
+    assert sent == [{'type': 'lifespan.startup.complete'}]
+    assert len(threads) == 2 and threading.main_thread() not in threads
@@ -0,0 +1,28 @@
+import predict
+import model_api
+from schema import QUESTIONNAIRE
+from predict import predict_health_risks, predict_health_risks_batch
+
+def test_batch_equals_single(bundle, users):
+    batch = predict_health_risks_batch(users, bundle)
+    assert batch == [predict_health_risks(user_data, bundle) for user_data in users]
+
+def test_batch_equals_single_with_factor_ids(bundle, users):
+    batch = predict_health_risks_batch(users, bundle, factor_ids=True)
+    assert batch == [predict_health_risks(user_data, bundle, factor_ids=True) for user_data in users]
+
+def test_empty_batch(bundle):
+    assert predict_health_risks_batch([], bundle) == []
+
+def test_batch_route(bundle, users, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    client = model_api.app.test_client()
+
+    response = client.post('/api/predict/batch', json={'users': users[:20]})
+    assert response.status_code == 200
+    validated, _ = QUESTIONNAIRE.validate_many(users[:20])
+    assert response.get_json()['predictions'] == predict_health_risks_batch(validated, bundle)
+
+    response = client.post('/api/predict/batch', json=[{'age': 'old'}])
+    assert response.status_code == 400
+    assert '0' in response.get_json()['errors']
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from batching import MicroBatchScheduler, SchedulerBusy
+
+def _scheduler(predict_batch):
+    # The dispatcher is held on a first 'hold' item, so the items submitted
+    # meanwhile are collected into one batch once it is released
+    holding = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def hold_then_predict(items):
+        calls.append(list(items))
+        if items == ['hold']:
+            holding.set()
+            release.wait(5)
+            return items
+        return predict_batch(items)
+
+    scheduler = MicroBatchScheduler(hold_then_predict)
+    scheduler.submit('hold')
+    holding.wait(5)
+
+    def submit_together(items):
+        futures = [scheduler.submit(item) for item in items]
+        release.set()
+        return futures
+    return scheduler, submit_together, calls
+
+def test_results_are_returned_in_order():
+    _, submit_together, calls = _scheduler(lambda items: [item * 2 for item in items])
+    futures = submit_together(list(range(20)))
+    assert [future.result(timeout=5) for future in futures] == [item * 2 for item in range(20)]
+    assert calls[1] == list(range(20))
+
+def test_a_failing_item_only_fails_its_own_request():
+    def predict_batch(items):
+        if 'bad' in items:
+            raise ValueError('bad item')
+        return [item.upper() for item in items]
+
+    scheduler, submit_together, calls = _scheduler(predict_batch)
+    futures = submit_together(['a', 'bad', 'c'])
+    assert futures[0].result(timeout=5) == 'A'
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 'C'
+    assert calls[1:] == [['a', 'bad', 'c'], ['a'], ['bad'], ['c']]
+    assert scheduler.stats()['errors'] == 1
+
+def test_missing_results_fail_every_request():
+    scheduler, submit_together, calls = _scheduler(lambda items: items[:-1])
+    futures = submit_together([1, 2, 3])
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert calls[1] == [1, 2, 3]
+    assert scheduler.stats()['in_flight'] == 0
+
+def test_max_pending():
+    release = threading.Event()
+    scheduler = MicroBatchScheduler(lambda items: release.wait(5) and items, max_pending=2)
+    futures = [scheduler.submit(1), scheduler.submit(2)]
+    with pytest.raises(SchedulerBusy):
+        scheduler.submit(3)
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == [1, 2]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from predict import (CASCADE_TREES, RISK_BOUNDARIES, _cascade_models, _risk_bucket, _synthetic_features, cascade_report,
+                     predict_health_risks_batch)
+
+def _buckets(predictions):
+    # Risk bucket of every model's risk points, as the results page shows them
+    risks = np.array([[user_predictions[name]['risk'] for name in sorted(user_predictions)]
+                      for user_predictions in predictions])
+    return np.searchsorted(np.array(RISK_BOUNDARIES) * 100, risks, side='right')
+
+def test_cascade_keeps_risk_buckets(bundle):
+    X = _synthetic_features(bundle, 2000, seed=7)
+    for first_trees in (25, 75, 90):
+        for name, ensemble in _cascade_models(bundle).items():
+            full = ensemble.predict_positive(X)
+            probs, exited = ensemble.predict_positive_cascade(X, first_trees, None, RISK_BOUNDARIES)
+            assert (_risk_bucket(probs) == _risk_bucket(full)).all(), (name, first_trees)
+            # Users that did not exit are scored by every tree
+            assert (probs[~exited] == full[~exited]).all(), (name, first_trees)
+
+def test_exact_mode_matches_predict_positive(bundle):
+    X = _synthetic_features(bundle, 2000, seed=9)
+    for name, ensemble in _cascade_models(bundle).items():
+        full = ensemble.predict_positive(X)
+        # With every tree scored up front the range of each row is its exact probability
+        probs, _ = ensemble.predict_positive_cascade(X, ensemble.n_trees, None, RISK_BOUNDARIES)
+        assert np.array_equal(probs, full), name
+        probs, exited = ensemble.predict_positive_cascade(X, CASCADE_TREES, None, RISK_BOUNDARIES)
+        assert (_risk_bucket(probs) == _risk_bucket(full)).all(), name
+        assert np.array_equal(probs[~exited], full[~exited]), name
+
+def test_cascade_tolerance_only_changes_scores_near_a_boundary(bundle):
+    X = _synthetic_features(bundle, 2000, seed=7)
+    tolerance = 0.05
+    for name, ensemble in _cascade_models(bundle).items():
+        full = ensemble.predict_positive(X)
+        probs, exited = ensemble.predict_positive_cascade(X, 75, tolerance, RISK_BOUNDARIES)
+        changed = _risk_bucket(probs) != _risk_bucket(full)
+        distance = np.abs(full[:, np.newaxis] - np.array(RISK_BOUNDARIES)).min(axis=1)
+        assert (distance[changed] <= tolerance + 0.01).all(), name
+
+def test_cascade_report_at_the_defaults(bundle):
+    for name, report in cascade_report(bundle, n_samples=2000).items():
+        assert report['bucket_agreement'] == 1.0, name
+        # The defaults let most users exit
+        assert report['early_exit_rate'] > 0.5, (name, CASCADE_TREES)
+
+def test_cascade_leaves_the_inference_backend(bundle, users):
+    bundle = dict(bundle)
+    full = predict_health_risks_batch(users, bundle, cascade=False)
+    cascade = predict_health_risks_batch(users, bundle, cascade=True)
+    assert 'compiled' not in bundle
+    assert (_buckets(cascade) == _buckets(full)).all()
@@ -0,0 +1,82 @@
+import os
+import threading
+
+from cohorts import CohortStore
+
+def _data_dir(tmp_path, n=50):
+    # Submission files old enough to be settled
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for i in range(n):
+        path = data_dir / f'{i:04d}.json'
+        path.write_text('{"id": "%04d", "age": "%d", "gender": "female", "smokingStatus": "non-smoker"}' % (i, 20 + i))
+        os.utime(path, (1_000_000 + i, 1_000_000 + i))
+    return str(data_dir)
+
+def test_refresh_rebuilds_in_the_background(tmp_path):
+    store = CohortStore(str(tmp_path / '_cohorts.json'), _data_dir(tmp_path))
+    threads = []
+    recompute = store._recompute
+
+    def record_thread(*args):
+        threads.append(threading.current_thread())
+        return recompute(*args)
+
+    store._recompute = record_thread
+    store.refresh()
+    store._rebuild.join()
+
+    assert threads and threads[0] is not threading.current_thread()
+    assert store.summary()['overall']['count'] == 50
+
+def test_summary_is_none_until_built(tmp_path):
+    store = CohortStore(str(tmp_path / '_cohorts.json'), _data_dir(tmp_path))
+    assert store.summary() is None
+    store.update()
+    assert store.summary()['overall']['count'] == 50
+
+def test_refresh_folds_new_files_without_recomputing(tmp_path):
+    data_dir = _data_dir(tmp_path)
+    store = CohortStore(str(tmp_path / '_cohorts.json'), data_dir, refresh_seconds=0)
+    store.update()
+    path = os.path.join(data_dir, 'new.json')
+    with open(path, 'w') as f:
+        f.write('{"id": "new", "age": "70"}')
+    os.utime(path, (2_000_000, 2_000_000))
+
+    def fail(*args):
+        raise AssertionError('refresh recomputed the aggregates')
+
+    store._recompute = fail
+    store.refresh()
+    assert store.summary()['overall']['count'] == 51
+
+def test_endpoint_returns_503_while_building(monkeypatch, tmp_path):
+    import app
+
+    store = CohortStore(str(tmp_path / '_cohorts.json'), _data_dir(tmp_path))
+    started = threading.Event()
+    release = threading.Event()
+    recompute = store._recompute
+
+    def slow_recompute(*args):
+        started.set()
+        release.wait(10)
+        return recompute(*args)
+
+    store._recompute = slow_recompute
+    monkeypatch.setattr(app, 'cohort_store', store)
+    client = app.app.test_client()
+
+    response = client.get('/api/cohorts')
+    assert response.status_code == 503
+    assert started.wait(10)
+    release.set()
+    store._rebuild.join()
+    assert client.get('/api/cohorts').status_code == 200
+
+def test_update_does_not_wait_for_another_update(tmp_path):
+    store = CohortStore(str(tmp_path / '_cohorts.json'), _data_dir(tmp_path))
+    with store._locked():
+        assert store.update(blocking=False) is None
+    assert store.update(blocking=False) == 50
@@ -0,0 +1,49 @@
+import os
+import json
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from compaction import compact, read_compacted_frame
+
+def _write(directory, submission_id, submission):
+    with open(os.path.join(directory, f'{submission_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump(submission, f, indent=2)
+
+def test_round_trip(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    _write(data_dir, 'a', {'age': '50', 'weight': '118', 'heightFeet': '5', 'heightInches': '1', 'painLevel': '7',
+                           'sleepQuality': 'average', 'familyHistory': ['Cancer', 'None of the above'],
+                           'timestamp': '2025-10-10T09:14:04.208Z'})
+    _write(data_dir, 'b', {'age': 31, 'painLevel': '', 'timestamp': '2025-11-01T00:00:00.000Z'})
+
+    output_dir = str(tmp_path / 'compacted')
+    summary = compact(str(data_dir), output_dir, settle_seconds=0)
+    assert (summary['rows'], summary['errors']) == (2, [])
+
+    frame = read_compacted_frame(output_dir).set_index('id')
+    assert frame.loc['a', 'painLevel'] == 7.0
+    assert frame.loc['a', 'age'] == 50.0
+    assert frame.loc['a', 'height'] == 154.9
+    assert list(frame.loc['a', 'familyHistory']) == ['Cancer']
+    assert frame.loc['a', 'family_cancer'] == 1
+    assert pd.isna(frame.loc['b', 'painLevel'])
+    assert sorted(frame['month'].astype(str)) == ['2025-10', '2025-11']
+
+def test_incremental_runs(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    output_dir = str(tmp_path / 'compacted')
+    _write(data_dir, 'a', {'age': '40', 'timestamp': '2025-10-10T09:14:04.208Z'})
+    os.utime(data_dir / 'a.json', ns=(time.time_ns() - 10**10,) * 2)
+    assert compact(str(data_dir), output_dir, settle_seconds=0)['rows'] == 1
+    assert compact(str(data_dir), output_dir, settle_seconds=0)['rows'] == 0
+
+    _write(data_dir, 'b', {'age': '41', 'timestamp': '2025-10-11T09:14:04.208Z'})
+    os.utime(data_dir / 'b.json', ns=(time.time_ns() - 10**9,) * 2)
+    assert compact(str(data_dir), output_dir, settle_seconds=0)['rows'] == 1
+    assert sorted(read_compacted_frame(output_dir)['id']) == ['a', 'b']
@@ -0,0 +1,30 @@
+import model_api
+import predict
+from factors import CATALOGUE, FACTORS, factor_catalogue, factor_id, factor_records, materialize_prediction
+from heuristics import mock_predict_health_risks
+from predict import predict_health_risks
+
+def test_catalogue_ids_are_positions():
+    assert len({key for key, *_ in CATALOGUE}) == len(CATALOGUE)
+    assert [entry['id'] for entry in factor_catalogue()] == list(range(len(CATALOGUE)))
+    assert all(FACTORS[factor_id(key)].key == key for key, *_ in CATALOGUE)
+
+def test_templated_factor_is_filled_from_params():
+    [record] = factor_records([factor_id('sleep_duration.adjust')], {'sleep_hours': 5})
+    assert record['suggestion'] == 'Aim for 7-8 hours of sleep instead of your current 5 hours'
+
+def test_ids_materialize_to_the_full_response(bundle, users):
+    for user_data in users[:50]:
+        compact = predict_health_risks(user_data, bundle, factor_ids=True)
+        assert materialize_prediction(compact) == predict_health_risks(user_data, bundle)
+        compact = mock_predict_health_risks(user_data, factor_ids=True)
+        assert materialize_prediction(compact) == mock_predict_health_risks(user_data)
+
+def test_factor_routes(bundle, users, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    client = model_api.app.test_client()
+    assert client.get('/api/factors').get_json() == {'factors': factor_catalogue()}
+
+    compact = client.post('/api/predict?factors=ids', json=users[0]).get_json()
+    assert 'factor_ids' in compact['cardiovascular']
+    assert materialize_prediction(compact) == client.post('/api/predict', json=users[0]).get_json()
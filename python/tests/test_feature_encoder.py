@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks import sample_users
+from predict import FeatureEncoder
+from submissions import LIST_FEATURES, normalize_submission
+
+def _get_dummies_row(user_data, bundle):
+    # The per-request encoding FeatureEncoder replaced: indicator columns for the
+    # multi-select answers, get_dummies, then the training columns backfilled with 0
+    row = {key: value for key, value in user_data.items() if not isinstance(value, list)}
+    for field, items in LIST_FEATURES.items():
+        if field in user_data:
+            for item, column in items.items():
+                row[column] = 1 if item in user_data[field] else 0
+    user_df = pd.get_dummies(pd.DataFrame([row])) if row else pd.DataFrame(index=[0])
+    user_df = user_df.reindex(columns=bundle['feature_columns'], fill_value=0).astype(np.float64)
+    return bundle['scaler'].transform(user_df).astype(np.float32)[0]
+
+def test_encoder_matches_get_dummies(bundle):
+    users = [normalize_submission(user_data) for user_data in sample_users(100, seed=5)]
+    encoded = bundle['encoder'].transform(users)
+    expected = np.array([_get_dummies_row(user_data, bundle) for user_data in users])
+    assert encoded.dtype == np.float32
+    assert np.array_equal(encoded, expected)
+
+def test_missing_and_unknown_inputs(bundle):
+    users = [{}, {'gender': 'unknown', 'exerciseTypes': ['Juggling'], 'extra': 'ignored'}, {'age': '41'}]
+    expected = np.array([_get_dummies_row(user_data, bundle) for user_data in users[:2]]
+                        + [_get_dummies_row({'age': 41}, bundle)])
+    assert np.array_equal(bundle['encoder'].transform(users), expected)
+
+def test_reused_buffers_are_overwritten(bundle):
+    users = [normalize_submission(user_data) for user_data in sample_users(10, seed=6)]
+    encoder = FeatureEncoder(bundle['feature_columns'], bundle['scaler'])
+    first = encoder.transform(users, reuse_buffers=True).copy()
+    encoder.transform(users[::-1], reuse_buffers=True)
+    assert np.array_equal(encoder.transform(users, reuse_buffers=True), first)
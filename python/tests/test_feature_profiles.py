@@ -0,0 +1,20 @@
+from predict import RECOMMENDATION_FEATURE_RULES, TOP_FEATURES, _build_recommendations, build_feature_profiles
+
+def test_profiles_hold_the_top_features(bundle):
+    profiles = build_feature_profiles(bundle['models'], bundle['feature_columns'])
+    for name, model in bundle['models'].items():
+        importances = sorted(zip(bundle['feature_columns'], model.feature_importances_),
+                             key=lambda x: x[1], reverse=True)
+        assert profiles[name]['top_features'] == importances[:TOP_FEATURES]
+        for family, rule in RECOMMENDATION_FEATURE_RULES[name].items():
+            assert profiles[name]['flags'][family] == any(rule(f) for f, _ in importances[:TOP_FEATURES])
+
+def test_bundle_profiles_are_built_once(bundle):
+    assert bundle['feature_profiles'] == build_feature_profiles(bundle['models'], bundle['feature_columns'])
+
+def test_disabled_families_give_generic_recommendations():
+    for name, rules in RECOMMENDATION_FEATURE_RULES.items():
+        flags = {family: False for family in rules}
+        assert len(_build_recommendations(name, {}, flags)) == 1
+        flags = {family: True for family in rules}
+        assert 1 < len(_build_recommendations(name, {}, flags)) <= 5
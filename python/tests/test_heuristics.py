@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from benchmarks import sample_users
+from heuristics import (RISK_BOUNDS, RISK_NAMES, heuristic_risk_matrix, mock_predict_health_risks,
+                        mock_predict_health_risks_batch)
+
+def _partial_users(n, seed=11):
+    # Questionnaires with some answers left out, so the defaults are exercised too
+    rng = random.Random(seed)
+    return [{key: value for key, value in user_data.items() if rng.random() > 0.2}
+            for user_data in sample_users(n, seed)]
+
+@pytest.mark.parametrize('factor_ids', [False, True])
+def test_single_equals_batch(factor_ids):
+    users = sample_users(100) + _partial_users(100) + [{}]
+    batch = mock_predict_health_risks_batch(users, factor_ids=factor_ids)
+    assert batch == [mock_predict_health_risks(user_data, factor_ids=factor_ids) for user_data in users]
+
+def test_risk_matrix_matches_predictions():
+    users = sample_users(100) + _partial_users(100)
+    matrix = heuristic_risk_matrix(users).tolist()
+    predictions = mock_predict_health_risks_batch(users)
+    assert matrix == [[prediction[name]['risk'] for name in RISK_NAMES] for prediction in predictions]
+
+def test_risks_are_capped():
+    users = [
+        {'age': 120, 'bmi': 60, 'exerciseFrequency': 'sedentary', 'smokingStatus': 'regular',
+         'alcoholConsumption': 'heavy', 'bloodPressure': 'high-stage2', 'cholesterolLevels': 'high',
+         'familyHistory': ['Heart Disease', 'Diabetes'], 'existingConditions': ['Heart Disease', 'Diabetes'],
+         'stressLevel': 10, 'sleepQuality': 'poor', 'sleepHours': 2},
+        {'age': 0, 'bmi': 20, 'exerciseFrequency': 7, 'dietType': 'mediterranean', 'waterIntake': 'high',
+         'stressLevel': 1, 'sleepQuality': 'excellent', 'sleepHours': 7.5, 'mindfulnessPractice': 'daily',
+         'socialConnections': 'very-strong', 'workLifeBalance': 'excellent', 'anxietyFrequency': 'rarely',
+         'depressionFrequency': 'rarely', 'smokingStatus': 'non-smoker', 'alcoholConsumption': 'none'}
+    ]
+    for prediction in mock_predict_health_risks_batch(users):
+        for name in RISK_NAMES:
+            low, high = RISK_BOUNDS[name]
+            assert low <= prediction[name]['risk'] <= high
+    assert [prediction['cardiovascular']['risk'] for prediction in mock_predict_health_risks_batch(users)] == [90, 10]
+
+def test_sleep_hours_are_shown_as_answered():
+    prediction = mock_predict_health_risks({'sleepHours': 5})
+    assert prediction['sleep']['factors'][0]['suggestion'].endswith('your current 5 hours')
@@ -0,0 +1,40 @@
+import model_api
+import predict
+from metrics import CONTENT_TYPE, REQUESTS, Counter, Histogram, render
+
+def test_render_format():
+    registry = []
+    requests = Counter('requests', 'Requests', ['route'], registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', ['route'], buckets=(0.1, 1.0), registry=registry)
+    requests.inc('/a "b"')
+    latency.observe(0.05, '/a')
+    latency.observe(0.5, '/a')
+    latency.observe(5, '/a')
+
+    assert render(registry).splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a \\"b\\""} 1',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 5.55',
+        'latency_seconds_count{route="/a"} 3'
+    ]
+
+def test_metrics_route(bundle, users, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    client = model_api.app.test_client()
+    before = REQUESTS.value('/api/predict', '200')
+    assert client.post('/api/predict', json=users[0]).status_code == 200
+    assert REQUESTS.value('/api/predict', '200') == before + 1
+
+    response = client.get('/metrics')
+    assert response.headers['Content-Type'] == CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert f'health_requests_total{{route="/api/predict",status="200"}} {before + 1}' in text
+    for stage in ('decode', 'validate', 'serialize'):
+        assert f'health_prediction_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'health_request_seconds_bucket{route="/api/predict",le="+Inf"}' in text
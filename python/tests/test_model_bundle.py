@@ -0,0 +1,41 @@
+import joblib
+import pytest
+
+import predict
+from predict import MODEL_BUNDLE_FORMAT, load_model_bundle, predict_health_risks_batch, save_model_bundle
+
+def test_bundle_round_trip(bundle, users, tmp_path):
+    path = save_model_bundle(bundle, str(tmp_path / 'models' / 'health_models.joblib'))
+    loaded = load_model_bundle(path)
+
+    assert loaded['version'] == bundle['version']
+    assert loaded['feature_columns'] == bundle['feature_columns']
+    assert predict_health_risks_batch(users, loaded) == predict_health_risks_batch(users, bundle)
+
+def test_runtime_entries_are_rebuilt_on_load(bundle, tmp_path):
+    path = save_model_bundle(bundle, str(tmp_path / 'health_models.joblib'))
+    stored = joblib.load(path)
+    assert stored['format'] == MODEL_BUNDLE_FORMAT
+    assert not {'encoder', 'feature_profiles', 'compiled'} & set(stored)
+
+    loaded = load_model_bundle(path)
+    assert loaded['feature_profiles'] == bundle['feature_profiles']
+    assert loaded['encoder'].feature_columns == bundle['feature_columns']
+
+def test_unknown_format_is_rejected(tmp_path):
+    path = str(tmp_path / 'health_models.joblib')
+    joblib.dump({'format': MODEL_BUNDLE_FORMAT + 1}, path)
+    with pytest.raises(ValueError):
+        load_model_bundle(path)
+
+def test_served_bundle_is_loaded_not_trained(bundle, tmp_path, monkeypatch):
+    path = save_model_bundle(bundle, str(tmp_path / 'health_models.joblib'))
+    monkeypatch.setattr(predict, 'MODEL_BUNDLE_PATH', path)
+    monkeypatch.setattr(predict, '_model_bundle', None)
+
+    def train_models(*args, **kwargs):
+        raise AssertionError('trained at load time')
+
+    monkeypatch.setattr(predict, 'train_models', train_models)
+    assert predict.get_model_bundle()['version'] == bundle['version']
+    assert predict.get_model_bundle() is predict.get_model_bundle()
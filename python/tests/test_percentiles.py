@@ -0,0 +1,27 @@
+import model_api
+import predict
+from heuristics import RISK_NAMES
+from predict import predict_health_risks_batch
+from sketches import sketch_paths
+from submissions import iter_submission_paths, iter_submissions, read_submission
+
+def test_stored_submission_gets_its_own_percentile(bundle, submission_dir, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    version = f"model-{bundle['version']}"
+    paths = sorted(iter_submission_paths(submission_dir))
+    population = sketch_paths(paths, 'model', version)
+    monkeypatch.setattr(predict, '_population', (version, population))
+
+    # Stored scores, as the sketches were built from them
+    predictions = predict_health_risks_batch(list(iter_submissions(paths)), bundle)
+    scores = {risk: [prediction[risk]['risk'] for prediction in predictions] for risk in RISK_NAMES}
+
+    client = model_api.app.test_client()
+    for path, stored in list(zip(paths, predictions))[:10]:
+        response = client.post('/api/predict', json=read_submission(path)).get_json()
+        for risk in RISK_NAMES:
+            score = stored[risk]['risk']
+            assert response[risk]['risk'] == score
+            below = sum(other < score for other in scores[risk])
+            equal = sum(other == score for other in scores[risk])
+            assert response[risk]['percentile'] == round(100 * (below + equal / 2) / len(paths), 1)
@@ -0,0 +1,27 @@
+import pytest
+
+from profiling import RequestProfiler
+
+@pytest.mark.parametrize('token', ['wrong', 'tökén', 'токен', '\udcff', b'\xff'])
+def test_mismatched_tokens_are_not_profiled(token):
+    profiler = RequestProfiler(sample_rate=0, token='secret')
+    assert not profiler.should_profile(token)
+
+def test_non_ascii_token_matches():
+    profiler = RequestProfiler(sample_rate=0, token='sécret')
+    assert profiler.should_profile('sécret')
+    assert not profiler.should_profile('secret')
+
+def test_non_ascii_header_is_not_a_server_error(monkeypatch, tmp_path):
+    from flask import Flask
+    import profiling
+
+    # Views are only wrapped while profiling is enabled, so decorate one here
+    monkeypatch.setattr(profiling, 'profiler', RequestProfiler(sample_rate=0, token='secret', directory=str(tmp_path)))
+    app = Flask(__name__)
+    app.add_url_rule('/ping', 'ping', profiling.profiled('/ping')(lambda: 'pong'))
+
+    client = app.test_client()
+    assert client.get('/ping', headers={profiling.PROFILE_HEADER: 'tökén'}).status_code == 200
+    assert client.get('/ping', headers={profiling.PROFILE_HEADER: 'secret'}).status_code == 200
+    assert profiling.profiler.stats()['profiled'] == {'/ping': 1}
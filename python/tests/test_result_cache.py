@@ -0,0 +1,70 @@
+import result_cache
+from result_cache import ResultCache, cache_from_env, canonical_key
+
+def test_equivalent_submissions_share_a_key():
+    user_data = {'age': 40, 'weight': 70.5, 'exerciseTypes': ['Yoga', 'Cardio'], 'gender': 'female'}
+    resubmitted = {'gender': 'female', 'exerciseTypes': ['Cardio', 'Yoga', 'Yoga'], 'weight': '70.5',
+                   'age': '40', 'id': 'abc', 'timestamp': '2025-10-10T09:14:04.208Z'}
+    assert canonical_key(user_data) == canonical_key(resubmitted)
+    assert canonical_key(user_data) != canonical_key(dict(user_data, age=41))
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    cache = ResultCache(ttl=60)
+    cache.put('key', 'v1', {'risk': 10})
+
+    now[0] += 60
+    assert cache.get('key', 'v1') == {'risk': 10}
+    now[0] += 1
+    assert cache.get('key', 'v1') is None
+    assert cache.stats()['expirations'] == 1
+
+def test_new_version_drops_entries():
+    cache = ResultCache()
+    cache.put('key', 'v1', {'risk': 10})
+    assert cache.get('key', 'v2') is None
+    assert cache.get('key', 'v1') is None
+    assert cache.stats()['size'] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(maxsize=2)
+    cache.put('a', 'v1', 1)
+    cache.put('b', 'v1', 2)
+    cache.get('a', 'v1')
+    cache.put('c', 'v1', 3)
+    assert [cache.get(key, 'v1') for key in 'abc'] == [1, None, 3]
+    assert cache.stats()['evictions'] == 1
+
+def test_get_or_compute():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'risk': len(calls)}
+
+    cache = ResultCache()
+    assert cache.get_or_compute({'age': 40}, 'v1', compute) == {'risk': 1}
+    assert cache.get_or_compute({'age': '40'}, 'v1', compute) == {'risk': 1}
+    assert len(calls) == 1
+
+    disabled = ResultCache(maxsize=0)
+    disabled.get_or_compute({'age': 40}, 'v1', compute)
+    disabled.get_or_compute({'age': 40}, 'v1', compute)
+    assert len(calls) == 3
+    assert disabled.stats()['size'] == 0
+
+def test_disk_cache_is_shared(tmp_path):
+    path = str(tmp_path / 'cache' / 'results.sqlite')
+    ResultCache(disk_path=path).put('key', 'v1', {'risk': 10})
+
+    other = ResultCache(disk_path=path)
+    assert other.get('key', 'v1') == {'risk': 10}
+    assert other.get('key', 'v2') is None
+    assert other.stats()['disk_hits'] == 1
+
+def test_cache_from_env(monkeypatch):
+    monkeypatch.setenv('PREDICTION_CACHE_SIZE', '0')
+    monkeypatch.setenv('PREDICTION_CACHE_TTL', '5')
+    cache = cache_from_env()
+    assert (cache.maxsize, cache.ttl, cache.disk_path) == (0, 5.0, None)
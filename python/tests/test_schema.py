@@ -0,0 +1,53 @@
+import json
+
+import model_api
+import predict
+from predict import score_directory
+from schema import QUESTIONNAIRE
+from submissions import iter_submission_paths, normalize_submission, read_submission
+
+def test_answers_are_coerced_and_derived():
+    data, errors = QUESTIONNAIRE.validate({'age': '45', 'weight': '80.5', 'heightFeet': '5', 'heightInches': '10',
+                                           'sleepQuality': 'good', 'familyHistory': ['None of the above']})
+    assert errors is None
+    assert (data['age'], data['weight'], data['height']) == (45, 80.5, 177.8)
+    assert data['bmi'] == 80.5 / 1.778 ** 2
+    assert data['sleep_quality'] == 'good'
+    assert data['familyHistory'] == []
+
+def test_invalid_answers_are_reported():
+    data, errors = QUESTIONNAIRE.validate({'age': 'old', 'weight': 0, 'heightInches': 12, 'stressLevel': '11',
+                                           'gender': '', 'exerciseTypes': [1], 'sleepHours': True})
+    assert data is None
+    assert set(errors) == {'age', 'weight', 'heightInches', 'stressLevel', 'gender', 'exerciseTypes', 'sleepHours'}
+    assert errors['age'] == ["Age must be a positive number between 0 and 120"]
+
+def test_required_answers_are_only_checked_when_complete():
+    assert QUESTIONNAIRE.validate({'age': 40})[1] is None
+    _, errors = QUESTIONNAIRE.validate({'age': 40}, partial=False)
+    assert 'gender' in errors and 'age' not in errors
+
+def test_defaults():
+    data, _ = QUESTIONNAIRE.validate({}, defaults=True)
+    assert (data['age'], data['sleepQuality'], data['exerciseTypes']) == (30, 'average', [])
+
+def test_malformed_bodies():
+    assert QUESTIONNAIRE.decode(b'{"age": ', 'application/json')[1]['general'][0].startswith('Invalid request body')
+    assert QUESTIONNAIRE.decode(b'[]', 'application/json')[1] == {'general': ["Expected a JSON object"]}
+    _, errors = QUESTIONNAIRE.decode_many(b'[{"age": 40}, {"age": -1}]', 'application/json')
+    assert list(errors) == ['1']
+
+def test_posted_and_stored_submissions_score_the_same(bundle, submission_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(predict, '_model_bundle', bundle)
+    client = model_api.app.test_client()
+
+    output = str(tmp_path / 'scores.jsonl')
+    score_directory(submission_dir, output, bundle=bundle)
+    with open(output, encoding='utf-8') as f:
+        stored = {row['id']: row['predictions'] for row in map(json.loads, f)}
+
+    for path in sorted(iter_submission_paths(submission_dir))[:10]:
+        submission = read_submission(path)
+        assert QUESTIONNAIRE.validate(submission)[0] == normalize_submission(submission)
+        response = client.post('/api/predict', json=submission)
+        assert response.get_json() == stored[submission['id']]
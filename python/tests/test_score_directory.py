@@ -0,0 +1,57 @@
+import os
+import json
+import shutil
+
+import pandas as pd
+
+from predict import predict_health_risks_batch, score_directory
+from submissions import iter_submission_paths, iter_submissions
+
+def _read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_jsonl_output(bundle, submission_dir, tmp_path):
+    output = str(tmp_path / 'scores.jsonl')
+    scored, errors = score_directory(submission_dir, output, 'jsonl', chunk_size=16, bundle=bundle)
+    assert (scored, errors) == (60, [])
+
+    rows = _read_jsonl(output)
+    submissions = list(iter_submissions(iter_submission_paths(submission_dir)))
+    assert [row['id'] for row in rows] == [submission['id'] for submission in submissions]
+    assert [row['predictions'] for row in rows] == predict_health_risks_batch(submissions, bundle)
+
+def test_parquet_output(bundle, submission_dir, tmp_path):
+    jsonl = str(tmp_path / 'scores.jsonl')
+    parquet = str(tmp_path / 'scores.parquet')
+    score_directory(submission_dir, jsonl, 'jsonl', chunk_size=16, bundle=bundle)
+    scored, _ = score_directory(submission_dir, parquet, 'parquet', chunk_size=16, bundle=bundle)
+    assert scored == 60
+
+    table = pd.read_parquet(parquet)
+    rows = _read_jsonl(jsonl)
+    assert list(table['id']) == [row['id'] for row in rows]
+    assert list(table['cardiovascular_risk']) == [row['predictions']['cardiovascular']['risk'] for row in rows]
+    assert [json.loads(predictions) for predictions in table['predictions']] == [row['predictions'] for row in rows]
+
+def test_unreadable_files_are_skipped(bundle, submission_dir, tmp_path):
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    for path in sorted(iter_submission_paths(submission_dir))[:5]:
+        shutil.copy(path, directory)
+    (directory / 'truncated.json').write_text('{"age": "40", ', encoding='utf-8')
+    (directory / 'list.json').write_text('[]', encoding='utf-8')
+
+    output = str(tmp_path / 'scores.jsonl')
+    scored, errors = score_directory(str(directory), output, 'jsonl', bundle=bundle)
+    assert scored == 5
+    assert sorted(os.path.basename(path) for path, _ in errors) == ['list.json', 'truncated.json']
+    assert len(_read_jsonl(output)) == 5
+
+def test_parallel_scoring_matches_serial(bundle, submission_dir, tmp_path):
+    serial = str(tmp_path / 'serial.jsonl')
+    parallel = str(tmp_path / 'parallel.jsonl')
+    score_directory(submission_dir, serial, 'jsonl', chunk_size=8, bundle=bundle)
+    scored, errors = score_directory(submission_dir, parallel, 'jsonl', chunk_size=8, bundle=bundle, workers=2)
+    assert (scored, errors) == (60, [])
+    assert _read_jsonl(parallel) == _read_jsonl(serial)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+msgspec = pytest.importorskip('msgspec')
+
+from benchmarks import sample_users
+from heuristics import RISK_NAMES, heuristic_risk_matrix, mock_predict_health_risks
+from serialization import JSON_MIMETYPE, MSGPACK_MIMETYPE, decode_prediction, dumps, loads, negotiate
+from sketches import PopulationSketches
+
+@pytest.fixture(scope='module')
+def population():
+    users = sample_users(500)
+    population = PopulationSketches('heuristics')
+    for user_data, scores in zip(users, heuristic_risk_matrix(users).tolist()):
+        population.add(user_data, scores)
+    return population
+
+@pytest.mark.parametrize('mimetype', [JSON_MIMETYPE, MSGPACK_MIMETYPE])
+def test_percentiles_round_trip(population, mimetype):
+    user_data = sample_users(1, seed=3)[0]
+    prediction = population.annotate(mock_predict_health_risks(user_data), user_data)
+    assert 'cohort' in prediction[RISK_NAMES[0]]
+
+    decoded = decode_prediction(dumps(prediction, mimetype), mimetype)
+    for name in RISK_NAMES:
+        entry = getattr(decoded, name)
+        assert entry.percentile == prediction[name]['percentile']
+        assert entry.cohort == prediction[name]['cohort']
+        assert entry.cohort_percentile == prediction[name]['cohort_percentile']
+    assert msgspec.to_builtins(decoded) == prediction
+
+def test_unannotated_prediction_round_trip():
+    prediction = mock_predict_health_risks(sample_users(1)[0])
+    decoded = decode_prediction(dumps(prediction))
+    assert decoded.sleep.percentile is None and decoded.sleep.cohort is None
+    assert msgspec.to_builtins(decoded) == prediction
+
+def test_negotiate():
+    assert negotiate(None) == JSON_MIMETYPE
+    assert negotiate('text/html, application/json') == JSON_MIMETYPE
+    assert negotiate('application/x-msgpack;q=0.9, application/json') == MSGPACK_MIMETYPE
+
+@pytest.mark.parametrize('mimetype', [JSON_MIMETYPE, MSGPACK_MIMETYPE])
+def test_numpy_values_are_encoded(mimetype):
+    obj = {'risk': np.int64(42), 'scores': np.array([0.5, 0.25])}
+    assert loads(dumps(obj, mimetype), mimetype) == {'risk': 42, 'scores': [0.5, 0.25]}
+
+def test_msgpack_request_and_response():
+    import app
+    client = app.app.test_client()
+    user_data = sample_users(1)[0]
+    response = client.post('/api/predict', data=dumps(user_data, MSGPACK_MIMETYPE),
+                           content_type=MSGPACK_MIMETYPE, headers={'Accept': MSGPACK_MIMETYPE})
+    assert response.status_code == 200
+    assert response.mimetype == MSGPACK_MIMETYPE
+    assert loads(response.data, MSGPACK_MIMETYPE) == loads(client.post('/api/predict', json=user_data).data)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from predict import (_risk_bucket, _synthetic_features, load_model_bundle, predict_health_risks_batch,
+                     save_model_bundle, serving_artifact_report)
+from serving_artifact import SERVING_PROBABILITY_TOLERANCE, is_serving_artifact, save_serving_artifact
+
+@pytest.fixture(scope='module')
+def artifact_path(bundle, tmp_path_factory):
+    return save_serving_artifact(bundle, str(tmp_path_factory.mktemp('serving') / 'health_models.bin'))
+
+def test_saved_artifact_agrees_with_the_models(bundle, artifact_path):
+    assert is_serving_artifact(artifact_path)
+    serving = load_model_bundle(artifact_path)
+    assert serving['version'] == bundle['version']
+
+    X = _synthetic_features(bundle, 2000, seed=5)
+    X_serving = _synthetic_features(serving, 2000, seed=5)
+    for name, model in bundle['models'].items():
+        full = model.predict_proba(X)[:, 1]
+        quantized = serving['compiled'][name].predict_positive(X_serving)
+        assert np.abs(full - quantized).max() <= SERVING_PROBABILITY_TOLERANCE, name
+        assert (_risk_bucket(full) == _risk_bucket(quantized)).all(), name
+
+def test_artifact_serves_the_same_predictions(bundle, artifact_path, users):
+    serving = load_model_bundle(artifact_path)
+    assert predict_health_risks_batch(users, serving) == predict_health_risks_batch(users, bundle)
+
+def test_report(bundle, artifact_path, tmp_path):
+    bundle_path = save_model_bundle(bundle, str(tmp_path / 'health_models.joblib'))
+    report = serving_artifact_report(bundle_path, artifact_path, n_samples=1000, workers=0)
+    assert report['artifact_bytes'] < report['bundle_bytes']
+    for name, agreement in report['models'].items():
+        assert agreement['probability_agreement'] == 1.0, name
+        assert agreement['bucket_agreement'] == 1.0, name
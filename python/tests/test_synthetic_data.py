@@ -0,0 +1,33 @@
+import pandas as pd
+
+from predict import CATEGORICAL_DTYPES, MODEL_TARGETS, generate_synthetic_data, iter_synthetic_data, write_synthetic_data
+
+def test_chunks(tmp_path):
+    chunks = list(iter_synthetic_data(250, chunk_size=100, seed=3))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    for feature, dtype in CATEGORICAL_DTYPES.items():
+        assert chunks[0][feature].dtype == dtype
+
+def test_seed_is_reproducible():
+    first = pd.concat(iter_synthetic_data(200, chunk_size=64, seed=5), ignore_index=True)
+    second = pd.concat(iter_synthetic_data(200, chunk_size=64, seed=5), ignore_index=True)
+    other = pd.concat(iter_synthetic_data(200, chunk_size=64, seed=6), ignore_index=True)
+    pd.testing.assert_frame_equal(first, second)
+    assert not first.equals(other)
+
+def test_same_columns_as_generate_synthetic_data():
+    chunk = next(iter_synthetic_data(500, seed=5))
+    reference = generate_synthetic_data(500)
+    assert list(chunk.columns) == list(reference.columns)
+    assert list(pd.get_dummies(chunk).columns) == list(pd.get_dummies(reference).columns)
+    for target in MODEL_TARGETS.values():
+        assert set(chunk[target]) == {0, 1}
+
+def test_write_csv(tmp_path):
+    output = str(tmp_path / 'synthetic.csv')
+    assert write_synthetic_data(output, 250, chunk_size=100, seed=3) == 250
+    written = pd.read_csv(output)
+    expected = pd.concat(iter_synthetic_data(250, chunk_size=100, seed=3), ignore_index=True)
+    assert len(written) == 250
+    assert list(written.columns) == list(expected.columns)
+    assert (written['age'] == expected['age']).all()
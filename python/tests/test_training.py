@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from predict import MODEL_TARGETS, iter_synthetic_data, predict_health_risks_batch, train_models, update_models
+
+@pytest.fixture(scope='module')
+def data():
+    return pd.concat(iter_synthetic_data(600, seed=1), ignore_index=True)
+
+def test_concurrent_fit_matches_serial_fit(data, users):
+    serial = train_models(verbose=False, fit_jobs=1, data=data)
+    concurrent = train_models(verbose=False, fit_jobs=len(MODEL_TARGETS), data=data)
+
+    assert set(concurrent['fit_seconds']) == set(MODEL_TARGETS)
+    assert predict_health_risks_batch(users, concurrent) == predict_health_risks_batch(users, serial)
+
+def test_update_models_adds_trees(bundle, data):
+    trees = {name: len(model.estimators_) for name, model in bundle['models'].items()}
+    updated = update_models(bundle, data, extra_trees=5, verbose=False)
+
+    assert set(updated['fit_seconds']) == {'cardiovascular', 'sleep'}
+    for name, model in updated['models'].items():
+        if isinstance(model, RandomForestClassifier):
+            assert len(model.estimators_) == trees[name] + 5
+            assert model.estimators_[:trees[name]] == bundle['models'][name].estimators_
+        else:
+            assert model is bundle['models'][name]
+    # The bundle being served is left untouched
+    assert {name: len(model.estimators_) for name, model in bundle['models'].items()} == trees
+
+def test_update_models_needs_every_class(bundle, data):
+    target = MODEL_TARGETS['cardiovascular']
+    rows = data[data[target] == np.unique(data[target])[0]]
+    with pytest.raises(ValueError):
+        update_models(bundle, rows, verbose=False)
@@ -0,0 +1,15 @@
+import numpy as np
+
+from predict import COMPILED_MAX_ROWS, _synthetic_features, predict_health_risks_batch, set_inference_backend
+from tree_compile import compile_model
+
+def test_compiled_trees_match_predict_proba(bundle):
+    X = _synthetic_features(bundle, 5000, seed=11)
+    for name, model in bundle['models'].items():
+        expected = model.predict_proba(X)[:, 1]
+        assert np.array_equal(compile_model(model).predict_positive(X), expected), name
+
+def test_compiled_backend_matches_sklearn(bundle, users):
+    compiled = set_inference_backend(dict(bundle), 'compiled')
+    users = users[:COMPILED_MAX_ROWS]
+    assert predict_health_risks_batch(users, compiled) == predict_health_risks_batch(users, bundle)
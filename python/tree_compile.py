@@ -0,0 +1,220 @@
+import numpy as np
+from scipy.special import expit
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+
+# Flat-array inference engine for the fitted tree ensembles
+# All trees of a model are concatenated into one set of node arrays, and every
+# (row, tree) pair is walked down one level per vectorized step, so scoring a
+# batch costs max_depth numpy operations instead of sklearn's per-call overhead
+#
+# The arithmetic reproduces sklearn 1.3 exactly: features are float32 compared
+# to float64 thresholds, RandomForest sums the per-tree class 1 probabilities in
+# tree order before dividing by the number of trees, and GradientBoosting adds
+# learning_rate * leaf value to the init prediction stage by stage before expit
+
+class CompiledEnsemble:
+    """
+    A tree ensemble compiled into flat node arrays
+    Leaves point to themselves, so extra traversal steps leave them in place
+    """
+    def __init__(self, kind, feature, threshold, left, right, leaf_value, roots, max_depth, init_raw=0.0,
+                 tree_means=None):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.init_raw = init_raw
+        self.tree_means = tree_means
+
+        # Smallest and largest leaf of each tree, summed over the trees from k to
+        # the end, bound what the remaining trees can add to a partial sum
+        is_leaf = left == np.arange(len(left))
+        values = np.asarray(leaf_value, dtype=np.float64)
+        lowest = np.minimum.reduceat(np.where(is_leaf, values, np.inf), roots)
+        highest = np.maximum.reduceat(np.where(is_leaf, values, -np.inf), roots)
+        self.remaining_low = _suffix_sums(lowest)
+        self.remaining_high = _suffix_sums(highest)
+
+        # Expected contribution of the remaining trees, from the training samples
+        # reaching each leaf, or else the middle of the bounds
+        if tree_means is not None:
+            self.remaining_mean = _suffix_sums(np.asarray(tree_means, dtype=np.float64))
+        else:
+            self.remaining_mean = (self.remaining_low + self.remaining_high) / 2
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def apply(self, X, trees=None):
+        """
+        Return the leaf reached by each row in each tree, as an (n_rows, n_trees) matrix
+        trees optionally selects a subset of the trees
+        """
+        roots = self.roots if trees is None else self.roots[trees]
+        nodes = np.tile(roots.astype(np.intp, copy=False), (X.shape[0], 1))
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        feature, threshold, left, right = self.feature, self.threshold, self.left, self.right
+        for _ in range(self.max_depth):
+            # Indices stored as int32 (see serving_artifact.py) are widened once
+            # per step, which numpy would otherwise do inside every gather
+            go_left = X[rows, feature[nodes].astype(np.intp, copy=False)] <= threshold[nodes]
+            nodes = np.where(go_left, left[nodes], right[nodes]).astype(np.intp, copy=False)
+        return nodes
+
+    def leaf_values(self, X, trees=None):
+        """
+        Return the per-tree contributions of each row, as an (n_rows, n_trees) matrix
+        Contributions are summed in float64 even when the leaf values are stored as float32
+        """
+        return self.leaf_value[self.apply(X, trees)].astype(np.float64, copy=False)
+
+    def _raw(self, values):
+        # Boosting raw score: the init prediction plus the stages in order
+        raw = np.empty((values.shape[0], values.shape[1] + 1), dtype=np.float64)
+        raw[:, 0] = self.init_raw
+        raw[:, 1:] = values
+        return np.cumsum(raw, axis=1)[:, -1]
+
+    def combine(self, values):
+        """
+        Combine per-tree contributions in tree order into the class 1 probability
+        """
+        if self.kind == 'forest':
+            # cumsum adds strictly left to right, like sklearn's running total
+            return np.cumsum(values, axis=1)[:, -1] / values.shape[1]
+        return expit(self._raw(values))
+
+    def predict_positive(self, X):
+        """
+        Return the probability of class 1 for each row of a float32 matrix
+        Equal to model.predict_proba(X)[:, 1] of the source model
+        """
+        X = np.asarray(X, dtype=np.float32)
+        return self.combine(self.leaf_values(X))
+
+    def predict_positive_cascade(self, X, first_trees, tolerance, boundaries):
+        """
+        Score every row with the first trees and finish only the rows near a boundary
+        The leaf bounds of the remaining trees give the range the final probability
+        can still take; a row exits early when no boundary lies in that range, which
+        never changes its bucket. With a tolerance the range is narrowed by up to
+        tolerance at both ends, so a row can only change bucket when its exact
+        probability is within tolerance of a boundary. Exiting rows get their partial
+        sum plus the expected contribution of the remaining trees, kept within the
+        range; rows that do not exit get the exact probability
+        Returns the probabilities and a mask of the rows that exited early
+        """
+        X = np.asarray(X, dtype=np.float32)
+        boundaries = np.asarray(boundaries, dtype=np.float64)
+        k = min(first_trees, self.n_trees)
+        head = self.leaf_values(X, slice(0, k))
+
+        # Partial sum of the first trees, with the init prediction for boosting
+        if self.kind == 'forest':
+            partial = np.cumsum(head, axis=1)[:, -1]
+        else:
+            partial = self._raw(head)
+
+        # A small margin covers the rounding of the bounds themselves
+        margin = 1e-9
+        low = self._probability(partial + self.remaining_low[k]) - margin
+        high = self._probability(partial + self.remaining_high[k]) + margin
+        if tolerance:
+            # Narrow the range towards its middle, by at most tolerance at each end
+            middle = (low + high) / 2
+            low = np.minimum(low + tolerance, middle)
+            high = np.maximum(high - tolerance, middle)
+        crossed = (boundaries >= low[:, np.newaxis]) & (boundaries <= high[:, np.newaxis])
+        exited = ~crossed.any(axis=1)
+        # Keeping the estimate in the range puts it in the bucket of the whole range
+        probs = np.clip(self._probability(partial + self.remaining_mean[k]), low, high)
+
+        rest = np.flatnonzero(~exited)
+        if len(rest) and k < self.n_trees:
+            tail = self.leaf_values(X[rest], slice(k, None))
+            probs[rest] = self.combine(np.concatenate([head[rest], tail], axis=1))
+        return probs, exited
+
+    def _probability(self, total):
+        # Class 1 probability of a sum over all the trees
+        if self.kind == 'forest':
+            return total / self.n_trees
+        return expit(total)
+
+def _suffix_sums(values):
+    # Sums of values[k:] for every k, ending with 0 for k = len(values)
+    return np.append(np.cumsum(values[::-1])[::-1], 0.0)
+
+def _flatten_trees(trees, leaf_values):
+    # Concatenate the node arrays of the trees, offsetting child indices
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for tree, value in zip(trees, leaf_values):
+        n = tree.node_count
+        nodes = np.arange(n)
+        is_leaf = tree.children_left == -1
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        values.append(value)
+        roots.append(offset)
+        offset += n
+    return (
+        np.concatenate(features).astype(np.intp),
+        np.concatenate(thresholds).astype(np.float64),
+        np.concatenate(lefts).astype(np.intp),
+        np.concatenate(rights).astype(np.intp),
+        np.concatenate(values).astype(np.float64),
+        np.array(roots, dtype=np.intp)
+    )
+
+def compile_model(model):
+    """
+    Compile a fitted binary RandomForestClassifier or GradientBoostingClassifier
+    """
+    if isinstance(model, RandomForestClassifier):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        leaf_values = []
+        for tree in trees:
+            # Class 1 share of the leaf's (weighted) samples, as DecisionTreeClassifier.predict_proba
+            counts = tree.value[:, 0, :]
+            normalizer = counts.sum(axis=1)
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_values.append(counts[:, 1] / normalizer)
+        kind, init_raw = 'forest', 0.0
+    elif isinstance(model, GradientBoostingClassifier):
+        if model.estimators_.shape[1] != 1:
+            raise ValueError("Only binary GradientBoostingClassifier models can be compiled")
+        trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+        leaf_values = [model.learning_rate * tree.value[:, 0, 0] for tree in trees]
+        kind = 'boosting'
+        # The init prediction does not depend on the input
+        init_raw = float(model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0, 0])
+    else:
+        raise TypeError(f"Cannot compile {type(model).__name__}")
+
+    # Mean leaf value of each tree over its training samples, for the cascade's estimate
+    tree_means = np.array([
+        np.average(value, weights=np.where(tree.children_left == -1, tree.weighted_n_node_samples, 0.0))
+        for tree, value in zip(trees, leaf_values)
+    ])
+
+    feature, threshold, left, right, leaf_value, roots = _flatten_trees(trees, leaf_values)
+    max_depth = max(tree.max_depth for tree in trees)
+    return CompiledEnsemble(kind, feature, threshold, left, right, leaf_value, roots, max_depth, init_raw, tree_means)
+
+def compile_models(models):
+    """
+    Compile every model of a bundle
+    """
+    return {name: compile_model(model) for name, model in models.items()}